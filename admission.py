@@ -0,0 +1,157 @@
+# 生产服务的准入控制与限流(serve.py 使用):
+#   - AdmissionController: 限制同时进行的流水线数, 超出的请求在有界队列中等待; 队列已满、等待超时或服务正在退出时立即拒绝
+#   - RateLimiter: 按客户端的令牌桶限流, 避免单个用户占满服务
+# 拒绝时给出建议的重试等待秒数, 由调用方写入 Retry-After
+
+import asyncio
+import math
+import time
+from collections import OrderedDict, deque
+
+
+class Rejected(Exception):
+    """
+    请求未被接纳
+    Args:
+        status: HTTP状态码, 429(客户端限流) / 503(服务过载或正在退出)
+        retry_after: 建议的重试等待秒数
+    """
+    def __init__(self, status: int, reason: str, retry_after: int):
+        super().__init__(reason)
+        self.status = status
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    """
+    asyncio 准入控制: 至多 max_concurrency 条流水线同时运行, 至多 max_queue 个请求排队等待(先到先得)
+    Args:
+        queue_timeout: 排队等待上限(秒), 超时返回503而不是让连接一直挂起
+    """
+    # 平均处理耗时的指数滑动平均系数, 用于估算 Retry-After
+    _EWMA_ALPHA = 0.2
+
+    def __init__(self, max_concurrency: int, max_queue: int, queue_timeout: float):
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.active = 0
+        self.draining = False
+        self._waiters: "deque[asyncio.Future]" = deque()
+        self._idle = None
+        self._avg_service = 1.0
+        self.admitted = 0
+        self.rejected = 0
+        self.timed_out = 0
+
+    def retry_after(self) -> int:
+        # 按队列长度与平均处理耗时估算多久后有空位, 限制在[1, 60]秒
+        waves = (len(self._waiters) + 1) / max(1, self.max_concurrency)
+        return max(1, min(60, math.ceil(waves * self._avg_service)))
+
+    def _reject(self, reason: str) -> Rejected:
+        self.rejected += 1
+        return Rejected(503, reason, self.retry_after())
+
+    async def acquire(self):
+        # 获取一个运行名额, 未获准入时抛出 Rejected
+        if self.draining:
+            raise self._reject("服务正在退出")
+        if self.active < self.max_concurrency and not self._waiters:
+            self.active += 1
+            self.admitted += 1
+            return
+        if len(self._waiters) >= self.max_queue:
+            raise self._reject("服务繁忙, 排队已满")
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter), self.queue_timeout)
+        except asyncio.TimeoutError:
+            if not waiter.done():
+                self._waiters.remove(waiter)
+                self.timed_out += 1
+                raise self._reject("服务繁忙, 排队超时")
+        except asyncio.CancelledError:
+            # 客户端断开: 还在排队时移出队列, 已分到名额时归还
+            if waiter.done() and not waiter.cancelled() and waiter.result():
+                self.release(None)
+            elif waiter in self._waiters:
+                self._waiters.remove(waiter)
+            raise
+        if not waiter.result():
+            raise self._reject("服务正在退出")
+        self.admitted += 1
+
+    def release(self, service_time):
+        # 归还名额并直接交给队首的等待者; service_time 为本次处理耗时(秒), 为None时不计入平均值
+        if service_time is not None:
+            self._avg_service += self._EWMA_ALPHA * (service_time - self._avg_service)
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(True)
+                return
+        self.active -= 1
+        if self.active == 0 and self._idle is not None:
+            self._idle.set()
+
+    async def drain(self, timeout: float) -> bool:
+        """
+        进入退出状态: 拒绝新请求与仍在排队的请求, 等待进行中的流水线结束
+        Returns:
+            超时前全部结束时返回True
+        """
+        self.draining = True
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(False)
+        if self.active == 0:
+            return True
+        self._idle = asyncio.Event()
+        try:
+            await asyncio.wait_for(self._idle.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    def stats(self) -> dict:
+        return {"active": self.active, "queued": len(self._waiters), "draining": self.draining,
+                "admitted": self.admitted, "rejected": self.rejected, "timed_out": self.timed_out,
+                "avg_service_seconds": round(self._avg_service, 3)}
+
+
+class RateLimiter:
+    """
+    按客户端的令牌桶: 每个客户端以 rate 个/秒的速度补充令牌, 最多积累 burst 个
+    只保留最近活跃的 max_clients 个客户端的状态, 超出时淘汰最久未访问的(被淘汰的客户端视为满桶)
+    """
+    def __init__(self, rate: float, burst: int, max_clients: int = 10000):
+        self.rate = rate
+        self.burst = burst
+        self.max_clients = max_clients
+        self._buckets: "OrderedDict[str, list]" = OrderedDict()
+        self.limited = 0
+
+    def check(self, client: str) -> float:
+        # 消耗一个令牌; 返回0表示放行, 否则为需要等待的秒数
+        now = time.monotonic()
+        bucket = self._buckets.get(client)
+        if bucket is None:
+            bucket = self._buckets[client] = [float(self.burst), now]
+            if len(self._buckets) > self.max_clients:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(client)
+            bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+            bucket[1] = now
+        if bucket[0] >= 1:
+            bucket[0] -= 1
+            return 0.0
+        self.limited += 1
+        return (1 - bucket[0]) / self.rate
+
+    def stats(self) -> dict:
+        return {"clients": len(self._buckets), "limited": self.limited}
@@ -1,18 +1,53 @@
-import requests
+import hashlib
 import json
-from typing import Optional
+from typing import AsyncIterator, Iterator, List, Optional
 
-token = "jI3sZMsJLctmIl87PAEQNeRq6NE9ymyx7M-rVk_MOWWA-kNbPDx-o8nAG0UUsmC-"
+import config
+from cache import LRUCache, RetrievalCache
+from coalesce import SingleFlight, AsyncSingleFlight
+from transport import get_transport
+from async_transport import get_async_transport
+from llm_scheduler import ANSWER, HELPER, llm_slot, llm_slot_async
+from resilience import hedged, hedged_async
 
-def dialogue( 
-    user_input: str, 
-    custom_prompt: str = None, 
-    temperature: float = None, 
-    max_tokens: int = None
-) -> dict:
-    
-    url = "http://10.1.0.220:9002/api/dialogue"
+token = config.API_TOKEN
+
+# 确定性LLM调用(意图分类、安全检测、翻译等)的记忆化缓存, 生成类调用不经过此缓存
+dialogue_cache = LRUCache(maxsize=config.DIALOGUE_CACHE_SIZE, ttl=config.DIALOGUE_CACHE_TTL)
+
+# 知识库检索结果缓存(解析后的 [(text, score)]), 知识库重建时按库失效
+retrieval_cache = RetrievalCache(max_bytes=config.RETRIEVAL_CACHE_MAX_BYTES, ttl=config.RETRIEVAL_CACHE_TTL,
+                                 marker_dir=config.RETRIEVAL_CACHE_MARKER_DIR)
+
+# 相同的并发可缓存调用只发出一次上游请求
+dialogue_flight = SingleFlight()
+dialogue_flight_async = AsyncSingleFlight()
+
+def _dialogue_cache_key(user_input, custom_prompt, temperature, max_tokens):
+    prompt_hash = hashlib.sha256((custom_prompt or "").encode("utf-8")).hexdigest()
+    return (prompt_hash, user_input, temperature, max_tokens)
+
+# 流式响应结束标记
+_STREAM_END = object()
+
+def _is_stream_response(content_type: str) -> bool:
+    return "event-stream" in content_type or "ndjson" in content_type
 
+def _parse_stream_line(line: str):
+    # 解析流式响应的一行(SSE的 "data: {...}" 或 NDJSON), 返回增量文本; 非数据行返回None
+    line = line.strip()
+    if not line or line.startswith(":") or line.startswith("event:") or line.startswith("id:"):
+        return None
+    if line.startswith("data:"):
+        line = line[5:].strip()
+    if line == "[DONE]":
+        return _STREAM_END
+    chunk = json.loads(line)
+    if chunk.get("done"):
+        return _STREAM_END
+    return chunk.get("delta", chunk.get("response"))
+
+def _dialogue_payload(user_input, custom_prompt, temperature, max_tokens) -> dict:
     payload = {
         "token": token,
         "user_input": user_input
@@ -23,23 +58,9 @@ def dialogue(
         payload["temperature"] = temperature
     if max_tokens is not None:
         payload["max_tokens"] = max_tokens
+    return payload
 
-    response = requests.post(url, json=payload)
-    result = response.json()
-    return result
-
-def search_similar_files(
-    database_name: str,
-    token: str,
-    query: str,
-    top_k: int = None,
-    metric_type: str = None,
-    score_threshold: float = None,
-    expr: Optional[str] = None
-) -> dict:
-    
-    url = f"http://10.1.0.220:9002/api/databases/{database_name}/search"
-
+def _search_payload(token, query, top_k, metric_type, score_threshold, expr) -> dict:
     payload = {
         "token": token,
         "query": query,
@@ -52,8 +73,199 @@ def search_similar_files(
         payload["score_threshold"] = score_threshold
     if expr is not None:
         payload["expr"] = expr
-    
-    response = requests.post(url, json=payload)
-    result = response.json()
-    return result
+    return payload
+
+def dialogue(
+    user_input: str,
+    custom_prompt: str = None,
+    temperature: float = None,
+    max_tokens: int = None,
+    cacheable: bool = False,
+    priority: str = HELPER,
+    queue_timeout: float = None
+) -> dict:
+    """
+    Args:
+        cacheable: 是否允许使用记忆化缓存, 仅用于输入相同则输出应相同的分类/检测类调用
+        priority: 上游调用的调度优先级(llm_scheduler.GUARD/HELPER/ANSWER/REFINE), 命中缓存时不占用名额
+        queue_timeout: 调度排队超时(秒), 超时抛出 llm_scheduler.SchedulerTimeout; 为空时一直等待
+    """
+    use_cache = cacheable and config.DIALOGUE_CACHE_ENABLED
+    if use_cache:
+        key = _dialogue_cache_key(user_input, custom_prompt, temperature, max_tokens)
+        cached = dialogue_cache.get(key)
+        if cached is not None:
+            return dict(cached)
+
+    payload = _dialogue_payload(user_input, custom_prompt, temperature, max_tokens)
+    def post():
+        with llm_slot(priority, queue_timeout):
+            return get_transport().post("/api/dialogue", endpoint="dialogue", json=payload, retry=True).json()
+    if not use_cache:
+        return post()
+    # 可缓存的调用是幂等的, 慢响应时发出对冲请求
+    fetch = lambda: hedged("dialogue", post)
+    result = dialogue_flight.do(key, fetch) if config.SINGLE_FLIGHT_ENABLED else fetch()
+    # 只缓存成功的响应
+    if "response" in result:
+        dialogue_cache.set(key, dict(result))
+    return dict(result)
 
+def dialogue_stream(
+    user_input: str,
+    custom_prompt: str = None,
+    temperature: float = None,
+    max_tokens: int = None,
+    priority: str = ANSWER
+) -> Iterator[str]:
+    """
+    流式对话, 逐块产出生成的文本; 整个流期间占用一个调度名额
+    上游以SSE或NDJSON返回增量; 上游不支持流式而返回普通JSON时, 一次性产出完整回复
+    """
+    payload = _dialogue_payload(user_input, custom_prompt, temperature, max_tokens)
+    payload["stream"] = True
+    with llm_slot(priority):
+        response = get_transport().post("/api/dialogue", endpoint="dialogue", json=payload, stream=True,
+                                        retry=True)
+        with response:
+            if not _is_stream_response(response.headers.get("Content-Type", "")):
+                yield response.json()["response"]
+                return
+            for raw in response.iter_lines():
+                delta = _parse_stream_line(raw.decode("utf-8"))
+                if delta is _STREAM_END:
+                    break
+                if delta:
+                    yield delta
+
+def search_similar_files(
+    database_name: str,
+    token: str,
+    query: str,
+    top_k: int = None,
+    metric_type: str = None,
+    score_threshold: float = None,
+    expr: Optional[str] = None,
+    timeout: Optional[float] = None
+) -> dict:
+
+    payload = _search_payload(token, query, top_k, metric_type, score_threshold, expr)
+    post = lambda: get_transport().post(f"/api/databases/{database_name}/search", endpoint="search",
+                                        json=payload, timeout=timeout, retry=True).json()
+    return hedged("search", post)
+
+def search_similar_files_batch(
+    database_name: str,
+    token: str,
+    queries: List[str],
+    top_k: int = None,
+    metric_type: str = None,
+    score_threshold: float = None,
+    expr: Optional[str] = None,
+    timeout: Optional[float] = None
+) -> List[dict]:
+    """
+    批量检索(需上游支持, 接口路径见 config.SEARCH_BATCH_PATH)
+    Returns:
+        与queries一一对应的检索结果, 每项格式同 search_similar_files
+    """
+    payload = _search_payload(token, None, top_k, metric_type, score_threshold, expr)
+    del payload["query"]
+    payload["queries"] = list(queries)
+    response = get_transport().post(config.SEARCH_BATCH_PATH.format(database=database_name), endpoint="search",
+                                    json=payload, timeout=timeout, retry=True)
+    return response.json()["results"]
+
+async def dialogue_async(
+    user_input: str,
+    custom_prompt: str = None,
+    temperature: float = None,
+    max_tokens: int = None,
+    cacheable: bool = False,
+    priority: str = HELPER,
+    queue_timeout: float = None
+) -> dict:
+    # dialogue 的异步版本, 与同步版本共用缓存与调度名额
+    use_cache = cacheable and config.DIALOGUE_CACHE_ENABLED
+    if use_cache:
+        key = _dialogue_cache_key(user_input, custom_prompt, temperature, max_tokens)
+        cached = dialogue_cache.get(key)
+        if cached is not None:
+            return dict(cached)
+
+    payload = _dialogue_payload(user_input, custom_prompt, temperature, max_tokens)
+    async def post():
+        async with llm_slot_async(priority, queue_timeout):
+            return await get_async_transport().request_json("POST", "/api/dialogue", endpoint="dialogue",
+                                                            json=payload, retry=True)
+    if not use_cache:
+        return await post()
+    fetch = lambda: hedged_async("dialogue", post)
+    result = await dialogue_flight_async.do(key, fetch) if config.SINGLE_FLIGHT_ENABLED else await fetch()
+    if "response" in result:
+        dialogue_cache.set(key, dict(result))
+    return dict(result)
+
+async def dialogue_stream_async(
+    user_input: str,
+    custom_prompt: str = None,
+    temperature: float = None,
+    max_tokens: int = None,
+    priority: str = ANSWER
+) -> AsyncIterator[str]:
+    # dialogue_stream 的异步版本
+    payload = _dialogue_payload(user_input, custom_prompt, temperature, max_tokens)
+    payload["stream"] = True
+    async with llm_slot_async(priority):
+        response = await get_async_transport().open_stream("POST", "/api/dialogue", endpoint="dialogue",
+                                                           json=payload, retry=True)
+        try:
+            if not _is_stream_response(response.headers.get("Content-Type", "")):
+                yield (await response.json(content_type=None))["response"]
+                return
+            async for raw in response.content:
+                delta = _parse_stream_line(raw.decode("utf-8"))
+                if delta is _STREAM_END:
+                    break
+                if delta:
+                    yield delta
+        finally:
+            response.release()
+
+async def search_similar_files_async(
+    database_name: str,
+    token: str,
+    query: str,
+    top_k: int = None,
+    metric_type: str = None,
+    score_threshold: float = None,
+    expr: Optional[str] = None,
+    timeout: Optional[float] = None
+) -> dict:
+    # search_similar_files 的异步版本
+    payload = _search_payload(token, query, top_k, metric_type, score_threshold, expr)
+    post = lambda: get_async_transport().request_json(
+        "POST", f"/api/databases/{database_name}/search", endpoint="search", json=payload, timeout=timeout,
+        retry=True
+    )
+    return await hedged_async("search", post)
+
+async def search_similar_files_batch_async(
+    database_name: str,
+    token: str,
+    queries: List[str],
+    top_k: int = None,
+    metric_type: str = None,
+    score_threshold: float = None,
+    expr: Optional[str] = None,
+    timeout: Optional[float] = None
+) -> List[dict]:
+    # search_similar_files_batch 的异步版本
+    payload = _search_payload(token, None, top_k, metric_type, score_threshold, expr)
+    del payload["query"]
+    payload["queries"] = list(queries)
+    result = await get_async_transport().request_json(
+        "POST", config.SEARCH_BATCH_PATH.format(database=database_name), endpoint="search",
+        json=payload, timeout=timeout, retry=True
+    )
+    return result["results"]
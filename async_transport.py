@@ -0,0 +1,176 @@
+# 上游HTTP异步传输层：与 transport.Transport 相同的超时/重试/端点并发/熔断策略, 基于 aiohttp
+# 每个事件循环持有一个实例, 供异步请求流水线使用
+
+import asyncio
+import random
+import weakref
+from typing import Dict, Optional
+
+import aiohttp
+
+import config
+from resilience import get_breaker
+from transport import IDEMPOTENT_METHODS, RETRY_STATUS
+
+
+class UpstreamHTTPError(Exception):
+    # 上游返回可重试的5xx响应(重试耗尽后抛出)
+    def __init__(self, status: int):
+        super().__init__(f"HTTP {status}")
+        self.status = status
+
+
+class AsyncTransport:
+    # 基于 aiohttp.ClientSession 的共享异步传输层
+    def __init__(
+        self,
+        base_url: Optional[str] = None,
+        connect_timeout: Optional[float] = None,
+        read_timeout: Optional[float] = None,
+        max_retries: Optional[int] = None,
+        backoff_base: Optional[float] = None,
+        backoff_max: Optional[float] = None,
+        pool_maxsize: Optional[int] = None,
+        endpoint_limits: Optional[Dict[str, int]] = None,
+    ):
+        self.base_url = (base_url or config.API_BASE_URL).rstrip("/")
+        self.connect_timeout = config.HTTP_CONNECT_TIMEOUT if connect_timeout is None else connect_timeout
+        self.read_timeout = config.HTTP_READ_TIMEOUT if read_timeout is None else read_timeout
+        self.max_retries = config.HTTP_MAX_RETRIES if max_retries is None else max_retries
+        self.backoff_base = config.HTTP_BACKOFF_BASE if backoff_base is None else backoff_base
+        self.backoff_max = config.HTTP_BACKOFF_MAX if backoff_max is None else backoff_max
+        self.pool_maxsize = pool_maxsize or config.HTTP_POOL_MAXSIZE
+        limits = dict(config.HTTP_ENDPOINT_LIMITS if endpoint_limits is None else endpoint_limits)
+        self._limits = {name: asyncio.Semaphore(n) for name, n in limits.items()}
+        self._session: Optional[aiohttp.ClientSession] = None
+
+    @property
+    def session(self) -> aiohttp.ClientSession:
+        # 会话需在事件循环内创建
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(limit=self.pool_maxsize, keepalive_timeout=60)
+            self._session = aiohttp.ClientSession(connector=connector)
+        return self._session
+
+    def url(self, path: str) -> str:
+        return f"{self.base_url}/{path.lstrip('/')}"
+
+    def _backoff(self, attempt: int) -> float:
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    async def request_json(
+        self,
+        method: str,
+        path: str,
+        endpoint: str = "default",
+        timeout: Optional[float] = None,
+        retry: Optional[bool] = None,
+        **kwargs
+    ) -> dict:
+        """
+        发送请求并解析JSON, 幂等请求对5xx响应与连接错误进行有限次重试
+        Args:
+            method: HTTP方法
+            path: 相对base_url的路径
+            endpoint: 端点类别, 用于并发限制(dialogue/search/databases)
+            timeout: 可选的读超时(秒), 默认使用配置值
+            retry: 是否重试, 同 transport.Transport.request
+        Returns:
+            响应JSON; 重试耗尽仍失败时抛出异常
+        """
+        return await self._with_retries(self._send, method, path, endpoint, timeout, retry, **kwargs)
+
+    async def open_stream(
+        self,
+        method: str,
+        path: str,
+        endpoint: str = "default",
+        timeout: Optional[float] = None,
+        retry: Optional[bool] = None,
+        **kwargs
+    ) -> aiohttp.ClientResponse:
+        """
+        发起流式请求, 可重试时只在收到响应头之前重试
+        Args:
+            timeout: 可选的读超时(秒), 流式读取时即相邻两块数据的最大间隔
+            retry: 是否重试, 同 request_json
+        Returns:
+            未读取响应体的响应对象, 调用方读取完毕后需 release()
+        """
+        return await self._with_retries(self._open, method, path, endpoint, timeout, retry, **kwargs)
+
+    async def _with_retries(self, send, method: str, path: str, endpoint: str, timeout: Optional[float],
+                            retry: Optional[bool], **kwargs):
+        url = self.url(path)
+        timeouts = aiohttp.ClientTimeout(
+            connect=self.connect_timeout,
+            sock_read=self.read_timeout if timeout is None else timeout,
+        )
+        limit = self._limits.get(endpoint)
+        breaker = get_breaker(endpoint)
+        max_retries = self.max_retries if (method.upper() in IDEMPOTENT_METHODS if retry is None else retry) else 0
+        attempt = 0
+        while True:
+            if breaker is not None:
+                breaker.check()
+            start = asyncio.get_running_loop().time()
+            try:
+                if limit is not None:
+                    async with limit:
+                        result = await send(method, url, timeouts, **kwargs)
+                else:
+                    result = await send(method, url, timeouts, **kwargs)
+            except (aiohttp.ClientError, asyncio.TimeoutError, UpstreamHTTPError) as e:
+                if breaker is not None:
+                    breaker.record(False, asyncio.get_running_loop().time() - start)
+                retryable = isinstance(e, (aiohttp.ClientConnectionError, UpstreamHTTPError))
+                if not retryable or attempt >= max_retries:
+                    raise
+            except BaseException:
+                # 被取消(对冲落败、推测放弃、客户端断开)时不计入统计, 但须释放半开状态的探测名额
+                if breaker is not None:
+                    breaker.abandon()
+                raise
+            else:
+                if breaker is not None:
+                    breaker.record(True, asyncio.get_running_loop().time() - start)
+                return result
+            await asyncio.sleep(self._backoff(attempt))
+            attempt += 1
+
+    async def _send(self, method: str, url: str, timeouts: aiohttp.ClientTimeout, **kwargs) -> dict:
+        async with self.session.request(method, url, timeout=timeouts, **kwargs) as response:
+            if response.status in RETRY_STATUS:
+                raise UpstreamHTTPError(response.status)
+            return await response.json(content_type=None)
+
+    async def _open(self, method: str, url: str, timeouts: aiohttp.ClientTimeout, **kwargs) -> aiohttp.ClientResponse:
+        response = await self.session.request(method, url, timeout=timeouts, **kwargs)
+        if response.status in RETRY_STATUS:
+            response.release()
+            raise UpstreamHTTPError(response.status)
+        return response
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+
+
+_transports: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, AsyncTransport]" = weakref.WeakKeyDictionary()
+
+
+def get_async_transport() -> AsyncTransport:
+    # 按当前事件循环复用异步传输层实例
+    loop = asyncio.get_running_loop()
+    transport = _transports.get(loop)
+    if transport is None:
+        transport = AsyncTransport()
+        _transports[loop] = transport
+    return transport
+
+
+async def close_async_transport():
+    # 关闭当前事件循环上的传输层(服务退出时调用)
+    transport = _transports.pop(asyncio.get_running_loop(), None)
+    if transport is not None:
+        await transport.close()
@@ -1,5 +1,29 @@
 import re
-from typing import Tuple, List, Dict, Optional
+import threading
+from typing import Tuple, List, Dict, Iterable, Optional
+
+from matcher import AhoCorasick
+
+# 参与计分的关键词表, 编译为同一个自动机, 单遍扫描即可标记各表的命中项
+_KEYWORD_LISTS = ("ATTACK_VERBS", "ATTACK_NOUNS", "EVASION_PATTERNS", "PAYLOAD_PATTERNS", "DEFENSE_KEYWORDS")
+
+
+class _CompiledPatterns:
+    # 由关键词表编译得到的只读匹配引擎, 可被多线程共享
+    def __init__(self, detector):
+        # 全局编号按表、按表内顺序递增, 排序后的命中编号即按表分组且保持声明顺序
+        self.entries = [(name, keyword) for name in _KEYWORD_LISTS for keyword in getattr(detector, name)]
+        self.automaton = AhoCorasick((keyword, i) for i, (_, keyword) in enumerate(self.entries))
+        self.code_requests = [(pattern, re.compile(pattern)) for pattern in detector.CODE_REQUEST_PATTERNS]
+
+    def scan(self, text_lower: str) -> Dict[str, List[str]]:
+        # 单遍扫描, 返回各关键词表中出现过的关键词(保持表内声明顺序)
+        found = {name: [] for name in _KEYWORD_LISTS}
+        for i in sorted({i for _, _, i in self.automaton.iter_matches(text_lower)}):
+            name, keyword = self.entries[i]
+            found[name].append(keyword)
+        return found
+
 
 class AttackPatternDetector:
     # 检测用户输入中的隐蔽攻击模式
@@ -51,6 +75,22 @@ class AttackPatternDetector:
         "最佳实践", "安全编码", "安全配置"
     ]
 
+    _compiled: Optional[_CompiledPatterns] = None
+    _compile_lock = threading.Lock()
+
+    @classmethod
+    def _engine(cls) -> _CompiledPatterns:
+        # 按类懒编译一次; 子类覆盖关键词表时各自编译
+        engine = cls.__dict__.get("_compiled")
+        if engine is None:
+            with cls._compile_lock:
+                engine = cls.__dict__.get("_compiled")
+                if engine is None:
+                    engine = _CompiledPatterns(cls)
+                    cls._compiled = engine
+        return engine
+
+    @classmethod
     def detect_attack_intent(cls, text: str) -> Dict[str, any]:
         """
         检测文本中的攻击意图
@@ -64,12 +104,13 @@ class AttackPatternDetector:
                 "explanation": str
             }
         """
+        engine = cls._engine()
         text_lower = text.lower()
+        found = engine.scan(text_lower)
         patterns_found = []
         score = 0.0
         # 1. 检查是否是防御性问题
-        defense_count = sum(1 for kw in cls.DEFENSE_KEYWORDS if kw in text_lower)
-        if defense_count >= 2:
+        if len(found["DEFENSE_KEYWORDS"]) >= 2:
             return {
                 "is_attack": False,
                 "confidence": 0.1,
@@ -77,26 +118,22 @@ class AttackPatternDetector:
                 "explanation": "检测到防御性意图关键词"
             }
         # 2. 检查攻击动词 + 攻击名词组合
-        for verb in cls.ATTACK_VERBS:
-            if verb in text_lower:
-                for noun in cls.ATTACK_NOUNS:
-                    if noun in text_lower:
-                        patterns_found.append(f"攻击模式: {verb} + {noun}")
-                        score += 0.4
+        for verb in found["ATTACK_VERBS"]:
+            for noun in found["ATTACK_NOUNS"]:
+                patterns_found.append(f"攻击模式: {verb} + {noun}")
+                score += 0.4
         # 3. 检查规避检测模式
-        for pattern in cls.EVASION_PATTERNS:
-            if pattern in text_lower:
-                patterns_found.append(f"规避模式: {pattern}")
-                score += 0.3
+        for pattern in found["EVASION_PATTERNS"]:
+            patterns_found.append(f"规避模式: {pattern}")
+            score += 0.3
         # 4. 检查Payload相关
-        for pattern in cls.PAYLOAD_PATTERNS:
-            if pattern in text_lower:
-                patterns_found.append(f"Payload关键词: {pattern}")
-                score += 0.3
-        # 5. 检查代码/示例请求
-        for pattern in cls.CODE_REQUEST_PATTERNS:
-            if re.search(pattern, text_lower):
-                if any(noun in text_lower for noun in cls.ATTACK_NOUNS):
+        for pattern in found["PAYLOAD_PATTERNS"]:
+            patterns_found.append(f"Payload关键词: {pattern}")
+            score += 0.3
+        # 5. 检查代码/示例请求(仅在出现攻击名词时计分)
+        if found["ATTACK_NOUNS"]:
+            for pattern, regex in engine.code_requests:
+                if regex.search(text_lower):
                     patterns_found.append(f"代码请求模式: {pattern}")
                     score += 0.35
         # 计算置信度(归一化到0-1)
@@ -114,7 +151,13 @@ class AttackPatternDetector:
             "patterns": patterns_found,
             "explanation": explanation
         }
+
+    @classmethod
+    def detect_many(cls, texts: Iterable[str]) -> List[Dict[str, any]]:
+        # 批量检测(离线评估用), 与逐条调用 detect_attack_intent 结果一致
+        return [cls.detect_attack_intent(text) for text in texts]
     
+    @classmethod
     def should_block(cls, text: str, intent_result: Optional[Dict] = None) -> Tuple[bool, str]:
         # 综合判断是否应该拦截
         detection = cls.detect_attack_intent(text)
@@ -1,3 +1,13 @@
+import json
+import logging
+import threading
+from typing import Dict, List, NamedTuple, Optional
+
+import config
+from matcher import AhoCorasick
+
+logger = logging.getLogger(__name__)
+
 class Blacklist:
     # ========== 类别1: 指令覆盖攻击 ==========
     INSTRUCTION_OVERRIDE = {
@@ -132,4 +142,71 @@ def get_blacklist():
         "code_injection": config.CODE_INJECTION,
         "social_engineering": config.SOCIAL_ENGINEERING,
     }
-    return blacklist
\ No newline at end of file
+    return blacklist
+
+
+class BlacklistHit(NamedTuple):
+    category: str
+    pattern_type: str
+    pattern: str
+    start: int
+    end: int
+
+
+class BlacklistMatcher:
+    """
+    黑名单编译后的多模式匹配器, 单遍扫描(小写化后的)输入即可得到所有命中
+    命中按黑名单中的声明顺序排序, 第一条即逐条遍历时最先命中的规则
+    """
+    def __init__(self, blacklist: Dict[str, Dict[str, List[str]]], backend: str = "auto"):
+        entries = []
+        for category, pattern_groups in blacklist.items():
+            for pattern_type, patterns in pattern_groups.items():
+                for pattern in patterns:
+                    entries.append((pattern.lower(), (len(entries), category, pattern_type, pattern)))
+        self._automaton = AhoCorasick(entries, backend)
+        self.size = self._automaton.size
+        self.backend = self._automaton.backend
+
+    def match_all(self, text: str) -> List[BlacklistHit]:
+        # 所有命中(每条规则取首次出现), 按规则声明顺序排列
+        first = {}
+        for start, end, (order, category, pattern_type, pattern) in self._automaton.iter_matches(text.lower()):
+            if order not in first:
+                first[order] = BlacklistHit(category, pattern_type, pattern, start, end)
+        return [first[order] for order in sorted(first)]
+
+
+def load_blacklist_file(path: str) -> Dict[str, Dict[str, List[str]]]:
+    # 从JSON文件加载黑名单, 结构同 get_blacklist(): {类别: {规则组: [模式, ...]}}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _load_configured_blacklist() -> Dict[str, Dict[str, List[str]]]:
+    if config.BLACKLIST_PATH:
+        return load_blacklist_file(config.BLACKLIST_PATH)
+    return get_blacklist()
+
+
+_matcher = BlacklistMatcher(_load_configured_blacklist())
+_reload_lock = threading.Lock()
+
+
+def get_matcher() -> BlacklistMatcher:
+    return _matcher
+
+
+def reload_blacklist(blacklist: Optional[Dict[str, Dict[str, List[str]]]] = None) -> BlacklistMatcher:
+    """
+    热更新黑名单: 在后台构建新的匹配器后整体替换
+    正在进行的请求继续使用替换前取得的匹配器, 不会被阻塞
+    Args:
+        blacklist: 新的黑名单, 为空时重新读取 config.BLACKLIST_PATH(未配置时为内置规则)
+    """
+    global _matcher
+    with _reload_lock:
+        matcher = BlacklistMatcher(blacklist if blacklist is not None else _load_configured_blacklist())
+        _matcher = matcher
+    logger.info("黑名单已重新加载, 共 %d 条规则", matcher.size)
+    return matcher
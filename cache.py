@@ -0,0 +1,180 @@
+# 进程内缓存：线程安全的LRU + TTL, 带命中统计
+
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Hashable, List, Optional, Tuple
+from urllib.parse import quote
+
+from utils import normalize_text
+
+_MISSING = object()
+
+
+class LRUCache:
+    # 容量受限的LRU缓存, 条目超过ttl秒后失效
+    def __init__(self, maxsize: int = 1024, ttl: Optional[float] = None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._data.get(key, _MISSING)
+            if entry is _MISSING or (entry[1] is not None and entry[1] <= now):
+                if entry is not _MISSING:
+                    del self._data[key]
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def set(self, key: Hashable, value: Any):
+        expires = time.monotonic() + self.ttl if self.ttl else None
+        with self._lock:
+            self._data[key] = (value, expires)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+            }
+
+
+class RetrievalCache:
+    """
+    知识库检索结果缓存
+    - 以 (知识库, 版本号, 归一化查询, top_k, 度量) 为键, 按占用内存上限做LRU淘汰
+    - 每个知识库维护独立版本号, 重建某个知识库只使其自身条目失效
+    - 配置 marker_dir 时版本号还包含该库标记文件的修改时间, 其他进程(如单独运行的建库脚本)重建后同样失效
+    """
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024, ttl: Optional[float] = None,
+                 marker_dir: Optional[str] = None):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.marker_dir = marker_dir
+        self._data: "OrderedDict[tuple, tuple]" = OrderedDict()
+        self._versions: dict = {}
+        self._lock = threading.Lock()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def _sizeof(documents: tuple) -> int:
+        return sys.getsizeof(documents) + sum(sys.getsizeof(text) + 64 for text, _ in documents)
+
+    def _marker_path(self, database: str) -> str:
+        return os.path.join(self.marker_dir, quote(database, safe="") + ".version")
+
+    def version(self, database: str) -> tuple:
+        marker = 0
+        if self.marker_dir:
+            try:
+                marker = os.stat(self._marker_path(database)).st_mtime_ns
+            except OSError:
+                pass
+        return (self._versions.get(database, 0), marker)
+
+    def _key(self, database: str, query: str, top_k, metric_type) -> tuple:
+        return (database, self.version(database), normalize_text(query), top_k, metric_type)
+
+    def get(self, database: str, query: str, top_k=None, metric_type=None) -> Optional[List[Tuple[str, float]]]:
+        key = self._key(database, query, top_k, metric_type)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None or (entry[2] is not None and entry[2] <= now):
+                if entry is not None:
+                    self._remove(key)
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return list(entry[0])
+
+    def set(self, database: str, query: str, top_k, metric_type, documents: List[Tuple[str, float]],
+            version: Optional[tuple] = None):
+        """
+        Args:
+            version: 发起检索时的知识库版本号, 若期间知识库已重建则丢弃该结果
+        """
+        documents = tuple(documents)
+        size = self._sizeof(documents)
+        if size > self.max_bytes:
+            return
+        expires = time.monotonic() + self.ttl if self.ttl else None
+        with self._lock:
+            if version is not None and version != self.version(database):
+                return
+            key = self._key(database, query, top_k, metric_type)
+            if key in self._data:
+                self._remove(key)
+            self._data[key] = (documents, size, expires)
+            self.bytes += size
+            while self.bytes > self.max_bytes:
+                self._remove(next(iter(self._data)))
+                self.evictions += 1
+
+    def _remove(self, key: tuple):
+        _, size, _ = self._data.pop(key)
+        self.bytes -= size
+
+    def invalidate_collection(self, database: str):
+        # 提升版本号并释放该知识库的旧条目, 同时更新标记文件通知其他进程
+        if self.marker_dir:
+            try:
+                os.makedirs(self.marker_dir, exist_ok=True)
+                with open(self._marker_path(database), "w", encoding="utf-8") as f:
+                    f.write(str(time.time_ns()))
+            except OSError as e:
+                print(f"更新检索缓存失效标记失败: {e}")
+        with self._lock:
+            self._versions[database] = self._versions.get(database, 0) + 1
+            for key in [k for k in self._data if k[0] == database]:
+                self._remove(key)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.bytes = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._data),
+                "bytes": self.bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+                "versions": dict(self._versions),
+            }
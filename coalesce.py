@@ -0,0 +1,179 @@
+# 上游调用合并：
+#   - SingleFlight: 相同键的并发调用只发出一次上游请求, 共享其结果
+#   - MicroBatcher: 在几毫秒的窗口内把同组的并发请求合并为一次批量请求
+# 均提供线程版与 asyncio 版
+
+import asyncio
+import threading
+from concurrent.futures import Future
+from typing import Any, Awaitable, Callable, Dict, Hashable, List
+
+
+class SingleFlight:
+    # 线程版单飞: 第一个调用者执行fn, 其余相同键的调用者等待并共享结果(或异常)
+    def __init__(self):
+        self._inflight: Dict[Hashable, Future] = {}
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.shared = 0
+
+    def do(self, key: Hashable, fn: Callable[[], Any]) -> Any:
+        with self._lock:
+            self.calls += 1
+            future = self._inflight.get(key)
+            leader = future is None
+            if leader:
+                future = Future()
+                self._inflight[key] = future
+            else:
+                self.shared += 1
+        if not leader:
+            return future.result()
+        try:
+            result = fn()
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"calls": self.calls, "shared": self.shared, "inflight": len(self._inflight)}
+
+
+class AsyncSingleFlight:
+    # asyncio版单飞, 共享任务对单个等待者的取消免疫
+    def __init__(self):
+        self._inflight: Dict[Hashable, asyncio.Future] = {}
+        self.calls = 0
+        self.shared = 0
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        self.calls += 1
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(fn())
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        else:
+            self.shared += 1
+        return await asyncio.shield(task)
+
+    def stats(self) -> dict:
+        return {"calls": self.calls, "shared": self.shared, "inflight": len(self._inflight)}
+
+
+class MicroBatcher:
+    """
+    线程版微批处理器
+    Args:
+        batch_fn: batch_fn(group_key, items) -> 与items一一对应的结果列表
+        window: 收集窗口(秒), 组内第一个请求到达后开始计时
+        max_batch: 单批最大条数, 达到后立即发出
+    """
+    def __init__(self, batch_fn: Callable[[Hashable, List[Any]], List[Any]], window: float, max_batch: int = 16):
+        self.batch_fn = batch_fn
+        self.window = window
+        self.max_batch = max_batch
+        self._pending: Dict[Hashable, List[tuple]] = {}
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.batches = 0
+
+    def submit(self, group_key: Hashable, item: Any, timeout: float = None) -> Any:
+        future = Future()
+        flush_now = False
+        with self._lock:
+            self.requests += 1
+            group = self._pending.get(group_key)
+            if group is None:
+                group = self._pending[group_key] = []
+                timer = threading.Timer(self.window, self._flush, args=(group_key, group))
+                timer.daemon = True
+                timer.start()
+            group.append((item, future))
+            if len(group) >= self.max_batch:
+                flush_now = True
+        if flush_now:
+            self._flush(group_key, group)
+        return future.result(timeout)
+
+    def _flush(self, group_key: Hashable, group: List[tuple]):
+        with self._lock:
+            # 同一批次只由定时器或满批中的一方发出
+            if self._pending.get(group_key) is not group:
+                return
+            del self._pending[group_key]
+            self.batches += 1
+        _resolve(self.batch_fn, group_key, group)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"requests": self.requests, "batches": self.batches}
+
+
+class AsyncMicroBatcher:
+    # asyncio版微批处理器, batch_fn 为协程函数
+    def __init__(self, batch_fn: Callable[[Hashable, List[Any]], Awaitable[List[Any]]], window: float,
+                 max_batch: int = 16):
+        self.batch_fn = batch_fn
+        self.window = window
+        self.max_batch = max_batch
+        self._pending: Dict[Hashable, List[tuple]] = {}
+        self.requests = 0
+        self.batches = 0
+
+    async def submit(self, group_key: Hashable, item: Any) -> Any:
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self.requests += 1
+        group = self._pending.get(group_key)
+        if group is None:
+            group = self._pending[group_key] = []
+            loop.call_later(self.window, self._flush, group_key, group)
+        group.append((item, future))
+        if len(group) >= self.max_batch:
+            self._flush(group_key, group)
+        return await future
+
+    def _flush(self, group_key: Hashable, group: List[tuple]):
+        if self._pending.get(group_key) is not group:
+            return
+        del self._pending[group_key]
+        self.batches += 1
+        asyncio.ensure_future(self._run(group_key, group))
+
+    async def _run(self, group_key: Hashable, group: List[tuple]):
+        try:
+            results = await self.batch_fn(group_key, [item for item, _ in group])
+            if len(results) != len(group):
+                raise ValueError(f"批量结果数量不匹配: {len(results)} != {len(group)}")
+        except Exception as e:
+            for _, future in group:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for (_, future), result in zip(group, results):
+            if not future.done():
+                future.set_result(result)
+
+    def stats(self) -> dict:
+        return {"requests": self.requests, "batches": self.batches}
+
+
+def _resolve(batch_fn, group_key: Hashable, group: List[tuple]):
+    try:
+        results = batch_fn(group_key, [item for item, _ in group])
+        if len(results) != len(group):
+            raise ValueError(f"批量结果数量不匹配: {len(results)} != {len(group)}")
+    except Exception as e:
+        for _, future in group:
+            future.set_exception(e)
+        return
+    for (_, future), result in zip(group, results):
+        future.set_result(result)
@@ -0,0 +1,239 @@
+# 全局配置：上游服务地址、鉴权信息与网络参数, 均可通过环境变量覆盖
+
+import os
+
+
+def _env_float(name: str, default: float) -> float:
+    value = os.environ.get(name)
+    return float(value) if value else default
+
+
+def _env_int(name: str, default: int) -> int:
+    value = os.environ.get(name)
+    return int(value) if value else default
+
+
+# ========== 上游服务 ==========
+API_BASE_URL = os.environ.get("ADB_API_BASE_URL", "http://10.1.0.220:9002").rstrip("/")
+API_TOKEN = os.environ.get("ADB_API_TOKEN", "jI3sZMsJLctmIl87PAEQNeRq6NE9ymyx7M-rVk_MOWWA-kNbPDx-o8nAG0UUsmC-")
+# 公共数据库使用固定token
+COMMON_DATASET_TOKEN = os.environ.get("ADB_COMMON_DATASET_TOKEN", "token_common")
+
+# ========== HTTP传输 ==========
+HTTP_CONNECT_TIMEOUT = _env_float("ADB_HTTP_CONNECT_TIMEOUT", 3.0)
+HTTP_READ_TIMEOUT = _env_float("ADB_HTTP_READ_TIMEOUT", 120.0)
+# 5xx与连接重置的最大重试次数(不含首次请求)
+HTTP_MAX_RETRIES = _env_int("ADB_HTTP_MAX_RETRIES", 2)
+# 指数退避基数与上限(秒), 实际等待时间在[0, min(上限, 基数*2^n)]内随机抖动
+HTTP_BACKOFF_BASE = _env_float("ADB_HTTP_BACKOFF_BASE", 0.2)
+HTTP_BACKOFF_MAX = _env_float("ADB_HTTP_BACKOFF_MAX", 2.0)
+# 连接池中保持的keep-alive连接数
+HTTP_POOL_MAXSIZE = _env_int("ADB_HTTP_POOL_MAXSIZE", 64)
+# 各端点的最大并发请求数, 避免某一类调用占满连接池
+HTTP_ENDPOINT_LIMITS = {
+    "dialogue": _env_int("ADB_HTTP_LIMIT_DIALOGUE", 32),
+    "search": _env_int("ADB_HTTP_LIMIT_SEARCH", 48),
+    "databases": _env_int("ADB_HTTP_LIMIT_DATABASES", 4),
+}
+
+# ========== 对冲请求与熔断(resilience.py) ==========
+# 幂等调用(知识库检索、可缓存的分类/检测类dialogue)超过近期延迟分位数仍未返回时再发一份相同请求
+HEDGE_ENABLED = os.environ.get("ADB_HEDGE", "1") != "0"
+HEDGE_QUANTILE = _env_float("ADB_HEDGE_QUANTILE", 0.95)
+# 对冲等待时间的下限与上限(秒), 样本不足时使用上限
+HEDGE_MIN_DELAY = _env_float("ADB_HEDGE_MIN_DELAY", 0.05)
+HEDGE_MAX_DELAY = {
+    "search": _env_float("ADB_HEDGE_MAX_DELAY_SEARCH", 2.0),
+    "dialogue": _env_float("ADB_HEDGE_MAX_DELAY_DIALOGUE", 5.0),
+}
+# 对冲请求数占调用数的上限
+HEDGE_MAX_RATIO = _env_float("ADB_HEDGE_MAX_RATIO", 0.1)
+# 执行同步对冲调用的线程池大小(首个请求也在其中执行)
+HEDGE_WORKERS = _env_int("ADB_HEDGE_WORKERS", 64)
+# 按端点熔断: 最近 CIRCUIT_WINDOW 次调用(至少 CIRCUIT_MIN_CALLS 次)中失败或慢调用占比达到阈值时熔断 CIRCUIT_OPEN_SECONDS 秒
+CIRCUIT_ENABLED = os.environ.get("ADB_CIRCUIT", "1") != "0"
+CIRCUIT_WINDOW = _env_int("ADB_CIRCUIT_WINDOW", 50)
+CIRCUIT_MIN_CALLS = _env_int("ADB_CIRCUIT_MIN_CALLS", 20)
+CIRCUIT_ERROR_RATE = _env_float("ADB_CIRCUIT_ERROR_RATE", 0.5)
+CIRCUIT_SLOW_RATE = _env_float("ADB_CIRCUIT_SLOW_RATE", 0.5)
+# 慢调用阈值(秒); 回答生成本身较慢, dialogue 的阈值相应放宽
+CIRCUIT_SLOW_SECONDS = {
+    "search": _env_float("ADB_CIRCUIT_SLOW_SECONDS_SEARCH", 5.0),
+    "dialogue": _env_float("ADB_CIRCUIT_SLOW_SECONDS_DIALOGUE", 90.0),
+}
+CIRCUIT_OPEN_SECONDS = _env_float("ADB_CIRCUIT_OPEN_SECONDS", 30.0)
+# 检索接口熔断期间的本地检索后端(lexical / dense), 已配置 RETRIEVAL_FALLBACK 时以其为准; 为空时熔断期间返回空结果
+CIRCUIT_SEARCH_FALLBACK = os.environ.get("ADB_CIRCUIT_SEARCH_FALLBACK", "lexical") or None
+
+# ========== 上游LLM调度(llm_scheduler.py) ==========
+# 所有dialogue调用按优先级(guard > helper > answer > refine)与会话轮转申请名额
+LLM_SCHEDULER_ENABLED = os.environ.get("ADB_LLM_SCHEDULER", "1") != "0"
+# 全局在途调用上限, 默认与dialogue端点的并发上限一致
+LLM_MAX_INFLIGHT = _env_int("ADB_LLM_MAX_INFLIGHT", HTTP_ENDPOINT_LIMITS["dialogue"])
+# 只供检测类(guard)与检索辅助类(helper)调用使用的预留名额, 回答生成与迭代改写不能占用
+LLM_RESERVED_SLOTS = _env_int("ADB_LLM_RESERVED_SLOTS", 8)
+# 排队老化: 某一优先级最早的排队请求每等待这么多秒, 该优先级的放行顺序提前一级, 低优先级不会被无限期饿死; 0 关闭
+LLM_AGING_SECONDS = _env_float("ADB_LLM_AGING_SECONDS", 2.0)
+
+# ========== 检索 ==========
+# 多知识库并发检索的线程池大小
+SEARCH_MAX_WORKERS = _env_int("ADB_SEARCH_MAX_WORKERS", 16)
+# 单个知识库的检索截止时间(秒), 超时的知识库将被丢弃
+SEARCH_COLLECTION_DEADLINE = _env_float("ADB_SEARCH_COLLECTION_DEADLINE", 8.0)
+# 检索在线程池中排队等待开始的上限(秒); 截止时间从开始执行时算起, 排队时间不计入
+SEARCH_QUEUE_TIMEOUT = _env_float("ADB_SEARCH_QUEUE_TIMEOUT", 8.0)
+# 检索流程中查询翻译使用的线程数, 与检索线程池分开
+TRANSLATE_WORKERS = _env_int("ADB_TRANSLATE_WORKERS", 8)
+# 高级RAG策略: decomposition(问题分解) / recursive(迭代检索), 为空时仅做基础检索
+RAG_ENHANCE_TYPE = os.environ.get("ADB_RAG_ENHANCE_TYPE") or None
+# 问题分解(decomposition)最多保留的子问题数
+DECOMPOSITION_MAX_QUESTIONS = _env_int("ADB_DECOMPOSITION_MAX_QUESTIONS", 5)
+# 迭代检索(recursive)的预算: 最大轮数(含首轮检索)、LLM调用次数(改写与翻译)、总耗时(秒),
+# 以及继续迭代所需的新增文档占比下限
+RECURSIVE_MAX_ROUNDS = _env_int("ADB_RECURSIVE_MAX_ROUNDS", 4)
+RECURSIVE_MAX_LLM_CALLS = _env_int("ADB_RECURSIVE_MAX_LLM_CALLS", 8)
+RECURSIVE_TIME_BUDGET = _env_float("ADB_RECURSIVE_TIME_BUDGET", 20.0)
+RECURSIVE_MIN_NOVELTY = _env_float("ADB_RECURSIVE_MIN_NOVELTY", 0.2)
+
+# 推测检索(speculation.py): 翻译、L1检索与问题分解在请求到达时即开始, 与第1~3层安全检测并行, 被拦截时取消并丢弃
+SPECULATIVE_RETRIEVAL = os.environ.get("ADB_SPECULATIVE_RETRIEVAL", "1") != "0"
+# 同步流程中编排推测任务的线程池大小(各知识库检索仍使用检索线程池)
+SPECULATIVE_MAX_WORKERS = _env_int("ADB_SPECULATIVE_MAX_WORKERS", 8)
+
+# 多路检索结果合并前每路分数的归一化方式: none / minmax / zscore / rank
+RETRIEVAL_SCORE_NORMALIZATION = os.environ.get("ADB_RETRIEVAL_SCORE_NORMALIZATION", "none")
+# SimHash汉明距离(64位)不超过该值的文本块视为近似重复, 负数表示只去除完全相同的文本
+RETRIEVAL_DEDUP_DISTANCE = _env_int("ADB_RETRIEVAL_DEDUP_DISTANCE", 3)
+
+# 送入生成模型的检索上下文token预算(估算值), 问题分解与迭代检索共用
+CONTEXT_TOKEN_BUDGET = _env_int("ADB_CONTEXT_TOKEN_BUDGET", 6000)
+
+# 流式回答(/chat/stream): 生成文本按片段送输出检测, 片段长度下限与强制切分上限(字符)
+STREAM_SEGMENT_MIN_CHARS = _env_int("ADB_STREAM_SEGMENT_MIN_CHARS", 200)
+STREAM_SEGMENT_MAX_CHARS = _env_int("ADB_STREAM_SEGMENT_MAX_CHARS", 800)
+# 片段送检时附带的前文长度(字符), 使跨片段边界的内容在同一次检测中出现
+STREAM_SEGMENT_OVERLAP_CHARS = _env_int("ADB_STREAM_SEGMENT_OVERLAP_CHARS", 200)
+
+# ========== 输入检测 ==========
+# 黑名单JSON文件(结构同 blacklist.get_blacklist()), 为空时使用 blacklist.py 内置规则; 修改后调用 reload_blacklist() 生效
+BLACKLIST_PATH = os.environ.get("ADB_BLACKLIST_PATH") or None
+# 本地意图预分类(intent_prefilter.py): 校准置信度达到阈值时跳过LLM意图分类; 模型文件不存在时全部走LLM
+INTENT_PREFILTER_ENABLED = os.environ.get("ADB_INTENT_PREFILTER", "1") != "0"
+INTENT_PREFILTER_PATH = os.environ.get(
+    "ADB_INTENT_PREFILTER_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "knowledge", "intent_prefilter.npz")
+)
+INTENT_PREFILTER_THRESHOLD = _env_float("ADB_INTENT_PREFILTER_THRESHOLD", 0.9)
+# 是否允许本地预分类直接给出放行类意图(KNOWLEDGE/DEFENSE); 默认关闭, 只用于直接拦截ATTACK
+INTENT_PREFILTER_ALLOW = os.environ.get("ADB_INTENT_PREFILTER_ALLOW", "0") == "1"
+# 超过该长度(字符)的输入直接使用LLM分类
+INTENT_PREFILTER_MAX_CHARS = _env_int("ADB_INTENT_PREFILTER_MAX_CHARS", 500)
+# LLM意图分类结果(文本, 意图, 置信度)的JSONL文件路径, 作为预分类模型的训练数据; 为空时不记录
+INTENT_LOG_PATH = os.environ.get("ADB_INTENT_LOG_PATH") or None
+
+# ========== 输出检测 ==========
+# 长回答按段落/代码块分块并行检测, 任一块不安全即判定失败
+OUTPUT_CHECK_CHUNKED = os.environ.get("ADB_OUTPUT_CHECK_CHUNKED", "1") != "0"
+# 单块最大字符数(代码块不拆分, 可能超出)
+OUTPUT_CHUNK_CHARS = _env_int("ADB_OUTPUT_CHUNK_CHARS", 1200)
+# 同步分块检测的线程池大小
+OUTPUT_CHECK_WORKERS = _env_int("ADB_OUTPUT_CHECK_WORKERS", 8)
+
+# 严格检测(高置信ATTACK意图)的多轮投票并行进行; 通过规则: unanimous(全票) / majority(过半) / k-of-n
+STRICT_QUORUM = os.environ.get("ADB_STRICT_QUORUM", "unanimous")
+STRICT_QUORUM_K = _env_int("ADB_STRICT_QUORUM_K", 1)
+STRICT_VOTE_WORKERS = _env_int("ADB_STRICT_VOTE_WORKERS", 8)
+# 投票记录(各轮结论与耗时)的JSONL文件路径, 为空时只保存在内存中(safety_agent.strict_votes)
+STRICT_VOTE_LOG_PATH = os.environ.get("ADB_STRICT_VOTE_LOG_PATH") or None
+
+# ========== 缓存 ==========
+# dialogue() 确定性调用(分类/安检, 调用方以 cacheable=True 显式开启)的记忆化缓存
+DIALOGUE_CACHE_ENABLED = os.environ.get("ADB_DIALOGUE_CACHE", "1") != "0"
+DIALOGUE_CACHE_SIZE = _env_int("ADB_DIALOGUE_CACHE_SIZE", 4096)
+DIALOGUE_CACHE_TTL = _env_float("ADB_DIALOGUE_CACHE_TTL", 1800.0)
+# 查询翻译缓存(按归一化文本)
+TRANSLATION_CACHE_SIZE = _env_int("ADB_TRANSLATION_CACHE_SIZE", 4096)
+TRANSLATION_CACHE_TTL = _env_float("ADB_TRANSLATION_CACHE_TTL", 86400.0)
+# 查询中ASCII字符占比不低于该值且不含汉字等CJK字符时视为英文, 跳过翻译
+TRANSLATION_ASCII_RATIO = _env_float("ADB_TRANSLATION_ASCII_RATIO", 0.8)
+# 知识库检索结果缓存
+RETRIEVAL_CACHE_ENABLED = os.environ.get("ADB_RETRIEVAL_CACHE", "1") != "0"
+RETRIEVAL_CACHE_MAX_BYTES = _env_int("ADB_RETRIEVAL_CACHE_MAX_BYTES", 64 * 1024 * 1024)
+RETRIEVAL_CACHE_TTL = _env_float("ADB_RETRIEVAL_CACHE_TTL", 3600.0)
+# 跨进程失效标记目录: 知识库重建后更新其中按库命名的标记文件, 服务进程据其修改时间判断缓存是否过期;
+# 为空时只在进程内失效, 其他进程要等TTL到期
+RETRIEVAL_CACHE_MARKER_DIR = os.environ.get(
+    "ADB_RETRIEVAL_CACHE_MARKER_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "knowledge", "cache_versions")
+)
+
+# ========== 会话 ==========
+# 对话历史按会话(cookie中的会话ID)隔离; 存储后端: memory(进程内) / sqlite(文件, 重启后保留, 多进程共享)
+SESSION_BACKEND = os.environ.get("ADB_SESSION_BACKEND", "memory")
+SESSION_DB_PATH = os.environ.get(
+    "ADB_SESSION_DB_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "sessions.db")
+)
+SESSION_COOKIE_NAME = os.environ.get("ADB_SESSION_COOKIE_NAME", "adb_session")
+# 每个会话保留的最近轮数与空闲过期时间(秒)
+SESSION_MAX_TURNS = _env_int("ADB_SESSION_MAX_TURNS", 5)
+SESSION_IDLE_TTL = _env_float("ADB_SESSION_IDLE_TTL", 3600.0)
+# 进程内存储的内存上限(估算值)与锁分段数
+SESSION_MAX_BYTES = _env_int("ADB_SESSION_MAX_BYTES", 64 * 1024 * 1024)
+SESSION_LOCK_STRIPES = _env_int("ADB_SESSION_LOCK_STRIPES", 16)
+
+# 上下文意图检测(渐进式攻击): off / full(每次发送最近5轮完整对话) / incremental(只发送会话的滚动摘要与风险轨迹)
+CONTEXT_INTENT_MODE = os.environ.get("ADB_CONTEXT_INTENT_MODE", "incremental")
+# 增量模式: 摘要长度上限(字), 更新摘要时回答截取的字符数, 风险轨迹保留的轮数, 后台更新线程数
+CONTEXT_SUMMARY_MAX_CHARS = _env_int("ADB_CONTEXT_SUMMARY_MAX_CHARS", 300)
+CONTEXT_SUMMARY_ANSWER_CHARS = _env_int("ADB_CONTEXT_SUMMARY_ANSWER_CHARS", 800)
+CONTEXT_TRAJECTORY_LEN = _env_int("ADB_CONTEXT_TRAJECTORY_LEN", 8)
+CONTEXT_UPDATE_WORKERS = _env_int("ADB_CONTEXT_UPDATE_WORKERS", 4)
+# 同步流程中与意图识别并行执行上下文检测的线程数
+CONTEXT_CHECK_WORKERS = _env_int("ADB_CONTEXT_CHECK_WORKERS", 8)
+# 被安全层拦截的一轮记入风险轨迹时的风险评分(不调用LLM评估)
+CONTEXT_BLOCKED_RISK = _env_float("ADB_CONTEXT_BLOCKED_RISK", 0.9)
+
+# ========== 请求合并 ==========
+# 相同的并发上游调用(可缓存的dialogue、知识库检索)只发出一次请求
+SINGLE_FLIGHT_ENABLED = os.environ.get("ADB_SINGLE_FLIGHT", "1") != "0"
+# 上游批量检索接口路径(如 "/api/databases/{database}/batch_search"), 为空表示服务不支持批量检索
+SEARCH_BATCH_PATH = os.environ.get("ADB_SEARCH_BATCH_PATH") or None
+# 微批收集窗口(毫秒)与单批最大查询数
+SEARCH_BATCH_WINDOW_MS = _env_float("ADB_SEARCH_BATCH_WINDOW_MS", 5.0)
+SEARCH_BATCH_MAX = _env_int("ADB_SEARCH_BATCH_MAX", 16)
+
+# ========== 本地检索 ==========
+# 检索后端: remote(远程向量库) / lexical(本地BM25索引) / dense(本地向量索引), 本地后端零网络
+RETRIEVAL_BACKEND = os.environ.get("ADB_RETRIEVAL_BACKEND", "remote")
+# 远程检索超时或失败时的本地兜底: lexical / dense / 为空表示不兜底
+RETRIEVAL_FALLBACK = os.environ.get("ADB_RETRIEVAL_FALLBACK") or None
+LEXICAL_INDEX_PATH = os.environ.get(
+    "ADB_LEXICAL_INDEX_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "knowledge", "lexical.idx")
+)
+# BM25分数映射到(0,1)的中点: score / (score + pivot)
+LEXICAL_SCORE_PIVOT = _env_float("ADB_LEXICAL_SCORE_PIVOT", 10.0)
+# 本地向量索引目录、嵌入函数("hashing" 或 "模块:工厂")、哈希嵌入维度与存储精度(int8 / float32)
+DENSE_INDEX_DIR = os.environ.get(
+    "ADB_DENSE_INDEX_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "knowledge", "dense")
+)
+DENSE_EMBEDDER = os.environ.get("ADB_DENSE_EMBEDDER", "hashing")
+DENSE_DIM = _env_int("ADB_DENSE_DIM", 512)
+DENSE_DTYPE = os.environ.get("ADB_DENSE_DTYPE", "int8")
+
+# ========== 生产服务(serve.py) ==========
+# 工作进程数, 大于1时各进程以 SO_REUSEPORT 监听同一端口(会话需使用sqlite后端才能跨进程共享)
+SERVE_WORKERS = _env_int("ADB_SERVE_WORKERS", 1)
+# 每个进程同时运行的流水线数, 超出的请求排队; 排队上限与等待上限(秒), 超出时立即返回503与Retry-After
+SERVE_MAX_CONCURRENCY = _env_int("ADB_SERVE_MAX_CONCURRENCY", 64)
+SERVE_MAX_QUEUE = _env_int("ADB_SERVE_MAX_QUEUE", 128)
+SERVE_QUEUE_TIMEOUT = _env_float("ADB_SERVE_QUEUE_TIMEOUT", 10.0)
+# 执行阻塞调用(asyncio.to_thread)的默认线程池大小, 0表示使用asyncio默认值
+SERVE_THREADS = _env_int("ADB_SERVE_THREADS", 0)
+# /chat 与 /chat/stream 按客户端(IP)限流: 每秒补充的请求数与突发上限, 速率为0时不限流; 超出时返回429与Retry-After
+SERVE_RATE_LIMIT = _env_float("ADB_SERVE_RATE_LIMIT", 1.0)
+SERVE_RATE_BURST = _env_int("ADB_SERVE_RATE_BURST", 5)
+# 部署在反向代理之后时设为可信代理的层数N, 以 X-Forwarded-For 从右数第N个地址(即最外层可信代理记录的对端地址)识别客户端;
+# 更靠左的地址由客户端自行填写, 不可信; 0 表示直接使用连接对端地址
+SERVE_TRUST_PROXY = _env_int("ADB_SERVE_TRUST_PROXY", 0)
+# 收到SIGTERM/SIGINT后等待进行中的流水线结束的上限(秒)
+SERVE_DRAIN_TIMEOUT = _env_float("ADB_SERVE_DRAIN_TIMEOUT", 30.0)
@@ -1,4 +1,21 @@
-from api_client import dialogue
-def answerLM(user_prompt, system_prompt, max_tokens=1200):
-    resp = dialogue(user_prompt, system_prompt, max_tokens=max_tokens)
-    return resp['response']
\ No newline at end of file
+from api_client import dialogue, dialogue_async, dialogue_stream, dialogue_stream_async
+from llm_scheduler import ANSWER, HELPER
+# priority: 上游调用的调度优先级, queue_timeout: 调度排队超时(秒), 见 llm_scheduler.py
+def answerLM(user_prompt, system_prompt, max_tokens=1200, cacheable=False, priority=HELPER, queue_timeout=None):
+    resp = dialogue(user_prompt, system_prompt, max_tokens=max_tokens, cacheable=cacheable, priority=priority,
+                    queue_timeout=queue_timeout)
+    return resp['response']
+
+async def answerLM_async(user_prompt, system_prompt, max_tokens=1200, cacheable=False, priority=HELPER,
+                         queue_timeout=None):
+    resp = await dialogue_async(user_prompt, system_prompt, max_tokens=max_tokens, cacheable=cacheable,
+                                priority=priority, queue_timeout=queue_timeout)
+    return resp['response']
+
+def answerLM_stream(user_prompt, system_prompt, max_tokens=1200, priority=ANSWER):
+    # 流式生成, 逐块产出回答文本
+    yield from dialogue_stream(user_prompt, system_prompt, max_tokens=max_tokens, priority=priority)
+
+async def answerLM_stream_async(user_prompt, system_prompt, max_tokens=1200, priority=ANSWER):
+    async for delta in dialogue_stream_async(user_prompt, system_prompt, max_tokens=max_tokens, priority=priority):
+        yield delta
@@ -1,57 +1,491 @@
-from api_client import search_similar_files
+from api_client import (search_similar_files, search_similar_files_async, search_similar_files_batch,
+                        search_similar_files_batch_async, retrieval_cache)
+from coalesce import SingleFlight, AsyncSingleFlight, MicroBatcher, AsyncMicroBatcher
+from utils import normalize_text
 from conversation import answerLM
-from prompt_builder import RAG_DECOMPOSTION_PROMPT,TRANSLATE_PROMPT,QUERY_REFINEMENT_PROMPT,build_recursive_prompt
-token = "jI3sZMsJLctmIl87PAEQNeRq6NE9ymyx7M-rVk_MOWWA-kNbPDx-o8nAG0UUsmC-"
+from llm_scheduler import REFINE, SchedulerTimeout
+from prompt_builder import RAG_DECOMPOSTION_PROMPT,QUERY_REFINEMENT_PROMPT,build_recursive_prompt
+from translation import translate_to_english, translate_to_english_async, translate_batch
+from lexical_index import get_lexical_index, search_lexical
+from ranking import merge_results
+from resilience import CircuitOpenError, is_degraded
+import config
+import asyncio
+import contextvars
+import logging
+import re
+import threading
+import time
+from concurrent.futures import CancelledError, ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+logger = logging.getLogger(__name__)
+token = config.API_TOKEN
+_SEARCH_POOL = ThreadPoolExecutor(max_workers=config.SEARCH_MAX_WORKERS, thread_name_prefix="kb-search")
+# 与检索并行的查询翻译(LLM调用)单独使用线程池, 不占用检索线程
+_TRANSLATE_POOL = ThreadPoolExecutor(max_workers=config.TRANSLATE_WORKERS, thread_name_prefix="kb-translate")
 DATABASE=['common_dataset','student_Group3_ATT_CK','student_Group3_D3FEND','student_Group3_OWASP','student_Group3_CYBER_METRIC']
-def advanced_search(initial_q, enhance_type):
+_BRACED = re.compile(r"\{([^{}]*)\}")
+_LIST_MARKER = re.compile(r"^\s*(?:\d+\s*[.、)）:]|[-*•·])\s*")
+_QUESTION_END = re.compile(r"(?<=[?？])\s*")
+
+def parse_decomposition(response, max_questions=None):
+    """
+    解析问题分解的输出, 格式为 {子问题1}{子问题2}...; 模型未按格式输出时按行(去掉编号)或问号拆分
+    子问题内部的逗号不拆分; 去掉空项与重复项, 最多保留 max_questions 个
+    """
+    max_questions = config.DECOMPOSITION_MAX_QUESTIONS if max_questions is None else max_questions
+    items = _BRACED.findall(response)
+    if not items:
+        lines = [line for line in response.splitlines() if line.strip()]
+        items = lines if len(lines) > 1 else _QUESTION_END.split(response)
+    questions, seen = [], set()
+    for item in items:
+        question = _LIST_MARKER.sub("", item).strip().strip('"\'“”')
+        key = normalize_text(question)
+        if key and key not in seen:
+            seen.add(key)
+            questions.append(question)
+    return questions[:max_questions]
+
+def _submit_bilingual(q, eng_q, topk):
+    # 提交中英两种语言的各知识库检索, 查询本身为英文时只检索一次
+    return _submit_searches(q, topk), (_submit_searches(eng_q, topk) if eng_q != q else None)
+
+def _collect_bilingual(searches, topk):
+    # 收集中英两种语言的各路结果, 每种语言各占topk条额度, 见 _top_texts_bilingual
+    zh_searches, en_searches = searches
+    zh_lists = _collect_documents(*zh_searches)
+    en_lists = _collect_documents(*en_searches) if en_searches is not None else None
+    return _top_texts_bilingual(zh_lists, en_lists, topk)
+
+def _check_cancelled(cancelled, *searches):
+    # 推测执行被放弃时(见 speculation.py)在阶段之间停止, 取消尚未开始的检索
+    if cancelled is None or not cancelled.is_set():
+        return
+    for search in searches:
+        if search is not None:
+            for task in search[3]:
+                task.future.cancel()
+    raise CancelledError()
+
+def decomposition_search(initial_q, topk=5, with_l1=True, cancelled=None):
+    """
+    问题分解检索: 原问题分解为子问题, 子问题一次批量翻译后所有检索同时提交到共享检索线程池
+    (线程池大小即并发上限 config.SEARCH_MAX_WORKERS)
+    Args:
+        with_l1: 是否同时完成原问题的双语检索(L1), 与子问题检索共用一次调度; 与原问题相同的子问题直接复用L1结果
+        cancelled: 可选的 threading.Event, 置位后在下一阶段开始前抛出 CancelledError
+    Returns:
+        (L1_documents 或 None, [[sub_question, docs_text]])
+    """
+    l1_zh = _submit_searches(initial_q, topk) if with_l1 else None
+    # 原问题的翻译与问题分解两次LLM调用并行
+    l1_translation = (_TRANSLATE_POOL.submit(contextvars.copy_context().run, _translate_query, initial_q)
+                      if with_l1 else None)
+    response = answerLM(initial_q, RAG_DECOMPOSTION_PROMPT, max_tokens=200)
+    initial_key = normalize_text(initial_q)
+    _check_cancelled(cancelled, l1_zh)
+    sub_questions = parse_decomposition(response)
+    logger.info("问题分解: %s", sub_questions)
+    is_l1 = [with_l1 and normalize_text(sq) == initial_key for sq in sub_questions]
+    pending = [sq for sq, same in zip(sub_questions, is_l1) if not same]
+    # 所有子问题合并为一次批量翻译, 翻译完成后全部检索一起提交
+    eng_qs = translate_batch(pending) if pending else []
+    _check_cancelled(cancelled, l1_zh)
+    if with_l1:
+        eng_q = l1_translation.result()
+        l1_searches = (l1_zh, _submit_searches(eng_q, topk) if eng_q != initial_q else None)
+    sub_searches = iter([_submit_bilingual(sq, eq, topk) for sq, eq in zip(pending, eng_qs)])
+    L1_documents = _collect_bilingual(l1_searches, topk) if with_l1 else None
+    tuple_query_docs = []
+    for sq, same in zip(sub_questions, is_l1):
+        docs = L1_documents if same else _collect_bilingual(next(sub_searches), topk)
+        tuple_query_docs.append([sq, '\n\n'.join(docs)])
+    return L1_documents, tuple_query_docs
+
+def _recursive_stop_reason(started, rounds, llm_calls):
+    # 下一轮(一次改写 + 一次检索, 至多两次LLM调用)是否仍在预算内; 返回停止原因, 可继续时返回None
+    if rounds >= config.RECURSIVE_MAX_ROUNDS:
+        return "max_rounds"
+    if llm_calls + 2 > config.RECURSIVE_MAX_LLM_CALLS:
+        return "call_budget"
+    elapsed = time.monotonic() - started
+    # 按已完成轮次的平均耗时预估下一轮, 预计超出时间预算则不再开始
+    if elapsed + elapsed / rounds > config.RECURSIVE_TIME_BUDGET:
+        return "time_budget"
+    return None
+
+def recursive_search(initial_q, topk=5, trace=None, cancelled=None):
+    """
+    迭代检索: 由LLM根据已检索的文档逐轮改写问题, 用改写后的问题检索新文档
+    每轮只保留此前未检索到的文档; 模型判断文档已足够(<stop>)、改写重复、新增文档占比低于
+    config.RECURSIVE_MIN_NOVELTY 或轮数/LLM调用次数/耗时超出预算时停止
+    Args:
+        trace: 可选列表, 追加每轮的记录 {"round", "query", "docs", "new_docs", "novelty", "elapsed", "llm_calls"},
+               最后一条带 "stop_reason"
+        cancelled: 可选的 threading.Event, 置位后不再开始下一轮(停止原因 cancelled)
+    Returns:
+        [[query, docs_text]], 首项为原问题, 其后为各轮改写及其新增文档
+    """
+    trace = [] if trace is None else trace
+    started = time.monotonic()
+    seen = set()
+    queries = {normalize_text(initial_q)}
+
+    def search_round(query, llm_calls):
+        round_start = time.monotonic()
+        docs = search_database_bilingual(query, topk)
+        new_docs = []
+        for doc in docs:
+            key = normalize_text(doc)
+            if key not in seen:
+                seen.add(key)
+                new_docs.append(doc)
+        trace.append({
+            "round": len(trace) + 1,
+            "query": query,
+            "docs": len(docs),
+            "new_docs": len(new_docs),
+            "novelty": round(len(new_docs) / len(docs), 3) if docs else 0.0,
+            "elapsed": round(time.monotonic() - round_start, 3),
+            # 检索中的翻译按一次LLM调用计(可能命中缓存)
+            "llm_calls": llm_calls + 1,
+        })
+        return new_docs
+
+    tuple_query_docs = [[initial_q, '\n\n'.join(search_round(initial_q, 0))]]
+    stop_reason = None
+    while stop_reason is None:
+        llm_calls = trace[-1]["llm_calls"]
+        if cancelled is not None and cancelled.is_set():
+            stop_reason = "cancelled"
+            break
+        stop_reason = _recursive_stop_reason(started, len(trace), llm_calls)
+        if stop_reason:
+            break
+        # 改写调用排队的时间也计入时间预算, 预算内排不到名额时停止
+        remaining = config.RECURSIVE_TIME_BUDGET - (time.monotonic() - started)
+        try:
+            refined = answerLM(build_recursive_prompt(tuple_query_docs), QUERY_REFINEMENT_PROMPT, max_tokens=360,
+                               priority=REFINE, queue_timeout=max(remaining, 0.0)).strip()
+        except SchedulerTimeout:
+            stop_reason = "time_budget"
+            break
+        llm_calls += 1
+        if not refined or '<stop>' in refined:
+            trace[-1]["llm_calls"] = llm_calls
+            stop_reason = "model_stop"
+            break
+        key = normalize_text(refined)
+        if key in queries:
+            trace[-1]["llm_calls"] = llm_calls
+            stop_reason = "repeated_query"
+            break
+        queries.add(key)
+        new_docs = search_round(refined, llm_calls)
+        if new_docs:
+            tuple_query_docs.append([refined, '\n\n'.join(new_docs)])
+        if trace[-1]["novelty"] < config.RECURSIVE_MIN_NOVELTY:
+            stop_reason = "low_novelty"
+    trace[-1]["stop_reason"] = stop_reason
+    logger.info("迭代检索 %d 轮, 停止原因 %s, 共 %d 条文档, LLM调用 %d 次, 耗时 %.2fs", len(trace), stop_reason,
+                len(seen), trace[-1]["llm_calls"], time.monotonic() - started)
+    return tuple_query_docs
+
+def advanced_search(initial_q, enhance_type, trace=None, cancelled=None):
+    """
+    Args:
+        trace: recursive模式下追加每轮记录的列表, 见 recursive_search
+        cancelled: 可选的 threading.Event, 置位后提前结束, 见 decomposition_search / recursive_search
+    """
     if enhance_type == 'decomposition':
-        response = answerLM(initial_q, RAG_DECOMPOSTION_PROMPT, max_tokens=200)
-        decompose_q = [x for x in response.replace('}{', ',').replace('{', '').replace('}', '').split(',')]
-        print(decompose_q)
-        tuple_query_docs = []
-        for i in range(len(decompose_q)):
-            docs = search_database_bilingual(decompose_q[i], 5)
-            docstr = '\n\n'.join(docs)
-            tuple_query_docs.append([decompose_q[i], docstr])
-        return tuple_query_docs
+        return decomposition_search(initial_q, 5, with_l1=False, cancelled=cancelled)[1]
     elif enhance_type=='recursive':
-        iter=1
-        MAX_ITER=8
-        tuple_query_docs=[[initial_q,'\n\n'.join(search_database_bilingual(initial_q, 5))]]
-        while True:
-            iter+=1
-            response=answerLM(build_recursive_prompt(tuple_query_docs),QUERY_REFINEMENT_PROMPT,max_tokens=360)
-            print(f"121212{response}")
-            if response=='<stop>' or MAX_ITER<=iter:
-                break
-            tuple_query_docs.append([response,'\n\n'.join(search_database_bilingual(initial_q, 5))])
-        print(tuple_query_docs)
-        return tuple_query_docs
+        return recursive_search(initial_q, 5, trace, cancelled)
 
 
 
 def search_common_database(q, topk):
     #deprecated
     #i think this function should replace by parametric search after we have own database
-    d = search_similar_files('common_dataset', 'token_common', q, topk, 'cosine')
+    d = search_similar_files('common_dataset', config.COMMON_DATASET_TOKEN, q, topk, 'cosine')
     documents = [(x['text'],x['score']) for x in d['files']]
     return documents
 
+def _batch_search(group_key, queries):
+    database, collection_token, topk, metric_type = group_key
+    return search_similar_files_batch(database, collection_token, queries, topk, metric_type,
+                                      timeout=config.SEARCH_COLLECTION_DEADLINE)
+
+async def _batch_search_async(group_key, queries):
+    database, collection_token, topk, metric_type = group_key
+    return await search_similar_files_batch_async(database, collection_token, queries, topk, metric_type,
+                                                  timeout=config.SEARCH_COLLECTION_DEADLINE)
+
+# 相同检索的并发请求只发出一次; 上游支持批量检索时, 同一知识库的并发查询在微批窗口内合并为一次请求
+search_flight = SingleFlight()
+search_flight_async = AsyncSingleFlight()
+search_batcher = MicroBatcher(_batch_search, window=config.SEARCH_BATCH_WINDOW_MS / 1000,
+                              max_batch=config.SEARCH_BATCH_MAX)
+search_batcher_async = AsyncMicroBatcher(_batch_search_async, window=config.SEARCH_BATCH_WINDOW_MS / 1000,
+                                         max_batch=config.SEARCH_BATCH_MAX)
+
+def _fetch_collection(database, q, topk):
+    # 向上游发起单个知识库检索, 返回 [(text, score)]
+    collection_token = config.COMMON_DATASET_TOKEN if database == 'common_dataset' else token
+    if config.SEARCH_BATCH_PATH:
+        fetch = lambda: search_batcher.submit((database, collection_token, topk, 'cosine'), q,
+                                              timeout=config.SEARCH_COLLECTION_DEADLINE)
+    else:
+        fetch = lambda: search_similar_files(database, collection_token, q, topk, 'cosine',
+                                             timeout=config.SEARCH_COLLECTION_DEADLINE)
+    if config.SINGLE_FLIGHT_ENABLED:
+        d = search_flight.do((database, normalize_text(q), topk, 'cosine'), fetch)
+    else:
+        d = fetch()
+    return [(x['text'], x['score']) for x in d['files']]
+
+# 已警告过未被本地索引收录的 (后端, 知识库)
+_missing_local = set()
+
+def _local_collections(backend):
+    # 本地索引(首次调用时加载, 不存在时构建)收录的知识库
+    if backend == 'lexical':
+        return get_lexical_index().collections
+    if backend == 'dense':
+        # numpy 为可选依赖, 仅在启用向量后端时导入
+        from vector_index import get_dense_index
+        return get_dense_index().collections
+    raise ValueError(f"未知的本地检索后端: {backend}")
+
+def _warn_missing_local(backend, database):
+    if (backend, database) not in _missing_local:
+        _missing_local.add((backend, database))
+        logger.warning("本地%s索引未收录知识库 %s, 该知识库的本地检索返回空结果", backend, database)
+
+def _local_search(backend, database, q, topk):
+    # 本地检索后端, 零网络开销; CPU密集, 异步路径中需放到线程执行
+    if database not in _local_collections(backend):
+        _warn_missing_local(backend, database)
+        return []
+    if backend == 'lexical':
+        return search_lexical(database, q, topk)
+    from vector_index import search_dense
+    return search_dense(database, q, topk, 'cosine')
+
+def preload_local_indexes():
+    """
+    服务启动时加载(不存在时构建)已配置的本地索引: 检索后端、检索兜底与熔断降级所用的后端
+    避免首个查询承担数秒的加载/构建耗时; 同时检查各知识库是否已被收录
+    检索后端加载失败时抛出异常, 兜底后端加载失败只记录警告
+    """
+    backends = {config.RETRIEVAL_FALLBACK, config.CIRCUIT_SEARCH_FALLBACK if config.CIRCUIT_ENABLED else None}
+    if config.RETRIEVAL_BACKEND != 'remote':
+        backends.add(config.RETRIEVAL_BACKEND)
+    for backend in sorted(b for b in backends if b):
+        try:
+            collections = _local_collections(backend)
+            if backend == 'dense':
+                # 文本按需加载, 一并预读
+                for collection in collections.values():
+                    collection.texts
+        except Exception as e:
+            if backend == config.RETRIEVAL_BACKEND:
+                raise
+            logger.warning("本地%s索引加载失败, 兜底不可用: %s", backend, e)
+            continue
+        for database in DATABASE:
+            if database not in collections:
+                _warn_missing_local(backend, database)
+
+def _fallback_search(database, q, topk, degraded=False):
+    """
+    远程检索失败/超时时的本地兜底, 未配置兜底时返回空结果
+    Args:
+        degraded: 检索接口已熔断, 未配置 RETRIEVAL_FALLBACK 时改用 config.CIRCUIT_SEARCH_FALLBACK
+    """
+    backend = config.RETRIEVAL_FALLBACK or (config.CIRCUIT_SEARCH_FALLBACK if degraded else None)
+    if not backend:
+        return []
+    try:
+        documents = _local_search(backend, database, q, topk)
+        logger.warning("知识库 %s 使用本地%s索引兜底", database, backend)
+        return documents
+    except Exception as e:
+        logger.warning("知识库 %s 本地兜底失败: %s", database, e)
+        return []
+
+def _search_collection(database, q, topk):
+    # 检索单个知识库(优先命中缓存), 返回 [(text, score)]
+    if config.RETRIEVAL_BACKEND != 'remote':
+        return _local_search(config.RETRIEVAL_BACKEND, database, q, topk)
+    if config.RETRIEVAL_CACHE_ENABLED:
+        cached = retrieval_cache.get(database, q, topk, 'cosine')
+        if cached is not None:
+            return cached
+    if is_degraded("search"):
+        # 检索接口熔断期间不再等待上游, 直接走本地索引(结果不缓存)
+        return _fallback_search(database, q, topk, degraded=True)
+    version = retrieval_cache.version(database)
+    documents = _fetch_collection(database, q, topk)
+    if config.RETRIEVAL_CACHE_ENABLED:
+        retrieval_cache.set(database, q, topk, 'cosine', documents, version=version)
+    return documents
+
+class _SearchTask:
+    # 提交到检索线程池的单个知识库检索, 记录开始执行的时间: 截止时间从开始执行时算起, 不含排队时间
+    __slots__ = ("database", "future", "running", "started")
+
+    def __init__(self, database, q, topk):
+        self.database = database
+        self.running = threading.Event()
+        self.started = None
+        self.future = _SEARCH_POOL.submit(self._run, q, topk)
+
+    def _run(self, q, topk):
+        self.started = time.monotonic()
+        self.running.set()
+        return _search_collection(self.database, q, topk)
+
+def _submit_searches(q, topk):
+    # 将各知识库的检索提交到线程池, 返回 (q, topk, 提交时间, [_SearchTask])
+    return q, topk, time.monotonic(), [_SearchTask(database, q, topk) for database in DATABASE]
+
+def _collect_documents(q, topk, submitted, tasks):
+    """
+    收集各知识库结果(每个知识库一路), 超时或失败的知识库记录警告, 有本地兜底时改用本地结果
+    排队超过 config.SEARCH_QUEUE_TIMEOUT 仍未开始的检索被取消; 开始后至多等待 config.SEARCH_COLLECTION_DEADLINE
+    """
+    result_lists = []
+    for task in tasks:
+        database = task.database
+        try:
+            queue_left = config.SEARCH_QUEUE_TIMEOUT - (time.monotonic() - submitted)
+            if not task.running.wait(max(queue_left, 0)) and task.future.cancel():
+                logger.warning("知识库 %s 检索排队超时(>%.1fs), 已丢弃", database, config.SEARCH_QUEUE_TIMEOUT)
+                result_lists.append(_fallback_search(database, q, topk))
+                continue
+            # 取消失败说明已开始执行, 开始时间随即写入
+            task.running.wait()
+            remaining = config.SEARCH_COLLECTION_DEADLINE - (time.monotonic() - task.started)
+            result_lists.append(task.future.result(timeout=max(remaining, 0)))
+        except FutureTimeoutError:
+            logger.warning("知识库 %s 检索超时(>%.1fs), 已丢弃", database, config.SEARCH_COLLECTION_DEADLINE)
+            result_lists.append(_fallback_search(database, q, topk))
+        except Exception as e:
+            logger.warning("知识库 %s 检索失败, 已丢弃: %s", database, e)
+            result_lists.append(_fallback_search(database, q, topk, isinstance(e, CircuitOpenError)))
+    return result_lists
+
+def _merge_lists(result_lists, topk):
+    # 各路结果按配置归一化后k路归并, 去除近似重复后取topk, 返回 [(text, score)]
+    dedup_distance = config.RETRIEVAL_DEDUP_DISTANCE if config.RETRIEVAL_DEDUP_DISTANCE >= 0 else None
+    return merge_results(result_lists, topk, config.RETRIEVAL_SCORE_NORMALIZATION, dedup_distance)
+
+def _top_texts(result_lists, topk):
+    return [text for text, _ in _merge_lists(result_lists, topk)]
+
+def _top_texts_bilingual(zh_lists, en_lists, topk):
+    """
+    中英双语结果合并: 两种语言分别归并去重各取topk条(一种语言的高分结果不会挤占另一种语言的额度),
+    再按分数合并, 两种语言检索到的同一文本只保留一次
+    Args:
+        en_lists: 英文各路结果, 为None时(查询本身为英文)只按一种语言取topk
+    """
+    if en_lists is None:
+        return _top_texts(zh_lists, topk)
+    merged = sorted(_merge_lists(zh_lists, topk) + _merge_lists(en_lists, topk), key=lambda x: x[1], reverse=True)
+    texts, seen = [], set()
+    for text, _ in merged:
+        key = normalize_text(text)
+        if key not in seen:
+            seen.add(key)
+            texts.append(text)
+    return texts
+
 def search_database(q, topk):
-    documents=[]
-    for database in DATABASE:
-        if database=='common_dataset':
-            d = search_similar_files(database, 'token_common', q, topk, 'cosine')
-            documents.extend([(x['text'],x['score']) for x in d['files']])
-        else:
-            d = search_similar_files(database, token, q, topk, 'cosine')
-            documents.extend([(x['text'], x['score']) for x in d['files']])
-    doc = [x[0] for x in sorted(documents, key=lambda x: x[1], reverse=True)[:topk]]
-    return doc
-
-def search_database_bilingual(q,topk):
-    eng_q=answerLM(q,TRANSLATE_PROMPT,max_tokens=300)
-    documents = []
-    documents.extend(search_database(q,topk))
-    documents.extend(search_database(eng_q,topk))
-    return documents
\ No newline at end of file
+    # 并发检索所有知识库, 合并后按分数取topk
+    return _top_texts(_collect_documents(*_submit_searches(q, topk)), topk)
+
+def _translate_query(q):
+    # 对话接口熔断时只检索原文
+    try:
+        return translate_to_english(q)
+    except CircuitOpenError:
+        return q
+
+def search_database_bilingual(q,topk,eng_q=None):
+    """
+    中英双语检索
+    Args:
+        eng_q: 可选的英文译文, 为空时在此翻译; 查询本身为英文时只检索一次
+    """
+    # 中文检索先行提交, 与翻译调用并行进行
+    zh_searches = _submit_searches(q, topk)
+    if eng_q is None:
+        eng_q = _translate_query(q)
+    en_searches = _submit_searches(eng_q, topk) if eng_q != q else None
+    return _collect_bilingual((zh_searches, en_searches), topk)
+
+# ========== 异步版本 ==========
+
+async def _fetch_collection_async(database, q, topk):
+    collection_token = config.COMMON_DATASET_TOKEN if database == 'common_dataset' else token
+    if config.SEARCH_BATCH_PATH:
+        fetch = lambda: search_batcher_async.submit((database, collection_token, topk, 'cosine'), q)
+    else:
+        fetch = lambda: search_similar_files_async(database, collection_token, q, topk, 'cosine',
+                                                   timeout=config.SEARCH_COLLECTION_DEADLINE)
+    if config.SINGLE_FLIGHT_ENABLED:
+        d = await search_flight_async.do((database, normalize_text(q), topk, 'cosine'), fetch)
+    else:
+        d = await fetch()
+    return [(x['text'], x['score']) for x in d['files']]
+
+async def _search_collection_async(database, q, topk):
+    # 本地检索与兜底在线程中执行, 不阻塞事件循环
+    if config.RETRIEVAL_BACKEND != 'remote':
+        return await asyncio.to_thread(_local_search, config.RETRIEVAL_BACKEND, database, q, topk)
+    if config.RETRIEVAL_CACHE_ENABLED:
+        cached = retrieval_cache.get(database, q, topk, 'cosine')
+        if cached is not None:
+            return cached
+    if is_degraded("search"):
+        return await asyncio.to_thread(_fallback_search, database, q, topk, True)
+    version = retrieval_cache.version(database)
+    documents = await _fetch_collection_async(database, q, topk)
+    if config.RETRIEVAL_CACHE_ENABLED:
+        retrieval_cache.set(database, q, topk, 'cosine', documents, version=version)
+    return documents
+
+async def _search_collection_within_deadline(database, q, topk):
+    # 超时或失败的知识库记录警告, 返回本地兜底结果(未配置时为空)
+    try:
+        return await asyncio.wait_for(_search_collection_async(database, q, topk), config.SEARCH_COLLECTION_DEADLINE)
+    except asyncio.TimeoutError:
+        logger.warning("知识库 %s 检索超时(>%.1fs), 已丢弃", database, config.SEARCH_COLLECTION_DEADLINE)
+    except Exception as e:
+        logger.warning("知识库 %s 检索失败, 已丢弃: %s", database, e)
+        return await asyncio.to_thread(_fallback_search, database, q, topk, isinstance(e, CircuitOpenError))
+    return await asyncio.to_thread(_fallback_search, database, q, topk)
+
+async def _gather_collections_async(q, topk):
+    return list(await asyncio.gather(*[_search_collection_within_deadline(database, q, topk)
+                                       for database in DATABASE]))
+
+async def search_database_async(q, topk):
+    return _top_texts(await _gather_collections_async(q, topk), topk)
+
+async def search_database_bilingual_async(q, topk, eng_q=None):
+    # 中文检索与翻译并发进行
+    zh_task = asyncio.ensure_future(_gather_collections_async(q, topk))
+    try:
+        if eng_q is None:
+            try:
+                eng_q = await translate_to_english_async(q)
+            except CircuitOpenError:
+                eng_q = q
+        en_lists = await _gather_collections_async(eng_q, topk) if eng_q != q else None
+    except BaseException:
+        zh_task.cancel()
+        raise
+    return _top_texts_bilingual(await zh_task, en_lists, topk)
@@ -1,24 +1,27 @@
-import requests
 import json
 import re
 from typing import List, Dict, Optional
 from pathlib import Path
 
+import config
+from api_client import retrieval_cache
+from transport import get_transport
+
 class KnowledgeBaseBuilder:
     # 知识库构建类
-    def __init__(self, token: str, base_url: str = "http://10.1.0.220:9002"):
-        self.token = token
-        self.base_url = base_url
+    def __init__(self, token: Optional[str] = None, base_url: Optional[str] = None):
+        self.token = token or config.API_TOKEN
+        self.base_url = (base_url or config.API_BASE_URL).rstrip("/")
+        self.transport = get_transport(self.base_url)
     
     def create_database(self, database_name: str, metric_type: str = "COSINE") -> dict:
         # 创建向量数据库
-        url = f"{self.base_url}/api/databases"
         payload = {
             "token": self.token,
             "database_name": database_name,
             "metric_type": metric_type
         }
-        response = requests.post(url, json=payload)
+        response = self.transport.post("/api/databases", endpoint="databases", json=payload)
         # 检查响应状态
         if response.status_code != 200:
             print(f"Error: HTTP {response.status_code}")
@@ -33,8 +36,7 @@ class KnowledgeBaseBuilder:
     
     def list_databases(self) -> dict:
         # 列出所有数据库
-        url = f"{self.base_url}/api/databases"
-        response = requests.get(url, params={"token": self.token})
+        response = self.transport.get("/api/databases", endpoint="databases", params={"token": self.token})
         if response.status_code != 200:
             print(f"Error: HTTP {response.status_code}")
             return {"status": "error", "message": response.text}
@@ -46,15 +48,16 @@ class KnowledgeBaseBuilder:
     
     def upload_files(self, database_name: str, files: List[Dict]) -> dict:
         # 批量上传文件到数据库
-        url = f"{self.base_url}/api/databases/{database_name}/files"
         payload = {
             "token": self.token,
             "files": files
         }
-        response = requests.post(url, json=payload)
+        response = self.transport.post(f"/api/databases/{database_name}/files", endpoint="databases", json=payload)
         if response.status_code != 200:
             print(f"Error: HTTP {response.status_code}")
             return {"status": "error", "message": response.text}
+        # 上传成功后使该库的检索缓存失效(本进程与通过标记文件感知的服务进程)
+        retrieval_cache.invalidate_collection(database_name)
         try:
             return response.json()
         except Exception as e:
@@ -1,14 +1,16 @@
-from blacklist import get_blacklist
+from typing import List
+from blacklist import BlacklistHit, get_matcher
 from safety_agent import is_input_safe, is_output_safe
 
+def scan_user_input(user_input) -> List[BlacklistHit]:
+    # 返回输入命中的全部黑名单规则(含类别与规则组)
+    return get_matcher().match_all(user_input)
+
 def validate_user_input(user_input):
-    blacklist = get_blacklist()
-    user_input_lower = user_input.lower()
-    for category, pattern_groups in blacklist.items():
-        for pattern_type, patterns in pattern_groups.items():
-            for pattern in patterns:
-                if pattern.lower() in user_input_lower:
-                    return False, f"触发黑名单: {category}/{pattern_type} - '{pattern}'"
+    hits = scan_user_input(user_input)
+    if hits:
+        hit = hits[0]
+        return False, f"触发黑名单: {hit.category}/{hit.pattern_type} - '{hit.pattern}'"
     return True, "通过黑名单检测"
         
 def validate_prompt(prompt):
@@ -1,7 +1,17 @@
 # 意图识别模块，区分用户的真实意图：学习知识 vs 实施攻击
 
 import json
-from api_client import dialogue
+import logging
+import threading
+import time
+
+import config
+from api_client import dialogue, dialogue_async
+from llm_scheduler import GUARD
+from intent_prefilter import prefilter_intent
+
+logger = logging.getLogger(__name__)
+_log_lock = threading.Lock()
 
 INTENT_CLASSIFICATION_PROMPT = """
 你是一个安全意图分类器。分析用户输入，判断其真实意图。
@@ -69,9 +79,68 @@ INTENT_CLASSIFICATION_PROMPT = """
 现在分析以下用户输入：
 """
 
+def _parse_intent_response(response: dict) -> dict:
+    # 从LLM响应中解析意图JSON
+    result_text = response.get("response", "").strip()
+    # 尝试提取JSON（可能包含markdown代码块）
+    if "```json" in result_text:
+        result_text = result_text.split("```json")[1].split("```")[0].strip()
+    elif "```" in result_text:
+        result_text = result_text.split("```")[1].split("```")[0].strip()
+    return json.loads(result_text)
+
+def _fallback_intent(e: Exception) -> dict:
+    logger.warning("意图识别失败: %s", e)
+    # 失败时默认为灰色地带，进入下一层检测
+    return {
+        "intent": "GREY",
+        "confidence": 0.5,
+        "reason": f"解析失败: {str(e)}",
+        "keywords": []
+    }
+
+def _log_intent(user_input: str, result: dict):
+    # LLM分类结果追加写入JSONL, 作为本地预分类模型的训练数据
+    if not config.INTENT_LOG_PATH:
+        return
+    entry = {"time": time.time(), "text": user_input, "intent": result.get("intent"),
+             "confidence": result.get("confidence")}
+    with _log_lock:
+        try:
+            with open(config.INTENT_LOG_PATH, "a", encoding="utf-8") as f:
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        except OSError as e:
+            logger.warning("写入意图分类记录失败: %s", e)
+
+def classify_intent_llm(user_input: str) -> dict:
+    # 仅使用LLM分类(不经本地预分类), 调用或解析失败时抛出异常
+    response = dialogue(
+        user_input=user_input,
+        custom_prompt=INTENT_CLASSIFICATION_PROMPT,
+        temperature=0.1,
+        cacheable=True,
+        priority=GUARD
+    )
+    result = _parse_intent_response(response)
+    _log_intent(user_input, result)
+    return result
+
+async def classify_intent_llm_async(user_input: str) -> dict:
+    # classify_intent_llm 的异步版本
+    response = await dialogue_async(
+        user_input=user_input,
+        custom_prompt=INTENT_CLASSIFICATION_PROMPT,
+        temperature=0.1,
+        cacheable=True,
+        priority=GUARD
+    )
+    result = _parse_intent_response(response)
+    _log_intent(user_input, result)
+    return result
+
 def classify_intent(user_input: str) -> dict:
     """
-    使用LLM对用户输入进行意图分类
+    对用户输入进行意图分类: 本地预分类置信度足够时直接返回, 否则使用LLM分类
     Args:
         user_input: 用户输入文本
     Returns:
@@ -82,40 +151,33 @@ def classify_intent(user_input: str) -> dict:
             "keywords": list
         }
     """
+    prefiltered = prefilter_intent(user_input)
+    if prefiltered is not None:
+        return prefiltered
     try:
-        response = dialogue(
-            user_input=user_input,
-            custom_prompt=INTENT_CLASSIFICATION_PROMPT,
-            temperature=0.1
-        )
-        result_text = response.get("response", "").strip()
-        # 尝试提取JSON（可能包含markdown代码块）
-        if "```json" in result_text:
-            result_text = result_text.split("```json")[1].split("```")[0].strip()
-        elif "```" in result_text:
-            result_text = result_text.split("```")[1].split("```")[0].strip()
-        result = json.loads(result_text)
-        return result
+        return classify_intent_llm(user_input)
     except Exception as e:
-        print(f"意图识别失败: {e}")
-        # 失败时默认为灰色地带，进入下一层检测
-        return {
-            "intent": "GREY",
-            "confidence": 0.5,
-            "reason": f"解析失败: {str(e)}",
-            "keywords": []
-        }
+        return _fallback_intent(e)
 
-def validate_by_intent(user_input: str) -> tuple:
+async def classify_intent_async(user_input: str) -> dict:
+    # classify_intent 的异步版本
+    prefiltered = prefilter_intent(user_input)
+    if prefiltered is not None:
+        return prefiltered
+    try:
+        return await classify_intent_llm_async(user_input)
+    except Exception as e:
+        return _fallback_intent(e)
+
+def decide_by_intent(intent_result: dict) -> tuple:
     """
-    基于意图识别的验证
+    根据已有的意图分类结果做出放行/拦截决策
     Returns:
         (bool/str, str/dict): 
             - (True, "原因") - 直接放行
             - (False, "原因") - 直接拦截
             - ("CONTINUE", intent_result) - 需要进一步AI检测
     """
-    intent_result = classify_intent(user_input)
     intent = intent_result.get("intent", "GREY")
     confidence = intent_result.get("confidence", 0.5)
     # 知识学习和防御实践：高置信度直接放行
@@ -130,6 +192,14 @@ def validate_by_intent(user_input: str) -> tuple:
     # 灰色地带或低置信度：进入下一层AI检测
     return "CONTINUE",intent_result
 
+def validate_by_intent(user_input: str) -> tuple:
+    """
+    基于意图识别的验证
+    Returns:
+        同 decide_by_intent
+    """
+    return decide_by_intent(classify_intent(user_input))
+
 # 辅助函数
 def get_intent_label(intent_result: dict) -> str:
     """获取易读的意图标签"""
@@ -0,0 +1,297 @@
+# 本地意图预分类：字符n-gram哈希特征 + 多类逻辑回归, 置信度经温度缩放校准
+# 置信度达到阈值时直接给出 KNOWLEDGE/DEFENSE/ATTACK, 否则(或判为GREY时)交由LLM意图分类
+#
+# 训练数据为JSONL, 每行 {"text": ..., "intent": ...}, 标签来自LLM分类结果:
+# test/ 下的评测语料经 label 命令标注, 线上流量见 config.INTENT_LOG_PATH
+#
+# 用法:
+#   python intent_prefilter.py label --output intent_labels.jsonl   # 用LLM标注 test/ 语料
+#   python intent_prefilter.py train intent_labels.jsonl intent_log.jsonl
+#   python intent_prefilter.py predict "什么是XSS?"
+
+import argparse
+import json
+import logging
+import re
+import threading
+import unicodedata
+import zlib
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+import config
+
+logger = logging.getLogger(__name__)
+
+INTENTS = ("KNOWLEDGE", "DEFENSE", "ATTACK", "GREY")
+# 只有这些类别可以由本地模型直接给出, GREY 总是交给LLM
+CONFIDENT_INTENTS = ("KNOWLEDGE", "DEFENSE", "ATTACK")
+# 会被 decide_by_intent 直接放行的类别, 跳过后续全部检测, 需 INTENT_PREFILTER_ALLOW 显式开启
+ALLOW_INTENTS = ("KNOWLEDGE", "DEFENSE")
+NGRAM_RANGE = (1, 3)
+_SPACES = re.compile(r"\s+")
+
+
+def featurize(text: str, dim: int) -> Tuple[np.ndarray, float]:
+    """
+    字符n-gram哈希特征(二值, L2归一化)
+    Returns:
+        (去重后的特征下标, 每个特征的取值)
+    """
+    text = _SPACES.sub(" ", unicodedata.normalize("NFKC", text).lower().strip())
+    # 首尾标记使短文本的开头/结尾模式(如"什么是..."、"...吗?")成为独立特征
+    text = "\x02" + text + "\x03"
+    indices = set()
+    for n in range(NGRAM_RANGE[0], NGRAM_RANGE[1] + 1):
+        for i in range(len(text) - n + 1):
+            indices.add(zlib.crc32(text[i:i + n].encode("utf-8")) & (dim - 1))
+    indices = np.fromiter(indices, dtype=np.int64, count=len(indices))
+    return indices, 1.0 / np.sqrt(len(indices))
+
+
+def _softmax(logits: np.ndarray) -> np.ndarray:
+    logits = logits - logits.max(axis=-1, keepdims=True)
+    exp = np.exp(logits)
+    return exp / exp.sum(axis=-1, keepdims=True)
+
+
+class IntentPrefilter:
+    """
+    Args:
+        weights: (dim, 类别数) 权重矩阵, dim 须为2的幂
+        temperature: 温度缩放系数, 由留出集拟合
+    """
+    def __init__(self, weights: np.ndarray, bias: np.ndarray, classes: Sequence[str], temperature: float = 1.0,
+                 meta: Optional[dict] = None):
+        self.weights = weights
+        self.bias = bias
+        self.classes = list(classes)
+        self.temperature = temperature
+        self.meta = meta or {}
+        self.dim = weights.shape[0]
+
+    def predict_proba(self, text: str) -> np.ndarray:
+        indices, value = featurize(text, self.dim)
+        logits = self.weights[indices].sum(axis=0) * value + self.bias
+        return _softmax(logits / self.temperature)
+
+    def predict(self, text: str) -> Tuple[str, float]:
+        # 返回 (意图, 校准后的置信度)
+        proba = self.predict_proba(text)
+        best = int(proba.argmax())
+        return self.classes[best], float(proba[best])
+
+    def save(self, path: Path):
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(path.name + ".tmp")
+        with open(tmp, "wb") as f:
+            np.savez_compressed(f, weights=self.weights, bias=self.bias, classes=np.array(self.classes),
+                                temperature=np.float64(self.temperature),
+                                meta=np.array(json.dumps(self.meta, ensure_ascii=False)))
+        tmp.replace(path)
+
+    @classmethod
+    def load(cls, path: Path) -> "IntentPrefilter":
+        with np.load(path, allow_pickle=False) as data:
+            return cls(data["weights"], data["bias"], [str(c) for c in data["classes"]],
+                       float(data["temperature"]), json.loads(str(data["meta"])))
+
+
+# ========== 训练 ==========
+
+def load_labeled(paths: Iterable[Path], min_confidence: float = 0.0) -> List[Tuple[str, str]]:
+    """
+    读取 {"text", "intent", "confidence"} JSONL, 同一文本以最后出现的标签为准(日志中较新的LLM结论)
+    Args:
+        min_confidence: 丢弃LLM置信度低于该值的标签
+    """
+    labeled: Dict[str, str] = {}
+    for path in paths:
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                item = json.loads(line)
+                if item.get("confidence", 1.0) < min_confidence:
+                    continue
+                if item.get("intent") in INTENTS and item.get("text"):
+                    labeled[item["text"]] = item["intent"]
+    return list(labeled.items())
+
+
+def _design_matrix(texts: Sequence[str], dim: int):
+    # 稀疏矩阵(CSR): 各行特征下标拼接, indptr 为每行起点
+    rows = [featurize(text, dim) for text in texts]
+    indices = np.concatenate([idx for idx, _ in rows])
+    values = np.concatenate([np.full(len(idx), value, dtype=np.float32) for idx, value in rows])
+    indptr = np.cumsum([0] + [len(idx) for idx, _ in rows])
+    return indices, values, indptr
+
+
+def _logits(weights, bias, indices, values, indptr):
+    return np.add.reduceat(weights[indices] * values[:, None], indptr[:-1], axis=0) + bias
+
+
+def _fit_temperature(logits: np.ndarray, labels: np.ndarray) -> float:
+    # 在留出集上网格搜索使负对数似然最小的温度
+    best_t, best_nll = 1.0, np.inf
+    for t in np.exp(np.linspace(np.log(0.05), np.log(10.0), 81)):
+        proba = _softmax(logits / t)
+        nll = -np.log(proba[np.arange(len(labels)), labels] + 1e-12).mean()
+        if nll < best_nll:
+            best_t, best_nll = float(t), nll
+    return best_t
+
+
+def train(samples: Sequence[Tuple[str, str]], dim: int = 1 << 18, epochs: int = 200, lr: float = 0.2,
+          l2: float = 1e-5, holdout: float = 0.2, seed: int = 0) -> IntentPrefilter:
+    """
+    训练多类逻辑回归(全批量Adam, 类别加权), 并在留出集上拟合温度
+    Args:
+        samples: [(text, intent)]
+        holdout: 用于温度校准与评估的样本比例; 留出样本不足20条时不做校准
+    """
+    if dim & (dim - 1):
+        raise ValueError(f"特征维度须为2的幂: {dim}")
+    classes = [c for c in INTENTS if any(label == c for _, label in samples)]
+    if len(classes) < 2:
+        raise ValueError(f"训练数据至少需要两个类别, 当前仅有: {classes}")
+    rng = np.random.default_rng(seed)
+    order = rng.permutation(len(samples))
+    n_holdout = int(len(samples) * holdout) if len(samples) * holdout >= 20 else 0
+    held = [samples[i] for i in order[:n_holdout]]
+    fit = [samples[i] for i in order[n_holdout:]]
+
+    labels = np.array([classes.index(label) for _, label in fit])
+    indices, values, indptr = _design_matrix([text for text, _ in fit], dim)
+    row_of = np.repeat(np.arange(len(fit)), np.diff(indptr))
+    onehot = np.eye(len(classes), dtype=np.float32)[labels]
+    # 类别加权, 避免少数类(通常是ATTACK)被淹没
+    counts = np.bincount(labels, minlength=len(classes))
+    sample_weight = (len(labels) / (len(classes) * counts))[labels].astype(np.float32) / len(labels)
+
+    weights = np.zeros((dim, len(classes)), dtype=np.float32)
+    bias = np.zeros(len(classes), dtype=np.float32)
+    params = [weights, bias]
+    moments = [[np.zeros_like(p), np.zeros_like(p)] for p in params]
+    beta1, beta2, eps = 0.9, 0.999, 1e-8
+    for step in range(1, epochs + 1):
+        proba = _softmax(_logits(weights, bias, indices, values, indptr))
+        delta = (proba - onehot) * sample_weight[:, None]
+        grad_w = np.zeros_like(weights)
+        np.add.at(grad_w, indices, delta[row_of] * values[:, None])
+        grad_w += l2 * weights
+        grads = [grad_w, delta.sum(axis=0)]
+        for param, grad, (m, v) in zip(params, grads, moments):
+            m *= beta1
+            m += (1 - beta1) * grad
+            v *= beta2
+            v += (1 - beta2) * grad * grad
+            param -= lr * (m / (1 - beta1 ** step)) / (np.sqrt(v / (1 - beta2 ** step)) + eps)
+
+    temperature, meta = 1.0, {"train_size": len(fit), "holdout_size": len(held),
+                              "class_counts": dict(zip(classes, counts.tolist()))}
+    if held:
+        held_labels = np.array([classes.index(label) for _, label in held])
+        held_logits = _logits(weights, bias, *_design_matrix([text for text, _ in held], dim))
+        temperature = _fit_temperature(held_logits, held_labels)
+        meta["holdout_accuracy"] = float((held_logits.argmax(axis=1) == held_labels).mean())
+    meta["temperature"] = temperature
+    return IntentPrefilter(weights, bias, classes, temperature, meta)
+
+
+# ========== 运行时 ==========
+
+_prefilter: Optional[IntentPrefilter] = None
+_loaded = False
+_load_lock = threading.Lock()
+
+
+def get_prefilter() -> Optional[IntentPrefilter]:
+    # 进程内单例; 未启用或模型文件不存在时返回None(全部走LLM分类)
+    global _prefilter, _loaded
+    if not _loaded:
+        with _load_lock:
+            if not _loaded:
+                path = Path(config.INTENT_PREFILTER_PATH)
+                if config.INTENT_PREFILTER_ENABLED and path.exists():
+                    _prefilter = IntentPrefilter.load(path)
+                elif config.INTENT_PREFILTER_ENABLED:
+                    logger.info("意图预分类模型 %s 不存在, 全部使用LLM分类", path)
+                _loaded = True
+    return _prefilter
+
+
+def prefilter_intent(user_input: str, threshold: Optional[float] = None) -> Optional[dict]:
+    """
+    本地预分类, 置信度达到阈值时返回与 classify_intent 相同格式的结果(附 "source": "prefilter"), 否则返回None
+    默认只直接给出 ATTACK(拦截); KNOWLEDGE/DEFENSE 会跳过模式检测与AI输入检测, 仅在 INTENT_PREFILTER_ALLOW 开启时返回
+    """
+    model = get_prefilter()
+    # 超长输入不做本地判断: 延迟有上界, 也避免在大段正常文本后夹带攻击请求
+    if model is None or len(user_input) > config.INTENT_PREFILTER_MAX_CHARS:
+        return None
+    threshold = config.INTENT_PREFILTER_THRESHOLD if threshold is None else threshold
+    intent, confidence = model.predict(user_input)
+    if intent not in CONFIDENT_INTENTS or confidence < threshold:
+        return None
+    if intent in ALLOW_INTENTS and not config.INTENT_PREFILTER_ALLOW:
+        return None
+    return {
+        "intent": intent,
+        "confidence": round(confidence, 4),
+        "reason": "本地预分类",
+        "keywords": [],
+        "source": "prefilter",
+    }
+
+
+def load_eval_corpus(root: Path = Path(__file__).parent / "test") -> List[str]:
+    # test/test.json 为每行一个JSON对象, cs_eval 为JSON数组
+    texts = []
+    with open(root / "test.json", "r", encoding="utf-8") as f:
+        texts.extend(json.loads(line)["question"] for line in f if line.strip())
+    with open(root / "cs_eval_question_AI_Cybersecurity.json", "r", encoding="utf-8") as f:
+        texts.extend(item["prompt"] for item in json.load(f))
+    return texts
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="本地意图预分类")
+    sub = parser.add_subparsers(dest="command", required=True)
+    label_parser = sub.add_parser("label", help="用LLM意图分类标注 test/ 语料")
+    label_parser.add_argument("--output", required=True)
+    train_parser = sub.add_parser("train", help="从标注JSONL训练模型")
+    train_parser.add_argument("data", nargs="+")
+    train_parser.add_argument("--output", default=config.INTENT_PREFILTER_PATH)
+    train_parser.add_argument("--dim", type=int, default=1 << 18)
+    train_parser.add_argument("--epochs", type=int, default=200)
+    train_parser.add_argument("--min-confidence", type=float, default=0.7, help="丢弃LLM置信度低于该值的标签")
+    predict_parser = sub.add_parser("predict", help="预测测试")
+    predict_parser.add_argument("text")
+    args = parser.parse_args()
+
+    if args.command == "label":
+        from intent_classifier import classify_intent_llm
+        with open(args.output, "w", encoding="utf-8") as f:
+            for text in load_eval_corpus():
+                try:
+                    result = classify_intent_llm(text)
+                except Exception as e:
+                    logger.warning("标注失败, 已跳过: %s", e)
+                    continue
+                f.write(json.dumps({"text": text, "intent": result.get("intent"),
+                                    "confidence": result.get("confidence")}, ensure_ascii=False) + "\n")
+        print(f"已写出 {args.output}")
+    elif args.command == "train":
+        samples = load_labeled((Path(p) for p in args.data), args.min_confidence)
+        model = train(samples, dim=args.dim, epochs=args.epochs)
+        model.save(Path(args.output))
+        print(f"已写出 {args.output}: {json.dumps(model.meta, ensure_ascii=False)}")
+    else:
+        model = IntentPrefilter.load(Path(config.INTENT_PREFILTER_PATH))
+        proba = model.predict_proba(args.text)
+        print("  ".join(f"{c}={p:.3f}" for c, p in zip(model.classes, proba)))
@@ -0,0 +1,302 @@
+# 本地词法检索引擎：基于 knowledge/ 语料构建倒排索引, BM25打分, 零网络开销
+# 分词：英文按单词, 中日韩文字按字符二元组(bigram)
+# 索引以紧凑二进制格式持久化, 启动时通过 mmap 映射, 倒排表不整体读入内存
+#
+# 用法:
+#   python lexical_index.py build            # 从 knowledge/ 构建索引
+#   python lexical_index.py search "SQL注入" # 检索测试
+
+import argparse
+import array
+import heapq
+import json
+import logging
+import math
+import mmap
+import re
+import struct
+import threading
+import unicodedata
+from collections import Counter, defaultdict
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import config
+from utils import is_cjk
+
+logger = logging.getLogger(__name__)
+
+_MAGIC = b"ADBLEX01"
+_WORD = re.compile(r"[a-z0-9][a-z0-9_\-]*")
+_STOPWORDS = frozenset(
+    "a an and are as at be by for from has have in is it its of on or that the this to was were will with".split()
+)
+# BM25参数
+K1 = 1.2
+B = 0.75
+
+_KNOWLEDGE_DIR = Path(__file__).parent / "knowledge"
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    CJK感知分词
+    英文/数字按单词切分(去停用词), 连续的CJK字符切为字符二元组, 单个CJK字符保留为一元
+    """
+    text = unicodedata.normalize("NFKC", text).lower()
+    tokens = []
+    run = []
+    for ch in text + " ":
+        if is_cjk(ch):
+            run.append(ch)
+            continue
+        if run:
+            tokens.extend(run if len(run) == 1 else [run[i] + run[i + 1] for i in range(len(run) - 1)])
+            run = []
+    tokens.extend(w for w in _WORD.findall(text) if w not in _STOPWORDS)
+    return tokens
+
+
+# ========== 语料加载 ==========
+
+def load_attack_documents(path: Path) -> List[str]:
+    # ATT&CK STIX: 取未废弃的技术/缓解/软件/组织等对象的名称与描述
+    with open(path, "r", encoding="utf-8") as f:
+        objects = json.load(f)["objects"]
+    documents = []
+    for obj in objects:
+        if obj.get("type") == "relationship" or obj.get("revoked") or obj.get("x_mitre_deprecated"):
+            continue
+        description = obj.get("description")
+        if description:
+            documents.append(f"{obj.get('name', '')}\n{description}".strip())
+    return documents
+
+
+def load_d3fend_documents(path: Path) -> List[str]:
+    # D3FEND JSON-LD: 取带定义的节点
+    with open(path, "r", encoding="utf-8") as f:
+        graph = json.load(f)["@graph"]
+    documents = []
+    for node in graph:
+        definition = node.get("d3f:definition")
+        if isinstance(definition, str) and definition.strip():
+            label = node.get("rdfs:label")
+            label = label if isinstance(label, str) else node.get("@id", "")
+            documents.append(f"{label}: {definition.strip()}")
+    return documents
+
+
+def load_owasp_documents(directory: Path) -> List[str]:
+    from database_builder import load_markdown_file
+    documents = []
+    for path in sorted(directory.glob("*.md")):
+        title = path.stem.replace("_", " ")
+        # 丢弃代码围栏等几乎没有正文的碎片
+        documents.extend(f"[{title}] {item['file']}" for item in load_markdown_file(str(path))
+                         if len(tokenize(item["file"])) >= 5)
+    return documents
+
+
+def load_knowledge_corpus(knowledge_dir: Path = _KNOWLEDGE_DIR) -> Dict[str, List[str]]:
+    # 知识库名 -> 文档列表, 知识库名与远程向量库一致
+    return {
+        "student_Group3_ATT_CK": load_attack_documents(knowledge_dir / "ATT_CK_ics-attack.json"),
+        "student_Group3_D3FEND": load_d3fend_documents(knowledge_dir / "D3FEND_d3fend.json"),
+        "student_Group3_OWASP": load_owasp_documents(knowledge_dir / "OWASP_CHEATSHEETS"),
+    }
+
+
+# ========== 索引 ==========
+
+def _pad(buf: bytearray):
+    buf.extend(b"\0" * (-len(buf) % 8))
+
+
+def build_index(corpus: Dict[str, Iterable[str]], path: Path) -> Path:
+    """
+    构建并写出索引文件
+    文件布局: MAGIC | 头部长度(u64) | 头部JSON | 8字节对齐的二进制段
+    二进制段: 文档长度(u32) 文档所属库(u16) 文本偏移(u64) 倒排文档号(u32) 倒排词频(u16) 文本(utf-8)
+    """
+    collections = list(corpus)
+    doc_lens, doc_colls, texts = array.array("I"), array.array("H"), []
+    postings: Dict[str, List[Tuple[int, int]]] = defaultdict(list)
+    for coll_id, name in enumerate(collections):
+        for text in corpus[name]:
+            doc_id = len(texts)
+            counts = Counter(tokenize(text))
+            for term, tf in counts.items():
+                postings[term].append((doc_id, min(tf, 0xFFFF)))
+            texts.append(text)
+            doc_lens.append(sum(counts.values()))
+            doc_colls.append(coll_id)
+
+    vocab = {}
+    post_docs, post_tfs = array.array("I"), array.array("H")
+    for term in sorted(postings):
+        entries = postings[term]
+        vocab[term] = [len(post_docs), len(entries)]
+        post_docs.extend(doc_id for doc_id, _ in entries)
+        post_tfs.extend(tf for _, tf in entries)
+
+    text_offsets, blob = array.array("Q"), bytearray()
+    for text in texts:
+        text_offsets.append(len(blob))
+        blob.extend(text.encode("utf-8"))
+    text_offsets.append(len(blob))
+
+    body = bytearray()
+    sections = {}
+    for name, data in (("doc_lens", doc_lens), ("doc_colls", doc_colls), ("text_offsets", text_offsets),
+                       ("post_docs", post_docs), ("post_tfs", post_tfs)):
+        sections[name] = [len(body), len(data)]
+        body.extend(data.tobytes())
+        _pad(body)
+    sections["text"] = [len(body), len(blob)]
+    body.extend(blob)
+
+    header = json.dumps({
+        "collections": collections,
+        "num_docs": len(texts),
+        "avgdl": (sum(doc_lens) / len(doc_lens)) if doc_lens else 0.0,
+        "sections": sections,
+        "vocab": vocab,
+    }, ensure_ascii=False).encode("utf-8")
+    head = bytearray(_MAGIC + struct.pack("<Q", len(header)) + header)
+    _pad(head)
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(path.suffix + ".tmp")
+    with open(tmp, "wb") as f:
+        f.write(head)
+        f.write(body)
+    tmp.replace(path)
+    return path
+
+
+class LexicalIndex:
+    # 只读BM25索引, 倒排表与文本通过mmap按需访问
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self._file = open(self.path, "rb")
+        self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._mm[:len(_MAGIC)] != _MAGIC:
+            raise ValueError(f"不是有效的词法索引文件: {path}")
+        (header_len,) = struct.unpack_from("<Q", self._mm, len(_MAGIC))
+        header_start = len(_MAGIC) + 8
+        header = json.loads(self._mm[header_start:header_start + header_len].decode("utf-8"))
+        base = header_start + header_len + (-(header_start + header_len) % 8)
+        self.collections: List[str] = header["collections"]
+        self.num_docs: int = header["num_docs"]
+        self.avgdl: float = header["avgdl"] or 1.0
+        self.vocab: Dict[str, List[int]] = header["vocab"]
+        self._views = []
+        view = memoryview(self._mm)
+        sections = header["sections"]
+
+        def section(name, fmt):
+            offset, count = sections[name]
+            size = struct.calcsize(fmt)
+            raw = view[base + offset:base + offset + count * size]
+            self._views.extend([raw, raw.cast(fmt)])
+            return self._views[-1]
+
+        self._views.append(view)
+
+        self._doc_lens = section("doc_lens", "I")
+        self._doc_colls = section("doc_colls", "H")
+        self._text_offsets = section("text_offsets", "Q")
+        self._post_docs = section("post_docs", "I")
+        self._post_tfs = section("post_tfs", "H")
+        self._text_base = base + sections["text"][0]
+
+    def text(self, doc_id: int) -> str:
+        start = self._text_base + self._text_offsets[doc_id]
+        end = self._text_base + self._text_offsets[doc_id + 1]
+        return self._mm[start:end].decode("utf-8")
+
+    def search(self, query: str, top_k: int = 5, collection: Optional[str] = None) -> List[Tuple[str, float]]:
+        """
+        BM25检索
+        Args:
+            collection: 只在指定知识库内检索, 为空时检索全部
+        Returns:
+            [(text, bm25_score)] 按分数降序
+        """
+        coll_id = None
+        if collection is not None:
+            if collection not in self.collections:
+                return []
+            coll_id = self.collections.index(collection)
+        scores: Dict[int, float] = defaultdict(float)
+        for term in set(tokenize(query)):
+            entry = self.vocab.get(term)
+            if entry is None:
+                continue
+            offset, df = entry
+            idf = math.log(1 + (self.num_docs - df + 0.5) / (df + 0.5))
+            for i in range(offset, offset + df):
+                doc_id = self._post_docs[i]
+                if coll_id is not None and self._doc_colls[doc_id] != coll_id:
+                    continue
+                tf = self._post_tfs[i]
+                norm = K1 * (1 - B + B * self._doc_lens[doc_id] / self.avgdl)
+                scores[doc_id] += idf * tf * (K1 + 1) / (tf + norm)
+        top = heapq.nlargest(top_k, scores.items(), key=lambda x: x[1])
+        return [(self.text(doc_id), score) for doc_id, score in top]
+
+    def close(self):
+        # 先释放对mmap的导出视图, 否则无法关闭
+        for view in reversed(self._views):
+            view.release()
+        self._mm.close()
+        self._file.close()
+
+
+_index: Optional[LexicalIndex] = None
+_index_lock = threading.Lock()
+
+
+def get_lexical_index() -> LexicalIndex:
+    # 进程内单例; 索引文件不存在时从 knowledge/ 构建
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                path = Path(config.LEXICAL_INDEX_PATH)
+                if not path.exists():
+                    logger.warning("词法索引 %s 不存在, 正在从 knowledge/ 构建", path)
+                    build_index(load_knowledge_corpus(), path)
+                _index = LexicalIndex(path)
+    return _index
+
+
+def search_lexical(database: str, query: str, top_k: int) -> List[Tuple[str, float]]:
+    """
+    在本地词法索引中检索指定知识库, 分数映射到(0, 1)以便与向量检索分数合并
+    本地索引未收录的知识库返回空列表
+    """
+    index = get_lexical_index()
+    return [(text, score / (score + config.LEXICAL_SCORE_PIVOT))
+            for text, score in index.search(query, top_k, collection=database)]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="本地BM25词法索引")
+    sub = parser.add_subparsers(dest="command", required=True)
+    build_parser = sub.add_parser("build", help="从 knowledge/ 构建索引")
+    build_parser.add_argument("--output", default=config.LEXICAL_INDEX_PATH)
+    search_parser = sub.add_parser("search", help="检索测试")
+    search_parser.add_argument("query")
+    search_parser.add_argument("--top-k", type=int, default=5)
+    search_parser.add_argument("--collection", default=None)
+    args = parser.parse_args()
+    if args.command == "build":
+        corpus = load_knowledge_corpus()
+        output = build_index(corpus, Path(args.output))
+        counts = ", ".join(f"{name}={len(docs)}" for name, docs in corpus.items())
+        print(f"已写出 {output} ({output.stat().st_size / 1e6:.1f} MB): {counts}")
+    else:
+        for text, score in get_lexical_index().search(args.query, args.top_k, collection=args.collection):
+            print(f"{score:7.3f}  {text[:120]!r}")
@@ -0,0 +1,278 @@
+# 上游LLM调用的全局调度: 所有 dialogue 调用(同步线程与asyncio共用)在发出前申请运行名额
+#   - 全局在途上限 config.LLM_MAX_INFLIGHT
+#   - 优先级(高 -> 低): guard(意图/上下文/输入输出安全检测) > helper(翻译、问题分解等检索辅助)
+#                       > answer(回答生成) > refine(迭代检索改写、后台摘要更新)
+#     有名额空出时先放行高优先级的排队请求; answer/refine 合计最多占用 上限-LLM_RESERVED_SLOTS 个名额,
+#     保证检测类短调用不会排在长生成之后
+#   - 老化: 某一优先级最早的排队请求每等待 config.LLM_AGING_SECONDS 秒, 该优先级的放行顺序提前一级,
+#     持续高负载下低优先级也能得到名额(其名额上限不变, 不会占用预留名额)
+#   - 申请名额可带排队超时, 超时抛出 SchedulerTimeout, 供有时间预算的调用方(迭代检索改写)放弃本次调用
+#   - 同一优先级内按会话轮转放行, 单个会话的大量调用不会挤占其他会话
+#   - 按优先级统计调用数、排队次数与排队时长, 见 llm_scheduler.stats()
+# 会话由 session_scope() 写入上下文变量; 提交到线程池的任务需用 contextvars.copy_context().run 携带
+
+import asyncio
+import contextvars
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager, contextmanager
+from typing import Optional
+
+import config
+
+GUARD = "guard"
+HELPER = "helper"
+ANSWER = "answer"
+REFINE = "refine"
+# 按优先级从高到低
+PRIORITIES = (GUARD, HELPER, ANSWER, REFINE)
+# 可以使用预留名额的优先级
+_RESERVED_FOR = (GUARD, HELPER)
+
+class SchedulerTimeout(TimeoutError):
+    # 排队超过调用方给定的超时仍未获得名额
+    def __init__(self, priority: str, timeout: float):
+        super().__init__(f"LLM调用({priority})排队超过{timeout:.1f}秒")
+        self.priority = priority
+
+
+# 当前请求的会话ID, 用于同一优先级内的公平轮转
+current_session: contextvars.ContextVar = contextvars.ContextVar("llm_session", default="")
+
+
+@contextmanager
+def session_scope(session_id: Optional[str]):
+    # 在此范围内(及由此创建的任务、asyncio.to_thread)发出的LLM调用计入该会话
+    token = current_session.set(session_id or "")
+    try:
+        yield
+    finally:
+        current_session.reset(token)
+
+
+class _Waiter:
+    __slots__ = ("priority", "session", "enqueued", "granted", "notify")
+
+    def __init__(self, priority: str, session: str, notify):
+        self.priority = priority
+        self.session = session
+        self.enqueued = time.monotonic()
+        self.granted = False
+        self.notify = notify
+
+
+class _ClassStats:
+    __slots__ = ("calls", "waited", "wait_total", "wait_max", "inflight", "timeouts")
+
+    def __init__(self):
+        self.calls = 0
+        self.waited = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.inflight = 0
+        self.timeouts = 0
+
+
+class LLMScheduler:
+    """
+    优先级 + 会话公平的并发调度器, 线程与asyncio调用方共用同一组名额
+    Args:
+        max_inflight: 全局在途调用上限
+        reserved: 只供 guard/helper 使用的预留名额数
+        aging: 老化间隔(秒), 见模块说明; 0 为严格优先级
+    """
+    # 排队超过该时长(秒)才计入排队次数, 避免把放行本身的开销算作排队
+    _WAIT_EPSILON = 0.001
+
+    def __init__(self, max_inflight: int, reserved: int = 0, aging: float = 0.0):
+        self.max_inflight = max_inflight
+        self.reserved = min(reserved, max_inflight - 1)
+        self.aging = aging
+        self.inflight = 0
+        self._lock = threading.Lock()
+        # 每个优先级: 会话ID -> 该会话的排队请求, 按轮转顺序排列
+        self._queues = {priority: OrderedDict() for priority in PRIORITIES}
+        self._stats = {priority: _ClassStats() for priority in PRIORITIES}
+
+    def _can_admit_locked(self, priority: str) -> bool:
+        if self.inflight >= self.max_inflight:
+            return False
+        if priority in _RESERVED_FOR:
+            return True
+        # answer/refine 合计不超过非预留名额数
+        unreserved = sum(self._stats[p].inflight for p in PRIORITIES if p not in _RESERVED_FOR)
+        return unreserved < self.max_inflight - self.reserved
+
+    def _grant_order_locked(self) -> list:
+        # 有排队请求的优先级按放行顺序排列: 级别减去最早排队请求的老化级数, 相同时原级别高者在前
+        now = time.monotonic()
+        order = []
+        for rank, priority in enumerate(PRIORITIES):
+            queue = self._queues[priority]
+            if not queue:
+                continue
+            if self.aging > 0:
+                oldest = min(waiters[0].enqueued for waiters in queue.values())
+                order.append((rank - int((now - oldest) / self.aging), rank, priority))
+            else:
+                order.append((rank, rank, priority))
+        return [priority for _, _, priority in sorted(order)]
+
+    def _grant_locked(self) -> list:
+        # 按放行顺序放行排队请求, 返回需要通知的等待者; 调用方持有锁
+        # 排在前面的优先级只因非预留名额用完而仍在排队时, 其后的 guard/helper 仍可使用预留名额
+        granted = []
+        for priority in self._grant_order_locked():
+            queue = self._queues[priority]
+            while queue and self._can_admit_locked(priority):
+                session, waiters = next(iter(queue.items()))
+                waiter = waiters.popleft()
+                if waiters:
+                    queue.move_to_end(session)
+                else:
+                    del queue[session]
+                self._admit_locked(waiter)
+                granted.append(waiter)
+        return granted
+
+    def _admit_locked(self, waiter: _Waiter):
+        waiter.granted = True
+        self.inflight += 1
+        stats = self._stats[waiter.priority]
+        stats.calls += 1
+        stats.inflight += 1
+        wait = time.monotonic() - waiter.enqueued
+        if wait > self._WAIT_EPSILON:
+            stats.waited += 1
+            stats.wait_total += wait
+            stats.wait_max = max(stats.wait_max, wait)
+
+    def _enqueue(self, priority: str, notify) -> _Waiter:
+        if priority not in self._stats:
+            raise ValueError(f"未知的LLM调用优先级: {priority}")
+        waiter = _Waiter(priority, current_session.get(), notify)
+        with self._lock:
+            queue = self._queues[priority]
+            waiters = queue.get(waiter.session)
+            if waiters is None:
+                waiters = queue[waiter.session] = deque()
+            waiters.append(waiter)
+            granted = self._grant_locked()
+        for other in granted:
+            if other is not waiter:
+                other.notify()
+        return waiter
+
+    def _dequeue_locked(self, waiter: _Waiter):
+        queue = self._queues[waiter.priority]
+        waiters = queue.get(waiter.session)
+        if waiters is not None and waiter in waiters:
+            waiters.remove(waiter)
+            if not waiters:
+                del queue[waiter.session]
+
+    def release(self, priority: str):
+        with self._lock:
+            self.inflight -= 1
+            self._stats[priority].inflight -= 1
+            granted = self._grant_locked()
+        for waiter in granted:
+            waiter.notify()
+
+    def _abandon(self, waiter: _Waiter) -> bool:
+        # 等待者放弃排队; 返回放弃前是否已获得名额(此时名额仍归调用方)
+        with self._lock:
+            if waiter.granted:
+                return True
+            self._dequeue_locked(waiter)
+            return False
+
+    def acquire(self, priority: str, timeout: Optional[float] = None):
+        # 阻塞直到获得名额; 超过 timeout 秒仍未获得时抛出 SchedulerTimeout
+        event = threading.Event()
+        waiter = self._enqueue(priority, event.set)
+        if waiter.granted or event.wait(timeout):
+            return
+        if not self._abandon(waiter):
+            with self._lock:
+                self._stats[priority].timeouts += 1
+            raise SchedulerTimeout(priority, timeout)
+
+    async def acquire_async(self, priority: str, timeout: Optional[float] = None):
+        # asyncio版; 排队期间被取消或超时时退出队列(已获得名额则归还或照常使用)
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+
+        def notify():
+            loop.call_soon_threadsafe(lambda: future.done() or future.set_result(None))
+
+        waiter = self._enqueue(priority, notify)
+        if waiter.granted:
+            return
+        try:
+            await asyncio.wait_for(asyncio.shield(future), timeout)
+        except asyncio.TimeoutError:
+            if not self._abandon(waiter):
+                with self._lock:
+                    self._stats[priority].timeouts += 1
+                raise SchedulerTimeout(priority, timeout) from None
+        except asyncio.CancelledError:
+            if self._abandon(waiter):
+                self.release(priority)
+            raise
+
+    @contextmanager
+    def slot(self, priority: str, timeout: Optional[float] = None):
+        self.acquire(priority, timeout)
+        try:
+            yield
+        finally:
+            self.release(priority)
+
+    @asynccontextmanager
+    async def slot_async(self, priority: str, timeout: Optional[float] = None):
+        await self.acquire_async(priority, timeout)
+        try:
+            yield
+        finally:
+            self.release(priority)
+
+    def stats(self) -> dict:
+        with self._lock:
+            classes = {}
+            for priority in PRIORITIES:
+                stats = self._stats[priority]
+                classes[priority] = {
+                    "calls": stats.calls,
+                    "inflight": stats.inflight,
+                    "queued": sum(len(waiters) for waiters in self._queues[priority].values()),
+                    "waited": stats.waited,
+                    "avg_wait": round(stats.wait_total / stats.calls, 4) if stats.calls else 0.0,
+                    "max_wait": round(stats.wait_max, 4),
+                    "timeouts": stats.timeouts,
+                }
+            return {"max_inflight": self.max_inflight, "reserved": self.reserved, "inflight": self.inflight,
+                    "classes": classes}
+
+
+llm_scheduler = LLMScheduler(config.LLM_MAX_INFLIGHT, config.LLM_RESERVED_SLOTS, config.LLM_AGING_SECONDS)
+
+
+@contextmanager
+def llm_slot(priority: str, timeout: Optional[float] = None):
+    # 同步调用的调度入口, 关闭调度(config.LLM_SCHEDULER_ENABLED)时直接放行; timeout 为排队超时(秒)
+    if not config.LLM_SCHEDULER_ENABLED:
+        yield
+        return
+    with llm_scheduler.slot(priority, timeout):
+        yield
+
+
+@asynccontextmanager
+async def llm_slot_async(priority: str, timeout: Optional[float] = None):
+    if not config.LLM_SCHEDULER_ENABLED:
+        yield
+        return
+    async with llm_scheduler.slot_async(priority, timeout):
+        yield
@@ -1,21 +1,107 @@
-from flask import Flask, render_template, request, jsonify
+import asyncio
+import contextvars
+import logging
+import queue
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from flask import Flask, Response, g, render_template, request, jsonify, stream_with_context
 from prompt_builder import build_prompt, RAG_ANSWER_PROMPT, RAG_ADVANCED_ANSWER_PROMPT, build_prompt, RAG_ANSWER_PROMPT_V2
-from data_processor import search_common_database, advanced_search, search_database_bilingual
-from conversation import answerLM
+from data_processor import search_common_database, advanced_search, decomposition_search, search_database_bilingual, search_database_bilingual_async, preload_local_indexes
+from conversation import answerLM, answerLM_async, answerLM_stream_async
 from guard import validate_user_input, validate_prompt
-from intent_classifier import validate_by_intent, get_intent_label, classify_intent
-from safety_agent import is_input_safe, is_output_safe
-from context_intent import context_intent_validation, ConversationManager
+from intent_classifier import validate_by_intent, get_intent_label, classify_intent, classify_intent_async, decide_by_intent
+from safety_agent import is_input_safe, is_output_safe, is_input_safe_async, is_output_safe_async
+from context_intent import context_intent_validation, schedule_context_update
 from attack_pattern_detector import validate_by_pattern
+from streaming import HeldBackBuffer, sse_event
+from session_store import create_session_store, is_valid_session_id, new_session_id
+from speculation import AsyncSpeculation, Speculation, speculation_stats
+from llm_scheduler import ANSWER, llm_scheduler, session_scope
+from resilience import CircuitOpenError, is_degraded
+import resilience
+import config
 
+logger = logging.getLogger(__name__)
 app = Flask(__name__)
-conversation_manager = ConversationManager(max_turns=5)
+# 对话历史按会话隔离, 会话ID通过cookie下发
+conversation_store = create_session_store()
+# 同步流程中上下文检测与意图识别同时进行
+_CONTEXT_POOL = ThreadPoolExecutor(max_workers=config.CONTEXT_CHECK_WORKERS, thread_name_prefix="context-check")
 
-def process_query(q: str) -> dict:
+def _context_check(q: str, session_id: str):
+    """
+    第1层补充：上下文意图检测(渐进式攻击), 模式见 config.CONTEXT_INTENT_MODE
+    Returns:
+        context_intent_validation 的结果; 未开启、无会话或无历史时返回None
+    """
+    if not session_id or config.CONTEXT_INTENT_MODE == "off":
+        return None
+    if config.CONTEXT_INTENT_MODE == "incremental":
+        context_state = conversation_store.get_context(session_id)
+        if not context_state:
+            return None
+        return context_intent_validation(q, context_state=context_state)
+    history = conversation_store.get_history(session_id)
+    if not history:
+        return None
+    return context_intent_validation(q, history)
+
+def _record_turn(session_id: str, q: str, answer: str, intent_result: dict):
+    # 记录对话; 增量模式下在后台更新会话的滚动摘要与风险轨迹
+    conversation_store.add_turn(session_id, q, answer)
+    if config.CONTEXT_INTENT_MODE == "incremental":
+        schedule_context_update(conversation_store, session_id, q, answer, intent_result.get("intent"))
+
+def _record_blocked(session_id: str, q: str, intent_result: dict):
+    # 被安全层拦截的一轮不记入对话历史; 增量模式下以高风险记入风险轨迹, 供后续的渐进式攻击检测参考
+    if session_id and config.CONTEXT_INTENT_MODE == "incremental":
+        schedule_context_update(conversation_store, session_id, q, None, (intent_result or {}).get("intent"),
+                                blocked=True)
+
+def _rag_enhance_type():
+    # 对话接口熔断期间跳过问题分解/迭代检索补充, 降级为基础检索
+    if config.RAG_ENHANCE_TYPE and is_degraded("dialogue"):
+        logger.warning("对话接口已熔断, 跳过%s检索补充", config.RAG_ENHANCE_TYPE)
+        return None
+    return config.RAG_ENHANCE_TYPE
+
+def _advanced_supplement(q: str, enhance_type: str, cancelled=None):
+    # 高级RAG补充, 途中对话接口熔断时放弃补充
+    try:
+        return advanced_search(q, enhance_type, cancelled=cancelled)
+    except CircuitOpenError as e:
+        logger.warning("检索补充中止: %s", e)
+        return None
+
+def _retrieve(q: str, cancelled=None) -> tuple:
+    """
+    RAG检索, 返回 (L1_documents, supplement)
+    Advanced Rag pipeline: decomposition - 问题分解 recursive - 叠代检索, 见 config.RAG_ENHANCE_TYPE
+    Args:
+        cancelled: 推测执行被放弃时置位的 threading.Event, 见 speculation.py
+    """
+    enhance_type = _rag_enhance_type()
+    if enhance_type == 'decomposition':
+        # 原问题检索与子问题检索一起调度
+        try:
+            return decomposition_search(q, 5, cancelled=cancelled)
+        except CircuitOpenError as e:
+            logger.warning("检索补充中止: %s", e)
+            return search_database_bilingual(q, 5), None
+    supplement = None
+    if enhance_type:
+        supplement = _advanced_supplement(q, enhance_type, cancelled)
+    # 从知识库检索相关文档
+    return search_database_bilingual(q, 5), supplement
+
+def process_query(q: str, session_id: str = None) -> dict:
     """
     六层安全检测流程
+    开启 config.SPECULATIVE_RETRIEVAL 时, RAG检索在请求到达时即开始, 与第1~3层检测并行; 被拦截时放弃
     Args:
         q: 用户问题
+        session_id: 会话ID, 成功回答后记入该会话的对话历史; 为空时不记录
     Returns:
         {
             "success": bool,
@@ -24,6 +110,20 @@ def process_query(q: str) -> dict:
             "logs": [{"step": str, "status": str, "message": str}]
         }
     """
+    with session_scope(session_id):
+        speculation = Speculation(_retrieve, q) if config.SPECULATIVE_RETRIEVAL else None
+        # 上下文检测只依赖当前问题与会话状态, 与意图识别同时进行
+        context_future = _CONTEXT_POOL.submit(contextvars.copy_context().run, _context_check, q, session_id)
+        try:
+            return _process_query(q, session_id, speculation, context_future)
+        finally:
+            # 意图识别已拦截时不再需要上下文检测结果, 尚未开始则取消
+            context_future.cancel()
+            # 被拦截或异常退出时放弃推测检索, 已取用时无操作
+            if speculation is not None:
+                speculation.discard()
+
+def _process_query(q: str, session_id: str, speculation, context_future) -> dict:
     result = {
         "success": False,
         "answer": "",
@@ -35,8 +135,8 @@ def process_query(q: str) -> dict:
     result["logs"].append({"step": "意图识别", "status": "processing", "message": "识别中..."})
     # 先获取完整的意图信息（用于后续输出检测）
     intent_result = classify_intent(q)
-    # 再进行本次意图验证（决定是否放行/拦截/进入AI检测）
-    intent_validation = validate_by_intent(q)
+    # 再基于同一分类结果进行意图验证（决定是否放行/拦截/进入AI检测）
+    intent_validation = decide_by_intent(intent_result)
     # 直接放行
     if intent_validation[0] is True:
         result["logs"].append({"step": "意图识别", "status": "success", "message": intent_validation[1]})
@@ -45,11 +145,20 @@ def process_query(q: str) -> dict:
     elif intent_validation[0] is False:
         result["logs"].append({"step": "意图识别", "status": "fail", "message": intent_validation[1]})
         result["error"] = intent_validation[1] + "\n\n建议：您可以询问漏洞原理、防御措施等教育性内容。"
+        _record_blocked(session_id, q, intent_result)
         return result
     # 灰色地带, 需要进一步检测
     else:
         result["logs"].append({"step": "意图识别", "status": "warning", "message": get_intent_label(intent_result)})
         need_further_check = True
+    context_validation = context_future.result()
+    if context_validation is not None:
+        if context_validation[0] is False:
+            result["logs"].append({"step": "上下文意图检测", "status": "fail", "message": context_validation[1]})
+            result["error"] = context_validation[1] + "\n\n建议：您可以询问漏洞原理、防御措施等教育性内容。"
+            _record_blocked(session_id, q, intent_result)
+            return result
+        result["logs"].append({"step": "上下文意图检测", "status": "success", "message": context_validation[1]})
     
     # 第2层：攻击模式检测
     if need_further_check:
@@ -58,6 +167,7 @@ def process_query(q: str) -> dict:
         if not pass_pattern:
             result["logs"].append({"step": "攻击模式检测", "status": "fail", "message": pattern_msg})
             result["error"] = pattern_msg + "\n\n建议：请使用更明确的防御性表述。"
+            _record_blocked(session_id, q, intent_result)
             return result
         result["logs"].append({"step": "攻击模式检测", "status": "success", "message": pattern_msg})
     
@@ -67,17 +177,19 @@ def process_query(q: str) -> dict:
         if not is_input_safe(q):
             result["logs"].append({"step": "AI安全检测", "status": "fail", "message": "检测到可疑意图"})
             result["error"] = "AI安全检测未通过：检测到可疑意图"
+            _record_blocked(session_id, q, intent_result)
             return result
         result["logs"].append({"step": "AI安全检测", "status": "success", "message": "通过检测"})
     
     # 第4层：RAG检索
     result["logs"].append({"step": "RAG检索", "status": "processing", "message": "检索中..."})
+    supplement = None
+    L1_documents = []
     try:
-        # Advanced Rag pipeline, integrated into one entry function
-        # decomposed - 问题分解 recursive - 叠代检索
-        supplement = advanced_search(q, 'decomposed')
-        # 从知识库检索相关文档
-        L1_documents = search_database_bilingual(q, 5)
+        if speculation is not None:
+            L1_documents, supplement = speculation.result()
+        else:
+            L1_documents, supplement = _retrieve(q)
         result["logs"].append({"step": "RAG检索", "status": "success", "message": f"检索到相关文档"})
     except Exception as e:
         result["logs"].append({"step": "RAG检索", "status": "warning", "message": f"检索失败: {e}"})
@@ -88,7 +200,7 @@ def process_query(q: str) -> dict:
     # 第5层：生成回答
     result["logs"].append({"step": "生成回答", "status": "processing", "message": "生成中..."})
     try:
-        answer = answerLM(user_prompt, RAG_ANSWER_PROMPT_V2, max_tokens=4096)
+        answer = answerLM(user_prompt, RAG_ANSWER_PROMPT_V2, max_tokens=4096, priority=ANSWER)
         result["logs"].append({"step": "生成回答", "status": "success", "message": "已生成"})
     except Exception as e:
         result["logs"].append({"step": "生成回答", "status": "fail", "message": str(e)})
@@ -100,6 +212,7 @@ def process_query(q: str) -> dict:
     if not is_output_safe(answer, intent_result=intent_result):
         result["logs"].append({"step": "输出检测", "status": "fail", "message": "输出包含不安全内容"})
         result["error"] = "输出内容检测到安全风险"
+        _record_blocked(session_id, q, intent_result)
         return result
     result["logs"].append({"step": "输出检测", "status": "success", "message": "输出安全"})
     
@@ -107,10 +220,301 @@ def process_query(q: str) -> dict:
     result["success"] = True
     result["answer"] = answer
     # 记录对话
-    conversation_manager.add_turn(q, answer)
+    if session_id:
+        _record_turn(session_id, q, answer, intent_result)
 
     return result
 
+async def _retrieve_async(q: str, cancelled=None) -> tuple:
+    # RAG检索: L1双语检索与高级RAG补充并发执行, 返回 (L1_documents, supplement); cancelled 同 _retrieve
+    enhance_type = _rag_enhance_type()
+    if not enhance_type:
+        return await search_database_bilingual_async(q, 5), None
+    if enhance_type == 'decomposition':
+        try:
+            return await asyncio.to_thread(decomposition_search, q, 5, cancelled=cancelled)
+        except CircuitOpenError as e:
+            logger.warning("检索补充中止: %s", e)
+            return await search_database_bilingual_async(q, 5), None
+    return await asyncio.gather(
+        search_database_bilingual_async(q, 5),
+        asyncio.to_thread(_advanced_supplement, q, enhance_type, cancelled),
+    )
+
+class _OutputBlocked(Exception):
+    # 流式回答的某个片段未通过输出检测
+    pass
+
+async def _screen_segment(segment: str, intent_result: dict) -> bool:
+    # 片段(或整段回答)输出检测, 检测调用失败时按不安全处理
+    try:
+        return await is_output_safe_async(segment, intent_result=intent_result)
+    except Exception as e:
+        logger.warning("片段输出检测失败: %s", e)
+        return False
+
+async def _stream_screened_answer(user_prompt: str, intent_result: dict, released: list):
+    """
+    流式生成回答, 产出通过输出检测的片段
+    生成文本先进入暂存区, 切出的片段连同前一片段的末尾(config.STREAM_SEGMENT_OVERLAP_CHARS)立即并行送检,
+    按原顺序在检测通过后释放; 任一片段未通过时抛出 _OutputBlocked
+    片段检测只用于尽早释放, 调用方在结束前还需对完整回答再做一次检测
+    Args:
+        released: 已释放的片段, 按顺序追加
+    """
+    buffer = HeldBackBuffer(config.STREAM_SEGMENT_MIN_CHARS, config.STREAM_SEGMENT_MAX_CHARS)
+    pending = deque()
+    tokens = answerLM_stream_async(user_prompt, RAG_ANSWER_PROMPT_V2, max_tokens=4096)
+    overlap = config.STREAM_SEGMENT_OVERLAP_CHARS
+    previous = ""
+
+    def screen(segment):
+        nonlocal previous
+        text = previous[-overlap:] + segment if overlap > 0 else segment
+        previous = segment
+        pending.append((segment, asyncio.ensure_future(_screen_segment(text, intent_result))))
+
+    def release():
+        segment, task = pending.popleft()
+        if not task.result():
+            raise _OutputBlocked()
+        released.append(segment)
+        return {"event": "delta", "text": segment}
+
+    try:
+        async for token in tokens:
+            for segment in buffer.feed(token):
+                screen(segment)
+            while pending and pending[0][1].done():
+                yield release()
+        tail = buffer.flush()
+        if tail:
+            screen(tail)
+        while pending:
+            await asyncio.wait([pending[0][1]])
+            yield release()
+    finally:
+        for _, task in pending:
+            task.cancel()
+        await tokens.aclose()
+
+async def _pipeline_events(q: str, result: dict, stream: bool, session_id: str = None):
+    # 六层检测流程, 逐条产出日志事件(流式模式下还产出回答片段), 结果写入result
+    def log(step, status, message):
+        entry = {"step": step, "status": status, "message": message}
+        result["logs"].append(entry)
+        return {"event": "log", **entry}
+
+    speculation = AsyncSpeculation(_retrieve_async, q) if config.SPECULATIVE_RETRIEVAL else None
+    # 上下文检测只依赖当前问题与会话状态, 与意图识别同时进行
+    context_task = asyncio.ensure_future(asyncio.to_thread(_context_check, q, session_id))
+    try:
+        # 第1层：意图识别
+        yield log("意图识别", "processing", "识别中...")
+        intent_result = await classify_intent_async(q)
+        intent_validation = decide_by_intent(intent_result)
+        if intent_validation[0] is True:
+            yield log("意图识别", "success", intent_validation[1])
+            need_further_check = False
+        elif intent_validation[0] is False:
+            result["error"] = intent_validation[1] + "\n\n建议：您可以询问漏洞原理、防御措施等教育性内容。"
+            yield log("意图识别", "fail", intent_validation[1])
+            await asyncio.to_thread(_record_blocked, session_id, q, intent_result)
+            return
+        else:
+            yield log("意图识别", "warning", get_intent_label(intent_result))
+            need_further_check = True
+        context_validation = await context_task
+        if context_validation is not None:
+            if context_validation[0] is False:
+                result["error"] = context_validation[1] + "\n\n建议：您可以询问漏洞原理、防御措施等教育性内容。"
+                yield log("上下文意图检测", "fail", context_validation[1])
+                await asyncio.to_thread(_record_blocked, session_id, q, intent_result)
+                return
+            yield log("上下文意图检测", "success", context_validation[1])
+
+        # 第2层：攻击模式检测
+        if need_further_check:
+            yield log("攻击模式检测", "processing", "检测中...")
+            pass_pattern, pattern_msg = validate_by_pattern(q, intent_result)
+            if not pass_pattern:
+                result["error"] = pattern_msg + "\n\n建议：请使用更明确的防御性表述。"
+                yield log("攻击模式检测", "fail", pattern_msg)
+                await asyncio.to_thread(_record_blocked, session_id, q, intent_result)
+                return
+            yield log("攻击模式检测", "success", pattern_msg)
+
+        # 第3层：AI安全检测（灰色地带）
+        if need_further_check:
+            yield log("AI安全检测", "processing", "检测中...")
+            if not await is_input_safe_async(q):
+                result["error"] = "AI安全检测未通过：检测到可疑意图"
+                yield log("AI安全检测", "fail", "检测到可疑意图")
+                await asyncio.to_thread(_record_blocked, session_id, q, intent_result)
+                return
+            yield log("AI安全检测", "success", "通过检测")
+
+        # 第4层：RAG检索(推测执行时已在后台进行)
+        yield log("RAG检索", "processing", "检索中...")
+        supplement = None
+        L1_documents = []
+        try:
+            if speculation is not None:
+                L1_documents, supplement = await speculation.result()
+            else:
+                L1_documents, supplement = await _retrieve_async(q)
+            yield log("RAG检索", "success", f"检索到相关文档")
+        except Exception as e:
+            yield log("RAG检索", "warning", f"检索失败: {e}")
+        user_prompt = build_prompt(L1_documents, q, intent_result, supplement)
+
+        # 第5、6层：生成回答与输出安全检测
+        yield log("生成回答", "processing", "生成中...")
+        if stream:
+            # 流式: 生成与分段输出检测交替进行, 只有通过检测的片段才会发给客户端
+            yield log("输出检测", "processing", "逐段检测中...")
+            released = []
+            try:
+                async for event in _stream_screened_answer(user_prompt, intent_result, released):
+                    yield event
+            except _OutputBlocked:
+                result["error"] = "输出内容检测到安全风险"
+                yield log("输出检测", "fail", "输出包含不安全内容")
+                await asyncio.to_thread(_record_blocked, session_id, q, intent_result)
+                return
+            except Exception as e:
+                result["error"] = f"生成失败: {e}"
+                yield log("生成回答", "fail", str(e))
+                return
+            answer = "".join(released)
+            yield log("生成回答", "success", "已生成")
+            # 整段回答按意图对应的检测强度再检测一次, 未通过时不记录本轮, 客户端撤回已显示的片段
+            if not await _screen_segment(answer, intent_result):
+                result["error"] = "输出内容检测到安全风险"
+                yield log("输出检测", "fail", "输出包含不安全内容")
+                await asyncio.to_thread(_record_blocked, session_id, q, intent_result)
+                return
+        else:
+            try:
+                answer = await answerLM_async(user_prompt, RAG_ANSWER_PROMPT_V2, max_tokens=4096, priority=ANSWER)
+                yield log("生成回答", "success", "已生成")
+            except Exception as e:
+                result["error"] = f"生成失败: {e}"
+                yield log("生成回答", "fail", str(e))
+                return
+            yield log("输出检测", "processing", "检测中...")
+            if not await is_output_safe_async(answer, intent_result=intent_result):
+                result["error"] = "输出内容检测到安全风险"
+                yield log("输出检测", "fail", "输出包含不安全内容")
+                await asyncio.to_thread(_record_blocked, session_id, q, intent_result)
+                return
+        yield log("输出检测", "success", "输出安全")
+
+        result["success"] = True
+        result["answer"] = answer
+        if session_id:
+            await asyncio.to_thread(_record_turn, session_id, q, answer, intent_result)
+    finally:
+        # 被拦截或异常退出时放弃推测检索与上下文检测
+        if speculation is not None:
+            speculation.discard()
+        if not context_task.done():
+            context_task.cancel()
+
+async def process_query_events(q: str, stream: bool = False, session_id: str = None):
+    """
+    六层安全检测流程的异步事件流
+    意图识别与RAG检索(含查询翻译, 推测执行, 见 config.SPECULATIVE_RETRIEVAL)在请求到达时同时发起, 任一安全层拦截时取消检索
+    依次产出:
+        {"event": "log", "step", "status", "message"}   各层进度, 与结果中的logs一致
+        {"event": "delta", "text"}                       stream=True时, 已通过输出检测的回答片段
+        {"event": "done", "result"}                      最终结果, 结构与 process_query 相同
+    """
+    result = {
+        "success": False,
+        "answer": "",
+        "error": "",
+        "logs": []
+    }
+    async for event in _pipeline_events(q, result, stream, session_id):
+        yield event
+    yield {"event": "done", "result": result}
+
+async def process_query_async(q: str, session_id: str = None) -> dict:
+    """
+    六层安全检测流程的异步版本, 返回结构与 process_query 相同
+    """
+    async for event in process_query_events(q, session_id=session_id):
+        if event["event"] == "done":
+            return event["result"]
+
+async def chat_events(message: str, session_id: str = None):
+    # /chat/stream 的事件流: 输入校验后进入流式检测流程
+    if not message:
+        yield {"event": "done", "result": {'success': False, 'error': '消息不能为空', 'logs': []}}
+        return
+    passed, _ = validate_user_input(message)
+    if not passed:
+        yield {"event": "done", "result": {'success': False, 'error': '检测到不安全的输入内容,请修改后重试。', 'logs': []}}
+        return
+    try:
+        async for event in process_query_events(message, stream=True, session_id=session_id):
+            yield event
+    except Exception as e:
+        yield {"event": "done", "result": {'success': False, 'error': f'系统错误: {str(e)}', 'logs': []}}
+
+# /chat/stream 共用的后台事件循环: 其上的异步传输层(aiohttp连接池)在请求之间保持复用, 不随请求关闭
+_stream_loop = None
+_stream_loop_lock = threading.Lock()
+# 事件流结束标记
+_EVENTS_END = object()
+
+def _get_stream_loop() -> asyncio.AbstractEventLoop:
+    global _stream_loop
+    with _stream_loop_lock:
+        if _stream_loop is None:
+            loop = asyncio.new_event_loop()
+            threading.Thread(target=loop.run_forever, name="chat-stream-loop", daemon=True).start()
+            _stream_loop = loop
+        return _stream_loop
+
+async def _pump_chat_events(message: str, session_id: str, events: queue.Queue):
+    # 在后台事件循环的单个任务中驱动 chat_events, 会话在整个事件流期间有效
+    try:
+        with session_scope(session_id):
+            async for event in chat_events(message, session_id):
+                events.put(event)
+    finally:
+        events.put(_EVENTS_END)
+
+def _iter_chat_events(message: str, session_id: str = None):
+    # 供同步的Flask视图逐条取出事件; 客户端断开(生成器被关闭)时取消后台任务
+    events = queue.Queue()
+    future = asyncio.run_coroutine_threadsafe(_pump_chat_events(message, session_id, events), _get_stream_loop())
+    try:
+        while True:
+            event = events.get()
+            if event is _EVENTS_END:
+                break
+            yield event
+        future.result()
+    finally:
+        future.cancel()
+
+def _session_id() -> str:
+    # 从cookie读取会话ID, 没有或格式不合法时分配新ID, 由 _set_session_cookie 写回
+    session_id = request.cookies.get(config.SESSION_COOKIE_NAME)
+    if not is_valid_session_id(session_id):
+        session_id = g.new_session_id = new_session_id()
+    return session_id
+
+@app.after_request
+def _set_session_cookie(response):
+    session_id = g.get("new_session_id")
+    if session_id:
+        response.set_cookie(config.SESSION_COOKIE_NAME, session_id, httponly=True, samesite="Lax")
+    return response
+
 @app.route('/')
 def index():
     # 渲染主页
@@ -118,8 +522,8 @@ def index():
 
 @app.route('/clear_history', methods=['POST'])
 def clear_history():
-    # 清除对话历史
-    conversation_manager.clear()
+    # 清除当前会话的对话历史
+    conversation_store.clear(_session_id())
     return jsonify({"success": True})
 
 @app.route('/chat', methods=['POST'])
@@ -135,13 +539,14 @@ def chat():
                 'logs': []
             })
         # 用户输入安全验证
-        if not validate_user_input(message):
+        passed, _ = validate_user_input(message)
+        if not passed:
             return jsonify({
                 'success': False,
                 'error': '检测到不安全的输入内容,请修改后重试。'
             })
         # 调用核心处理函数
-        result = process_query(message)
+        result = process_query(message, _session_id())
         return jsonify(result)
     except Exception as e:
         return jsonify({
@@ -150,6 +555,21 @@ def chat():
             'logs': []
         })
 
+@app.route('/chat/stream', methods=['POST'])
+def chat_stream():
+    # 流式聊天: 以SSE逐条推送各层日志与通过输出检测的回答片段, 最后推送 done 事件
+    data = request.get_json(silent=True) or {}
+    message = data.get('message', '')
+    events = (sse_event(event) for event in _iter_chat_events(message, _session_id()))
+    return Response(stream_with_context(events), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@app.route('/stats')
+def stats():
+    # 运行统计: 推测检索命中率与浪费的工作量、会话存储
+    return jsonify({"speculation": speculation_stats.stats(), "sessions": conversation_store.stats(),
+                    "llm_scheduler": llm_scheduler.stats(), "resilience": resilience.stats()})
+
 # 错误处理
 @app.errorhandler(404)
 def not_found(error):
@@ -165,9 +585,10 @@ def internal_error(error):
         'error': '服务器内部错误'
     }), 500
 
-# 启动应用
+# 启动应用(开发调试用, 生产环境使用 serve.py)
 if __name__ == '__main__':
     print("""安全知识助手 - Web服务启动中...""")
+    preload_local_indexes()
     app.run(
         host='127.0.0.1',
         port=5000,
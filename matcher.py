@@ -0,0 +1,99 @@
+# 多模式字符串匹配：Aho-Corasick 自动机, 构建一次后单遍扫描输入即可找出所有模式的所有出现位置
+# 安装了 pyahocorasick 时使用其C实现, 否则使用纯Python实现, 两者结果一致
+
+from collections import deque
+from typing import Any, Dict, Iterable, Iterator, List, Tuple
+
+try:
+    import ahocorasick as _ahocorasick
+except ImportError:
+    _ahocorasick = None
+
+
+class AhoCorasick:
+    """
+    Aho-Corasick 多模式匹配自动机(只读, 构建后可被多线程共享)
+    Args:
+        patterns: (模式串, 附带数据) 序列; 大小写处理由调用方负责
+    """
+    def __init__(self, patterns: Iterable[Tuple[str, Any]], backend: str = "auto"):
+        """
+        Args:
+            backend: auto(有C实现时使用C实现) / python
+        """
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        # 每个状态命中的 (模式长度, 附带数据), 构建时已合并失败链上的输出
+        self._out: List[List[Tuple[int, Any]]] = [[]]
+        self.size = 0
+        self.backend = "c" if backend == "auto" and _ahocorasick is not None else "python"
+        self._native = _ahocorasick.Automaton() if self.backend == "c" else None
+        for pattern, payload in patterns:
+            if pattern:
+                if self._native is not None:
+                    # 同一模式串可能对应多条数据
+                    entries = self._native.get(pattern, [])
+                    entries.append((len(pattern), payload))
+                    self._native.add_word(pattern, entries)
+                else:
+                    self._add(pattern, payload)
+                self.size += 1
+        if self._native is not None:
+            if self.size:
+                self._native.make_automaton()
+        else:
+            self._build()
+
+    def _add(self, pattern: str, payload: Any):
+        state = 0
+        for ch in pattern:
+            nxt = self._goto[state].get(ch)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[state][ch] = nxt
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append([])
+            state = nxt
+        self._out[state].append((len(pattern), payload))
+
+    def _build(self):
+        # 按BFS顺序计算失败指针(深度为1的状态失败指针为根), 并展开为确定性转移表:
+        # _delta[s] 含沿失败链可达的全部非根转移, 扫描时每个字符只需一次查表, 查不到时回落到根的转移
+        self._delta: List[Dict[str, int]] = [{} for _ in self._goto]
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            fail = self._fail[state]
+            self._delta[state] = {**self._delta[fail], **self._goto[state]} if state else {}
+            for ch, nxt in self._goto[state].items():
+                queue.append(nxt)
+                fail = self._fail[state]
+                while fail and ch not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[nxt] = self._goto[fail].get(ch, 0)
+                self._out[nxt] = self._out[nxt] + self._out[self._fail[nxt]]
+
+    def iter_matches(self, text: str) -> Iterator[Tuple[int, int, Any]]:
+        # 逐个产出 (起始位置, 结束位置, 附带数据)
+        if self._native is not None:
+            if self.size:
+                for end, entries in self._native.iter(text):
+                    for length, payload in entries:
+                        yield end + 1 - length, end + 1, payload
+            return
+        delta, out = self._delta, self._out
+        root = self._goto[0].get
+        state = 0
+        for i, ch in enumerate(text):
+            nxt = delta[state].get(ch)
+            state = root(ch, 0) if nxt is None else nxt
+            if out[state]:
+                for length, payload in out[state]:
+                    yield i + 1 - length, i + 1, payload
+
+    def search(self, text: str) -> bool:
+        # 是否命中任一模式, 命中即返回
+        for _ in self.iter_matches(text):
+            return True
+        return False
@@ -1,3 +1,13 @@
+import logging
+import math
+import re
+from typing import List, NamedTuple, Optional
+
+import config
+from utils import is_cjk
+
+logger = logging.getLogger(__name__)
+
 RAG_ANSWER_PROMPT="""
 -Target activity-
 You are an intelligent assistant who solves questions with the help of retrieved documents.
@@ -190,7 +200,99 @@ cursor.execute(f"SELECT * FROM users WHERE id = {user_id}")
 
 TRANSLATE_PROMPT="""Translate the following Chinese into English.Directly output the plain text of translation"""
 
-def build_prompt(documents , query, intent_info=None, decomposed_supplement=None):
+TRANSLATE_BATCH_PROMPT="""Translate each of the following numbered Chinese questions into English.
+Keep the numbering and output exactly one line per question in the form "<number>. <translation>".
+Directly output the plain text of translations, nothing else."""
+
+# ========== 上下文打包 ==========
+
+_SENTENCE_END = re.compile(r"(?<=[。！？；!?;])|(?<=\.)\s+|\n+")
+# 剩余预算低于该值时不再截断填充, 避免塞入无意义的残句
+_MIN_TRUNCATED_TOKENS = 24
+
+
+def estimate_tokens(text: str) -> int:
+    # 粗略估计token数: CJK字符每字约1个token, 其余非空白字符约4个字符1个token
+    cjk = sum(1 for ch in text if is_cjk(ch))
+    other = sum(1 for ch in text if not ch.isspace()) - cjk
+    return cjk + math.ceil(other / 4)
+
+
+def truncate_to_tokens(text: str, budget: int) -> str:
+    # 在句子边界处截断, 使结果不超过budget; 第一句即超出时返回空串
+    kept = []
+    used = 0
+    for sentence in _SENTENCE_END.split(text):
+        if not sentence or not sentence.strip():
+            continue
+        cost = estimate_tokens(sentence)
+        if used + cost > budget:
+            break
+        kept.append(sentence)
+        used += cost
+    text = ""
+    for sentence in kept:
+        sentence = sentence.strip()
+        text += sentence if not text or text[-1] in "。！？；" else " " + sentence
+    return text
+
+
+class PackedContext(NamedTuple):
+    groups: List[List[str]]     # 与输入分组一一对应的入选文本块
+    used_tokens: int
+    dropped_tokens: int
+
+
+def pack_context(groups: List[List[str]], budget: int) -> PackedContext:
+    """
+    在token预算内挑选检索文本块
+    各组(原问题/各子问题/各轮迭代)内按检索排名, 组间按名次轮流入选, 保证每组都分到预算;
+    放不下的文本块在句子边界截断, 截断或丢弃的token计入 dropped_tokens
+    Args:
+        groups: 每组为按相关度降序的文本块列表
+        budget: token预算
+    """
+    order = sorted(((rank, g) for g, chunks in enumerate(groups) for rank in range(len(chunks))))
+    packed = [[None] * len(chunks) for chunks in groups]
+    used = dropped = 0
+    for rank, g in order:
+        chunk = groups[g][rank]
+        cost = estimate_tokens(chunk)
+        remaining = budget - used
+        if cost <= remaining:
+            packed[g][rank] = chunk
+            used += cost
+            continue
+        truncated = truncate_to_tokens(chunk, remaining) if remaining >= _MIN_TRUNCATED_TOKENS else ""
+        if truncated:
+            kept = estimate_tokens(truncated)
+            packed[g][rank] = truncated
+            used += kept
+            dropped += cost - kept
+        else:
+            dropped += cost
+    return PackedContext([[c for c in chunks if c is not None] for chunks in packed], used, dropped)
+
+
+def _split_docs(docstr: str) -> List[str]:
+    # 高级RAG各组的文档以空行拼接, 拆回文本块以便按块取舍
+    return [x for x in docstr.split('\n\n') if x.strip()]
+
+
+def _pack(groups: List[List[str]], token_budget: Optional[int], label: str) -> List[List[str]]:
+    budget = config.CONTEXT_TOKEN_BUDGET if token_budget is None else token_budget
+    packed = pack_context(groups, budget)
+    if packed.dropped_tokens:
+        logger.info("%s上下文超出预算(%d tokens), 已使用 %d, 丢弃 %d", label, budget, packed.used_tokens,
+                    packed.dropped_tokens)
+    return packed.groups
+
+
+def build_prompt(documents , query, intent_info=None, decomposed_supplement=None, token_budget=None):
+    """
+    Args:
+        token_budget: 检索上下文的token预算, 默认 config.CONTEXT_TOKEN_BUDGET
+    """
     guide = ""
     if intent_info:
         intent = intent_info.get("intent", "UNKNOWN")
@@ -204,22 +306,25 @@ def build_prompt(documents , query, intent_info=None, decomposed_supplement=None
         elif intent == "GREY":
             guide = f"\n\n【注意】意图不明确（置信度{confidence:.0%}），谨慎回答，避免提供可直接利用的危险内容。"
     if decomposed_supplement is not None:
-        L1_text = '\n\n'.join(documents)
-        d_text = '\n\n'.join([f'({x[0]},{x[1]})' for x in decomposed_supplement])
+        packed = _pack([list(documents)] + [_split_docs(x[1]) for x in decomposed_supplement], token_budget, "问题分解")
+        L1_text = '\n\n'.join(packed[0])
+        d_docs = ['\n\n'.join(docs) for docs in packed[1:]]
+        d_text = '\n\n'.join([f'({x[0]},{docs})' for x, docs in zip(decomposed_supplement, d_docs)])
         prompt = f"""Retrieved context:
         {d_text}
         ***{L1_text}
         user's original question:{query}{guide}"""
     else:
-        text = '\n\n'.join(documents)
+        text = '\n\n'.join(_pack([list(documents)], token_budget, "基础检索")[0])
         prompt = f"Retrieved documents:{text}user's question:{query}{guide}"
     return prompt
-def build_recursive_prompt(step):
+def build_recursive_prompt(step, token_budget=None):
+    packed = _pack([_split_docs(item[1]) for item in step], token_budget, "迭代检索")
     prompt=''
     for idx,item in enumerate(step):
+        docs = '\n\n'.join(packed[idx])
         if idx==0:
-            prompt+=f"initial question:{item[0]}  documents:{item[1]}"
+            prompt+=f"initial question:{item[0]}  documents:{docs}"
         else:
-            prompt+=f'\n\n refinement:{item[0]}  documents:{item[1]}'
-    print(f'1**1{prompt}')
-    return prompt
\ No newline at end of file
+            prompt+=f'\n\n refinement:{item[0]}  documents:{docs}'
+    return prompt
@@ -0,0 +1,104 @@
+# 多路检索结果合并：各知识库/各语言的结果分别做分数归一化, 堆式k路归并取全局top-k,
+# 同时用SimHash抑制近似重复的文本块, 避免同一段落重复进入prompt
+
+import hashlib
+import heapq
+import math
+from collections import Counter
+from functools import lru_cache
+from typing import Iterable, List, Optional, Sequence, Tuple
+
+from lexical_index import tokenize
+from utils import normalize_text
+
+NORMALIZATIONS = ("none", "minmax", "zscore", "rank")
+# 词元过少的短文本指纹不稳定, 只做完全相同去重
+_MIN_SIMHASH_TOKENS = 8
+
+
+def normalize_scores(documents: Sequence[Tuple[str, float]], method: str = "none") -> List[Tuple[str, float]]:
+    """
+    单路结果的分数归一化, 使不同知识库/不同后端的分数可比
+    Args:
+        method: none(原始分数) / minmax(线性映射到[0,1]) / zscore(标准分) / rank(按名次 1/(1+rank))
+    Returns:
+        按归一化分数降序排列的 [(text, score)]
+    """
+    documents = sorted(documents, key=lambda x: x[1], reverse=True)
+    if method == "none" or not documents:
+        return documents
+    scores = [score for _, score in documents]
+    if method == "minmax":
+        low, high = scores[-1], scores[0]
+        span = high - low
+        normalized = [(s - low) / span if span else 1.0 for s in scores]
+    elif method == "zscore":
+        mean = sum(scores) / len(scores)
+        std = math.sqrt(sum((s - mean) ** 2 for s in scores) / len(scores))
+        normalized = [(s - mean) / std if std else 0.0 for s in scores]
+    elif method == "rank":
+        normalized = [1.0 / (1 + i) for i in range(len(scores))]
+    else:
+        raise ValueError(f"未知的分数归一化方式: {method}")
+    return [(text, score) for (text, _), score in zip(documents, normalized)]
+
+
+@lru_cache(maxsize=1 << 16)
+def _hash64(token: str) -> int:
+    return int.from_bytes(hashlib.blake2b(token.encode("utf-8"), digest_size=8).digest(), "little")
+
+
+def simhash(text: str) -> int:
+    # 64位SimHash, 特征为分词结果(英文单词/中文二元组), 以词频加权
+    return _simhash_counts(Counter(tokenize(text)))
+
+
+def _simhash_counts(counts: Counter) -> int:
+    weights = [0] * 64
+    for token, count in counts.items():
+        h = _hash64(token)
+        for bit in range(64):
+            weights[bit] += count if (h >> bit) & 1 else -count
+    fingerprint = 0
+    for bit, weight in enumerate(weights):
+        if weight > 0:
+            fingerprint |= 1 << bit
+    return fingerprint
+
+
+def hamming(a: int, b: int) -> int:
+    return bin(a ^ b).count("1")
+
+
+def merge_results(result_lists: Iterable[Sequence[Tuple[str, float]]], topk: int, normalization: str = "none",
+                  dedup_distance: Optional[int] = 3) -> List[Tuple[str, float]]:
+    """
+    多路检索结果的k路归并
+    Args:
+        result_lists: 各路(知识库 x 语言)的 [(text, score)]
+        normalization: 每一路分数的归一化方式, 见 normalize_scores
+        dedup_distance: SimHash汉明距离不超过该值的文本视为近似重复, 只保留分数最高的一条; None表示只去除完全相同的文本
+    Returns:
+        去重后分数最高的topk条 [(text, score)]
+    """
+    streams = [normalize_scores(documents, normalization) for documents in result_lists]
+    merged = []
+    seen_texts = set()
+    fingerprints = []
+    # 各路已按分数降序, 归并时只需维护每路的当前头部
+    for text, score in heapq.merge(*streams, key=lambda x: -x[1]):
+        if len(merged) >= topk:
+            break
+        key = normalize_text(text)
+        if key in seen_texts:
+            continue
+        if dedup_distance is not None:
+            counts = Counter(tokenize(text))
+            if len(counts) >= _MIN_SIMHASH_TOKENS:
+                fingerprint = _simhash_counts(counts)
+                if any(hamming(fingerprint, f) <= dedup_distance for f in fingerprints):
+                    continue
+                fingerprints.append(fingerprint)
+        seen_texts.add(key)
+        merged.append((text, score))
+    return merged
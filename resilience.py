@@ -0,0 +1,288 @@
+# 上游调用的尾延迟与故障隔离:
+#   - Hedger: 幂等调用(知识库检索、可缓存的分类/检测类dialogue)超过近期延迟的p95仍未返回时, 再发一份相同请求, 取先返回的结果;
+#             对冲请求数不超过调用数的 config.HEDGE_MAX_RATIO, 避免放大上游负载
+#   - CircuitBreaker: 按端点(search/dialogue)统计最近调用的失败率与慢调用率, 超过阈值时熔断一段时间, 期间直接抛出
+#                     CircuitOpenError 而不再等待上游; 到期后放行一个探测请求, 成功则恢复
+# 熔断期间的降级: 检索改用本地索引(config.CIRCUIT_SEARCH_FALLBACK), 跳过问题分解/迭代检索补充, 翻译失败时只检索原文
+# 熔断器由 transport / async_transport 按端点使用, 对冲由 api_client 使用
+
+import asyncio
+import contextvars
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+import config
+
+
+class CircuitOpenError(Exception):
+    # 端点处于熔断状态, 请求未发出
+    def __init__(self, endpoint: str, retry_in: float):
+        super().__init__(f"上游 {endpoint} 接口已熔断, {retry_in:.0f}秒后重试")
+        self.endpoint = endpoint
+        self.retry_in = retry_in
+
+
+class CircuitBreaker:
+    """
+    基于最近 window 次调用的熔断器(线程安全, 同步与异步传输层共用)
+    Args:
+        min_calls: 窗口内至少有这么多次调用才判断是否熔断
+        error_rate: 失败(连接错误、超时、5xx)占比阈值
+        slow_seconds / slow_rate: 耗时超过 slow_seconds 的调用占比阈值
+        open_seconds: 熔断持续时间, 到期后进入半开状态放行一个探测请求
+    """
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, name: str, window: int, min_calls: int, error_rate: float, slow_seconds: float,
+                 slow_rate: float, open_seconds: float):
+        self.name = name
+        self.min_calls = min_calls
+        self.error_rate = error_rate
+        self.slow_seconds = slow_seconds
+        self.slow_rate = slow_rate
+        self.open_seconds = open_seconds
+        self.state = self.CLOSED
+        # 每项为 (是否失败, 是否慢调用)
+        self._outcomes: "deque[tuple]" = deque(maxlen=window)
+        self._opened_at = 0.0
+        self._probing = False
+        self._probe_started = 0.0
+        self._lock = threading.Lock()
+        self.opened = 0
+        self.rejected = 0
+
+    def is_open(self) -> bool:
+        # 处于熔断期内(不含可以探测的半开状态), 供调用方提前走降级路径
+        with self._lock:
+            return self.state == self.OPEN and time.monotonic() - self._opened_at < self.open_seconds
+
+    def check(self):
+        """
+        请求发出前调用, 熔断期内或半开状态下已有探测请求时抛出 CircuitOpenError
+        通过检查的请求结束时必须调用 record() 或 abandon() 之一
+        """
+        with self._lock:
+            if self.state == self.CLOSED:
+                return
+            now = time.monotonic()
+            if self.state == self.OPEN and now - self._opened_at >= self.open_seconds:
+                self.state = self.HALF_OPEN
+                self._probing = False
+            # 探测请求超过 open_seconds 仍无结论时视为丢失, 放行新的探测
+            if self.state == self.HALF_OPEN and (not self._probing or now - self._probe_started >= self.open_seconds):
+                self._probing = True
+                self._probe_started = now
+                return
+            self.rejected += 1
+            raise CircuitOpenError(self.name, max(0.0, self._opened_at + self.open_seconds - now))
+
+    def record(self, success: bool, latency: float):
+        slow = latency > self.slow_seconds
+        with self._lock:
+            if self.state == self.HALF_OPEN:
+                # 探测请求的结果决定恢复或继续熔断
+                self._probing = False
+                if success and not slow:
+                    self.state = self.CLOSED
+                    self._outcomes.clear()
+                else:
+                    self._trip()
+                return
+            if self.state == self.OPEN:
+                return
+            self._outcomes.append((not success, slow))
+            calls = len(self._outcomes)
+            if calls < self.min_calls:
+                return
+            failures = sum(failed for failed, _ in self._outcomes)
+            slow_calls = sum(slow for _, slow in self._outcomes)
+            if failures >= self.error_rate * calls or slow_calls >= self.slow_rate * calls:
+                self._trip()
+
+    def abandon(self):
+        # 请求未得出结论(被取消或非上游错误)时调用: 不计入统计, 半开状态下释放探测名额
+        with self._lock:
+            if self.state == self.HALF_OPEN:
+                self._probing = False
+
+    def _trip(self):
+        self.state = self.OPEN
+        self._opened_at = time.monotonic()
+        self._outcomes.clear()
+        self.opened += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"state": self.state, "opened": self.opened, "rejected": self.rejected,
+                    "window_calls": len(self._outcomes),
+                    "window_failures": sum(failed for failed, _ in self._outcomes)}
+
+
+# 对冲请求在独立线程池中执行, 与检索线程池、推测线程池分开以免互相等待
+_HEDGE_POOL = ThreadPoolExecutor(max_workers=config.HEDGE_WORKERS, thread_name_prefix="hedge")
+
+
+class Hedger:
+    """
+    对冲请求: 首个请求在 delay() 秒内未返回时再发一份, 取先成功的结果; 两份都失败时抛出首个请求的异常
+    delay() 为近期成功调用延迟的分位数(config.HEDGE_QUANTILE), 样本不足时使用上限 max_delay
+    """
+    # 计算分位数所需的最少样本数
+    _MIN_SAMPLES = 20
+
+    def __init__(self, name: str, quantile: float, min_delay: float, max_delay: float, max_ratio: float,
+                 window: int = 200):
+        self.name = name
+        self.quantile = quantile
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.max_ratio = max_ratio
+        self._latencies: "deque[float]" = deque(maxlen=window)
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.hedged = 0
+        self.hedge_wins = 0
+
+    def delay(self) -> float:
+        with self._lock:
+            return self._delay_locked()
+
+    def _delay_locked(self) -> float:
+        if len(self._latencies) < self._MIN_SAMPLES:
+            return self.max_delay
+        ordered = sorted(self._latencies)
+        value = ordered[min(len(ordered) - 1, int(self.quantile * len(ordered)))]
+        return min(self.max_delay, max(self.min_delay, value))
+
+    def _begin(self):
+        with self._lock:
+            self.calls += 1
+
+    def _may_hedge(self) -> bool:
+        with self._lock:
+            if self.hedged + 1 > self.max_ratio * self.calls:
+                return False
+            self.hedged += 1
+            return True
+
+    def _record(self, latency: float, hedge_won: bool):
+        with self._lock:
+            self._latencies.append(latency)
+            if hedge_won:
+                self.hedge_wins += 1
+
+    @staticmethod
+    def _timed(fn: Callable[[], Any], started: list, event: threading.Event) -> Any:
+        # 在工作线程中记录实际开始执行的时间, 线程池排队时间不计入延迟
+        started.append(time.monotonic())
+        event.set()
+        return fn()
+
+    def call(self, fn: Callable[[], Any]) -> Any:
+        # 同步版本, 两份请求均在对冲线程池中执行(携带当前上下文)
+        # 对冲等待与延迟样本都从首个请求开始执行时算起; 仍在线程池排队的请求不对冲
+        self._begin()
+        started, event = [], threading.Event()
+        primary = _HEDGE_POOL.submit(contextvars.copy_context().run, self._timed, fn, started, event)
+        # 被取消时同样唤醒等待
+        primary.add_done_callback(lambda _: event.set())
+        event.wait()
+        if not started:
+            return primary.result()
+        start = started[0]
+        remaining = max(0.0, self.delay() - (time.monotonic() - start))
+        if wait([primary], timeout=remaining).done or not self._may_hedge():
+            result = primary.result()
+            self._record(time.monotonic() - start, False)
+            return result
+        hedge = _HEDGE_POOL.submit(contextvars.copy_context().run, fn)
+        pending = {primary, hedge}
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    # 落后的一份已在执行, 无法中断, 结果直接丢弃
+                    for other in pending:
+                        other.cancel()
+                    self._record(time.monotonic() - start, future is hedge)
+                    return future.result()
+        return primary.result()
+
+    async def call_async(self, fn: Callable[[], Awaitable[Any]]) -> Any:
+        # asyncio版本, 落后的一份被取消
+        self._begin()
+        start = time.monotonic()
+        primary = asyncio.ensure_future(fn())
+        tasks = {primary}
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=self.delay())
+            if done or not self._may_hedge():
+                result = await primary
+                self._record(time.monotonic() - start, False)
+                return result
+            hedge = asyncio.ensure_future(fn())
+            tasks.add(hedge)
+            pending = set(tasks)
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        self._record(time.monotonic() - start, task is hedge)
+                        return task.result()
+            return primary.result()
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"calls": self.calls, "hedged": self.hedged, "hedge_wins": self.hedge_wins,
+                    "delay": round(self._delay_locked(), 3)}
+
+
+def _breaker(name: str, slow_seconds: float) -> CircuitBreaker:
+    return CircuitBreaker(name, config.CIRCUIT_WINDOW, config.CIRCUIT_MIN_CALLS, config.CIRCUIT_ERROR_RATE,
+                          slow_seconds, config.CIRCUIT_SLOW_RATE, config.CIRCUIT_OPEN_SECONDS)
+
+
+breakers: Dict[str, CircuitBreaker] = {
+    "search": _breaker("search", config.CIRCUIT_SLOW_SECONDS["search"]),
+    "dialogue": _breaker("dialogue", config.CIRCUIT_SLOW_SECONDS["dialogue"]),
+}
+hedgers: Dict[str, Hedger] = {
+    name: Hedger(name, config.HEDGE_QUANTILE, config.HEDGE_MIN_DELAY, config.HEDGE_MAX_DELAY[name],
+                 config.HEDGE_MAX_RATIO)
+    for name in ("search", "dialogue")
+}
+
+
+def get_breaker(endpoint: str) -> Optional[CircuitBreaker]:
+    # 端点的熔断器, 未开启熔断或该端点不熔断时返回None
+    return breakers.get(endpoint) if config.CIRCUIT_ENABLED else None
+
+
+def is_degraded(endpoint: str) -> bool:
+    # 端点是否处于熔断期, 调用方据此直接走降级路径
+    breaker = get_breaker(endpoint)
+    return breaker is not None and breaker.is_open()
+
+
+def hedged(endpoint: str, fn: Callable[[], Any]) -> Any:
+    return hedgers[endpoint].call(fn) if config.HEDGE_ENABLED else fn()
+
+
+async def hedged_async(endpoint: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+    return await hedgers[endpoint].call_async(fn) if config.HEDGE_ENABLED else await fn()
+
+
+def stats() -> dict:
+    return {
+        "breakers": {name: breaker.stats() for name, breaker in breakers.items()},
+        "hedgers": {name: hedger.stats() for name, hedger in hedgers.items()},
+    }
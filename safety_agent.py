@@ -1,72 +1,344 @@
-from typing import Dict, Optional
-from api_client import dialogue
+import asyncio
+import contextvars
+import json
+import logging
+import re
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, as_completed, wait
+from typing import Dict, List, Optional
+from api_client import dialogue, dialogue_async
+from llm_scheduler import GUARD
 from pathlib import Path
+import config
+
+logger = logging.getLogger(__name__)
 
 _PROMPT_DIR = Path(__file__).parent / "prompts"
 INPUT_CHECKING_PROMPT_V2  = (_PROMPT_DIR / "input.txt").read_text(encoding="utf-8")
 OUTPUT_CHECKING_PROMPT_V2 = (_PROMPT_DIR / "output.txt").read_text(encoding="utf-8")
 
+RELAXED_CHECK_PROMPT = """
+        判断输出是否包含**完整可直接执行的攻击脚本或payload**。
+        允许：概念、原理、防御、不完整的代码片段、伪代码。
+        禁止：可复制运行的完整 exploit、实际 payload。
+        只返回 true 或 false。
+        """
+
+# 分块输出检测: 代码块整体保留, 段落合并到不超过 OUTPUT_CHUNK_CHARS
+_CODE_FENCE = re.compile(r"(```.*?(?:```|$))", re.S)
+_PARAGRAPH_BREAK = re.compile(r"\n\s*\n")
+# 文字中的代码迹象: 行内代码、缩进代码、脚本/SQL片段, 以及写在正文里的命令行(管道到shell、常见攻击工具、反弹shell等)
+_CODE_HINT = re.compile(
+    r"`[^`\n]+`|^(?: {4}|\t)\S|<\s*script|<\?php|\$\(|\bselect\b.+\bfrom\b|\bunion\b.+\bselect\b"
+    r"|\|\s*(?:sudo\s+)?(?:ba|z|da)?sh\b|\b(?:curl|wget)\s+\S|\b(?:nmap|sqlmap|hydra|msfconsole|msfvenom|nikto|gobuster"
+    r"|hashcat|john|mimikatz|netcat|ncat|nc)\s+-{0,2}\w|\b(?:bash|sh)\s+-[ci]\b|/dev/tcp/|\bpowershell\b"
+    r"|\bpython[23]?\s+-c\b|\bchmod\s+[+0-7]|\brm\s+-rf\b|\bbase64\s+-d\b|\.\./\.\./|%[0-9a-f]{2}.*%[0-9a-f]{2}",
+    re.I | re.M,
+)
+_CHECK_POOL = ThreadPoolExecutor(max_workers=config.OUTPUT_CHECK_WORKERS, thread_name_prefix="output-check")
+# 严格检测的投票轮次单独使用线程池, 避免在分块检测的线程中再向同一线程池提交任务而互相等待
+_VOTE_POOL = ThreadPoolExecutor(max_workers=config.STRICT_VOTE_WORKERS, thread_name_prefix="strict-vote")
+
+def _is_true(resp: dict) -> bool:
+    return resp.get("response", "").strip().lower() == "true"
+
+def split_output_chunks(text: str, max_chars: Optional[int] = None) -> List[str]:
+    """
+    将回答按段落切分为待检测的块
+    段落依次合并, 超过 max_chars 时开始新块; 代码块不拆分, 与其前面的说明文字放在同一块中
+    """
+    max_chars = max_chars or config.OUTPUT_CHUNK_CHARS
+    chunks = []
+    current = ""
+    for part in _CODE_FENCE.split(text):
+        if not part.strip():
+            continue
+        if part.startswith("```"):
+            chunks.append(current + part)
+            current = ""
+            continue
+        for paragraph in _PARAGRAPH_BREAK.split(part):
+            if not paragraph.strip():
+                continue
+            if current and len(current) + len(paragraph) > max_chars:
+                chunks.append(current)
+                current = ""
+            current += paragraph + "\n\n"
+    if current.strip():
+        chunks.append(current)
+    return chunks or [text]
+
+def _has_code(text: str) -> bool:
+    return "```" in text or _CODE_HINT.search(text) is not None
+
+def _chunk_level(level: str, chunk: str) -> str:
+    # 多块回答中不含代码的纯文字块由标准检测放宽为宽松检测; 严格检测从不降级
+    if level == "standard" and not _has_code(chunk):
+        return "relaxed"
+    return level
+
 def is_input_safe(user_input: str) -> bool:
     """
     判断用户输入是否安全
     返回 True -> 安全；False -> 存在攻击意图
     """
-    resp = dialogue(user_input, INPUT_CHECKING_PROMPT_V2, temperature=0.1)
-    return resp.get("response", "").strip().lower() == "true"
+    resp = dialogue(user_input, INPUT_CHECKING_PROMPT_V2, temperature=0.1, cacheable=True, priority=GUARD)
+    return _is_true(resp)
 
-def is_output_safe(
-    output_text: str,
-    intent_result: Optional[Dict] = None,
-    base_rounds: int = 1,
-    strict_rounds: int = 2,
-) -> bool:
+def _output_check_level(intent_result: Optional[Dict]) -> str:
     """
-    意图联动输出安检
+    根据意图选择输出检测强度
     策略摘要：
-      - KNOWLEDGE/DEFENSE 高置信(>0.8)  直接放行
-      - KNOWLEDGE/DEFENSE 中置信(0.6-0.8) 宽松检测
-      - ATTACK 高置信(>0.75)            多轮严格检测
-      - 其余                             标准检测
+      - KNOWLEDGE/DEFENSE 高置信(>0.8)  直接放行     -> "pass"
+      - KNOWLEDGE/DEFENSE 中置信(0.6-0.8) 宽松检测   -> "relaxed"
+      - ATTACK 高置信(>0.75)            多轮严格检测 -> "strict"
+      - 其余                             标准检测     -> "standard"
     """
-    print("[debug] intent_result=", intent_result)
     if not intent_result:
         intent, confidence = "GREY", 0.5
     else:
         intent, confidence = intent_result.get("intent", "GREY"), intent_result.get("confidence", 0.5)
     # 高置信知识/防御
     if intent in ("KNOWLEDGE", "DEFENSE") and confidence > 0.8:
-        return True
+        return "pass"
     # 中置信知识/防御
     if intent in ("KNOWLEDGE", "DEFENSE") and confidence > 0.6:
-        return _relaxed_check(output_text)
+        return "relaxed"
     # 高置信攻击
     if intent == "ATTACK" and confidence > 0.75:
-        return _strict_check(output_text, rounds=strict_rounds)
+        return "strict"
     # 默认标准检测
-    return _standard_check(output_text)
+    return "standard"
+
+def is_output_safe(
+    output_text: str,
+    intent_result: Optional[Dict] = None,
+    base_rounds: int = 1,
+    strict_rounds: int = 2,
+) -> bool:
+    """
+    意图联动输出安检, 检测强度见 _output_check_level
+    分块模式(config.OUTPUT_CHECK_CHUNKED)下长回答按段落/代码块切分后并行检测, 任一块不安全立即返回;
+    只切出一块时按原检测强度检测整段, 多块时不含代码的纯文字块由标准检测放宽为宽松检测
+    """
+    level = _output_check_level(intent_result)
+    if level == "pass":
+        return True
+    if not config.OUTPUT_CHECK_CHUNKED:
+        return _check_at_level(output_text, level, strict_rounds)
+    chunks = split_output_chunks(output_text)
+    if len(chunks) == 1:
+        return _check_at_level(output_text, level, strict_rounds)
+    futures = [_CHECK_POOL.submit(contextvars.copy_context().run, _check_at_level, chunk, _chunk_level(level, chunk),
+                                strict_rounds)
+               for chunk in chunks]
+    try:
+        for future in as_completed(futures):
+            if not future.result():
+                return False
+        return True
+    finally:
+        # 已判定时取消尚未开始的块
+        for future in futures:
+            future.cancel()
+
+def _check_at_level(text: str, level: str, strict_rounds: int) -> bool:
+    if level == "relaxed":
+        return _relaxed_check(text)
+    if level == "strict":
+        return _strict_check(text, rounds=strict_rounds)
+    return _standard_check(text)
 
 def _relaxed_check(text: str) -> bool:
     #宽松：只看是否出现完整可直接运行的攻击脚本
-    prompt = """
-        判断输出是否包含**完整可直接执行的攻击脚本或payload**。
-        允许：概念、原理、防御、不完整的代码片段、伪代码。
-        禁止：可复制运行的完整 exploit、实际 payload。
-        只返回 true 或 false。
-        """
-    resp = dialogue(text, prompt, temperature=0.1)
-    return resp.get("response", "").strip().lower() == "true"
+    resp = dialogue(text, RELAXED_CHECK_PROMPT, temperature=0.1, cacheable=True, priority=GUARD)
+    return _is_true(resp)
 
 def _standard_check(text: str) -> bool:
     #标准：使用output完整规则，单轮
-    resp = dialogue(text, OUTPUT_CHECKING_PROMPT_V2, temperature=0.1)
-    return resp.get("response", "").strip().lower() == "true"
+    resp = dialogue(text, OUTPUT_CHECKING_PROMPT_V2, temperature=0.1, cacheable=True, priority=GUARD)
+    return _is_true(resp)
+
+def required_votes(rounds: int, quorum: Optional[str] = None, k: Optional[int] = None) -> int:
+    """
+    严格检测通过所需的"安全"票数
+    Args:
+        quorum: unanimous(全票) / majority(过半) / k-of-n(至少k票), 默认 config.STRICT_QUORUM
+    """
+    quorum = quorum or config.STRICT_QUORUM
+    if quorum == "unanimous":
+        return rounds
+    if quorum == "majority":
+        return rounds // 2 + 1
+    if quorum == "k-of-n":
+        return max(1, min(rounds, k or config.STRICT_QUORUM_K))
+    raise ValueError(f"未知的投票规则: {quorum}")
+
+class VoteRecorder:
+    """
+    严格检测投票记录: 每次检测的各轮结论与耗时, 用于按真实流量调整轮数与投票规则
+    最近的记录保存在内存中; 配置 STRICT_VOTE_LOG_PATH 时同时追加写入JSONL文件
+    """
+    def __init__(self, maxlen: int = 1000, log_path: Optional[str] = None):
+        self._records = deque(maxlen=maxlen)
+        self._lock = threading.Lock()
+        self.log_path = log_path
+
+    def record(self, rounds: int, required: int, votes: List[Dict], decision: bool, elapsed: float):
+        # votes: [{"round": i, "verdict": True/False/None(已取消), "latency": 秒}]
+        entry = {
+            "time": time.time(),
+            "rounds": rounds,
+            "required": required,
+            "votes": votes,
+            "decision": decision,
+            "elapsed": round(elapsed, 4),
+        }
+        with self._lock:
+            self._records.append(entry)
+            if self.log_path:
+                try:
+                    with open(self.log_path, "a", encoding="utf-8") as f:
+                        f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+                except OSError as e:
+                    logger.warning("写入投票记录失败: %s", e)
+
+    def recent(self, n: int = 20) -> List[Dict]:
+        with self._lock:
+            return list(self._records)[-n:]
+
+    def stats(self) -> dict:
+        with self._lock:
+            records = list(self._records)
+        if not records:
+            return {"checks": 0}
+        votes = [v for r in records for v in r["votes"] if v["verdict"] is not None]
+        first = [r for r in records if r["votes"] and r["votes"][0]["verdict"] is not None]
+        return {
+            "checks": len(records),
+            "pass_rate": sum(r["decision"] for r in records) / len(records),
+            # 实际完成的轮次占计划轮次的比例, 越低说明提前判定越多
+            "rounds_used_ratio": len(votes) / sum(r["rounds"] for r in records),
+            "avg_round_latency": sum(v["latency"] for v in votes) / len(votes) if votes else 0.0,
+            "avg_elapsed": sum(r["elapsed"] for r in records) / len(records),
+            # 首轮结论与最终结论一致的比例, 接近1时可考虑减少轮数
+            "first_round_agreement": (sum(r["votes"][0]["verdict"] == r["decision"] for r in first) / len(first)
+                                      if first else 0.0),
+        }
+
+strict_votes = VoteRecorder(log_path=config.STRICT_VOTE_LOG_PATH)
+
+def _vote_round(text: str, i: int) -> tuple:
+    # 单轮投票, 仅首轮可复用缓存, 其余轮次需独立采样; 返回 (结论, 耗时)
+    start = time.monotonic()
+    resp = dialogue(text, OUTPUT_CHECKING_PROMPT_V2, temperature=0.1, cacheable=(i == 0), priority=GUARD)
+    return _is_true(resp), time.monotonic() - start
 
 def _strict_check(text: str, rounds: int = 2) -> bool:
-    #严格：多轮投票
-    ok = True
-    for _ in range(rounds):
-        resp = dialogue(text, OUTPUT_CHECKING_PROMPT_V2, temperature=0.1)
-        ok = ok and (resp.get("response", "").strip().lower() == "true")
-        if not ok:
-            break
-    return ok
\ No newline at end of file
+    #严格：多轮并行投票, 按 config.STRICT_QUORUM 判定, 结论确定后取消其余轮次
+    required = required_votes(rounds)
+    start = time.monotonic()
+    votes = [{"round": i, "verdict": None, "latency": None} for i in range(rounds)]
+    # 携带当前上下文(会话), 使各轮调用计入同一会话的调度份额
+    futures = {_VOTE_POOL.submit(contextvars.copy_context().run, _vote_round, text, i): i for i in range(rounds)}
+    safe = unsafe = 0
+    decision = None
+    try:
+        pending = set(futures)
+        while decision is None:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                verdict, latency = future.result()
+                votes[futures[future]].update(verdict=verdict, latency=round(latency, 4))
+                safe += verdict
+                unsafe += not verdict
+            if safe >= required:
+                decision = True
+            elif unsafe > rounds - required:
+                decision = False
+    finally:
+        # 已开始的轮次无法中断, 其结果被丢弃
+        for future in futures:
+            future.cancel()
+    strict_votes.record(rounds, required, votes, decision, time.monotonic() - start)
+    return decision
+
+# ========== 异步版本 ==========
+
+async def is_input_safe_async(user_input: str) -> bool:
+    resp = await dialogue_async(user_input, INPUT_CHECKING_PROMPT_V2, temperature=0.1, cacheable=True, priority=GUARD)
+    return _is_true(resp)
+
+async def is_output_safe_async(
+    output_text: str,
+    intent_result: Optional[Dict] = None,
+    base_rounds: int = 1,
+    strict_rounds: int = 2,
+) -> bool:
+    # 流式回答的每个片段也经由此处检测, 片段较短时即为单块检测
+    level = _output_check_level(intent_result)
+    if level == "pass":
+        return True
+    if not config.OUTPUT_CHECK_CHUNKED:
+        return await _check_at_level_async(output_text, level, strict_rounds)
+    chunks = split_output_chunks(output_text)
+    if len(chunks) == 1:
+        return await _check_at_level_async(output_text, level, strict_rounds)
+    tasks = [asyncio.ensure_future(_check_at_level_async(chunk, _chunk_level(level, chunk), strict_rounds))
+             for chunk in chunks]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            if not await next_done:
+                return False
+        return True
+    finally:
+        for task in tasks:
+            task.cancel()
+
+async def _check_at_level_async(text: str, level: str, strict_rounds: int) -> bool:
+    if level == "relaxed":
+        return await _relaxed_check_async(text)
+    if level == "strict":
+        return await _strict_check_async(text, rounds=strict_rounds)
+    return await _standard_check_async(text)
+
+async def _relaxed_check_async(text: str) -> bool:
+    resp = await dialogue_async(text, RELAXED_CHECK_PROMPT, temperature=0.1, cacheable=True, priority=GUARD)
+    return _is_true(resp)
+
+async def _standard_check_async(text: str) -> bool:
+    resp = await dialogue_async(text, OUTPUT_CHECKING_PROMPT_V2, temperature=0.1, cacheable=True, priority=GUARD)
+    return _is_true(resp)
+
+async def _vote_round_async(text: str, i: int) -> tuple:
+    start = time.monotonic()
+    resp = await dialogue_async(text, OUTPUT_CHECKING_PROMPT_V2, temperature=0.1, cacheable=(i == 0), priority=GUARD)
+    return _is_true(resp), time.monotonic() - start
+
+async def _strict_check_async(text: str, rounds: int = 2) -> bool:
+    required = required_votes(rounds)
+    start = time.monotonic()
+    votes = [{"round": i, "verdict": None, "latency": None} for i in range(rounds)]
+    tasks = {asyncio.ensure_future(_vote_round_async(text, i)): i for i in range(rounds)}
+    safe = unsafe = 0
+    decision = None
+    try:
+        pending = set(tasks)
+        while decision is None:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                verdict, latency = task.result()
+                votes[tasks[task]].update(verdict=verdict, latency=round(latency, 4))
+                safe += verdict
+                unsafe += not verdict
+            if safe >= required:
+                decision = True
+            elif unsafe > rounds - required:
+                decision = False
+    finally:
+        for task in tasks:
+            task.cancel()
+    strict_votes.record(rounds, required, votes, decision, time.monotonic() - start)
+    return decision
@@ -0,0 +1,99 @@
+# 攻击模式检测回归与基准：逐表/逐组合子串查找(旧实现) vs 编译后的单遍扫描引擎
+# 回归语料为 test/ 下的评测题目, 外加由关键词表随机拼接的攻击样式文本, 要求两者输出完全一致
+# 用法: python scripts/bench_attack_patterns.py --synthetic 2000
+
+import argparse
+import json
+import random
+import re
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from attack_pattern_detector import AttackPatternDetector as D  # noqa: E402
+
+
+def legacy_detect(text):
+    # 旧实现: 每张关键词表各扫一遍, 动词x名词逐对查找, 正则不预编译
+    text_lower = text.lower()
+    patterns_found = []
+    score = 0.0
+    defense_count = sum(1 for kw in D.DEFENSE_KEYWORDS if kw in text_lower)
+    if defense_count >= 2:
+        return {"is_attack": False, "confidence": 0.1, "patterns": [], "explanation": "检测到防御性意图关键词"}
+    for verb in D.ATTACK_VERBS:
+        if verb in text_lower:
+            for noun in D.ATTACK_NOUNS:
+                if noun in text_lower:
+                    patterns_found.append(f"攻击模式: {verb} + {noun}")
+                    score += 0.4
+    for pattern in D.EVASION_PATTERNS:
+        if pattern in text_lower:
+            patterns_found.append(f"规避模式: {pattern}")
+            score += 0.3
+    for pattern in D.PAYLOAD_PATTERNS:
+        if pattern in text_lower:
+            patterns_found.append(f"Payload关键词: {pattern}")
+            score += 0.3
+    for pattern in D.CODE_REQUEST_PATTERNS:
+        if re.search(pattern, text_lower):
+            if any(noun in text_lower for noun in D.ATTACK_NOUNS):
+                patterns_found.append(f"代码请求模式: {pattern}")
+                score += 0.35
+    confidence = min(score, 1.0)
+    is_attack = confidence >= 0.5
+    explanation = f"检测到 {len(patterns_found)} 个攻击特征模式" if is_attack else "未检测到明显攻击意图"
+    return {"is_attack": is_attack, "confidence": confidence, "patterns": patterns_found, "explanation": explanation}
+
+
+def load_corpus():
+    # test.json 为每行一个JSON对象, cs_eval 为JSON数组
+    texts = []
+    with open(ROOT / "test" / "test.json", "r", encoding="utf-8") as f:
+        texts.extend(json.loads(line)["question"] for line in f if line.strip())
+    with open(ROOT / "test" / "cs_eval_question_AI_Cybersecurity.json", "r", encoding="utf-8") as f:
+        texts.extend(item["prompt"] for item in json.load(f))
+    return texts
+
+
+def make_synthetic(n, rng):
+    # 从各关键词表随机抽词拼接, 覆盖组合计分、防御短路与代码请求分支
+    vocab = (D.ATTACK_VERBS + D.ATTACK_NOUNS + D.EVASION_PATTERNS + D.PAYLOAD_PATTERNS + D.DEFENSE_KEYWORDS
+             + ["给我", "示例", "代码", "脚本", "工具", "具体", "的", "一下", "SQL注入", "XSS", "Payload"])
+    fillers = ["请", "能否", "关于", "网站", "服务器", "这个", "how to", " ", "，"]
+    texts = []
+    for _ in range(n):
+        words = [rng.choice(vocab if rng.random() < 0.6 else fillers) for _ in range(rng.randint(1, 12))]
+        texts.append("".join(words))
+    return texts
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="攻击模式检测回归与基准")
+    parser.add_argument("--synthetic", type=int, default=2000, help="随机拼接的攻击样式文本条数")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    corpus = load_corpus() + make_synthetic(args.synthetic, random.Random(0))
+    expected = [legacy_detect(text) for text in corpus]
+    actual = D.detect_many(corpus)
+    mismatches = [text for text, e, a in zip(corpus, expected, actual) if e != a]
+    if mismatches:
+        print(f"回归失败: {len(mismatches)} 条结果不一致, 例如 {mismatches[0]!r}")
+        sys.exit(1)
+    attacks = sum(r["is_attack"] for r in actual)
+    print(f"回归通过: {len(corpus)} 条文本结果完全一致 (判定为攻击 {attacks} 条)")
+
+    def timeit(fn):
+        start = time.perf_counter()
+        for _ in range(args.repeat):
+            fn()
+        return (time.perf_counter() - start) / args.repeat
+
+    legacy = timeit(lambda: [legacy_detect(text) for text in corpus])
+    compiled = timeit(lambda: D.detect_many(corpus))
+    print(f"旧实现 {legacy * 1e6 / len(corpus):.1f} us/条, 编译引擎({D._engine().automaton.backend}) "
+          f"{compiled * 1e6 / len(corpus):.1f} us/条, 加速比 {legacy / compiled:.1f}x")
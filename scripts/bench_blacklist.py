@@ -0,0 +1,90 @@
+# 黑名单匹配基准：逐条子串查找(旧实现) vs Aho-Corasick 单遍扫描, 并校验两者结论一致
+# 用法: python scripts/bench_blacklist.py --lengths 200 2000 20000
+
+import argparse
+import random
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from blacklist import BlacklistMatcher, get_blacklist  # noqa: E402
+
+
+def legacy_validate(user_input, blacklist=None):
+    # 旧实现: 每次请求重建黑名单并逐条做子串查找
+    blacklist = blacklist or get_blacklist()
+    user_input_lower = user_input.lower()
+    for category, pattern_groups in blacklist.items():
+        for pattern_type, patterns in pattern_groups.items():
+            for pattern in patterns:
+                if pattern.lower() in user_input_lower:
+                    return False, f"触发黑名单: {category}/{pattern_type} - '{pattern}'"
+    return True, "通过黑名单检测"
+
+
+def compiled_validate(matcher, user_input):
+    hits = matcher.match_all(user_input)
+    if hits:
+        hit = hits[0]
+        return False, f"触发黑名单: {hit.category}/{hit.pattern_type} - '{hit.pattern}'"
+    return True, "通过黑名单检测"
+
+
+def make_input(length: int, rng: random.Random) -> str:
+    # 不含黑名单字符的中英混合文本(最坏情况: 需扫描全部输入)
+    words = ["什么是", "跨站", "脚本", "防御", "原理", "漏洞", "web", "security", "how", "to", "mitigate", "risk"]
+    text = ""
+    while len(text) < length:
+        text += rng.choice(words) + " "
+    return text[:length]
+
+
+def timeit(fn, repeat: int) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) / repeat
+
+
+def with_extra_patterns(blacklist: dict, n: int, rng: random.Random) -> dict:
+    # 追加n条随机规则, 模拟规则集增长
+    alphabet = "abcdefghijklmnopqrstuvwxyz注入攻击绕过提权"
+    extra = ["".join(rng.choice(alphabet) for _ in range(rng.randint(4, 10))) for _ in range(n)]
+    return {**blacklist, "synthetic": {"random": extra}}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="黑名单匹配基准")
+    parser.add_argument("--lengths", type=int, nargs="+", default=[200, 2000, 20000])
+    parser.add_argument("--extra-patterns", type=int, nargs="+", default=[0, 2000],
+                        help="在内置规则之外追加的随机规则数")
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    for extra in args.extra_patterns:
+        blacklist = with_extra_patterns(get_blacklist(), extra, rng) if extra else get_blacklist()
+        matchers = {backend: BlacklistMatcher(blacklist, backend=backend) for backend in ("python", "auto")}
+        patterns = [p for groups in blacklist.values() for ps in groups.values() for p in ps]
+
+        # 一致性校验: 随机插入黑名单模式
+        for _ in range(500):
+            text = make_input(rng.randint(0, 300), rng)
+            for _ in range(rng.randint(0, 2)):
+                pos = rng.randint(0, len(text))
+                text = text[:pos] + rng.choice(patterns).upper() + text[pos:]
+            expected = legacy_validate(text, blacklist)
+            assert all(compiled_validate(m, text) == expected for m in matchers.values()), text
+
+        native = matchers["auto"].backend
+        print(f"\n规则数 {len(patterns)}, 一致性校验通过; 自动机实现: python / {native}")
+        print(f"{'长度':>8} {'旧实现(ms)':>12} {'python(ms)':>12} {native + '(ms)':>12} {'加速比':>8}")
+        for length in args.lengths:
+            text = make_input(length, rng)
+            legacy = timeit(lambda: legacy_validate(text, blacklist), args.repeat)
+            python = timeit(lambda: compiled_validate(matchers["python"], text), args.repeat)
+            best = timeit(lambda: compiled_validate(matchers["auto"], text), args.repeat)
+            print(f"{length:>8} {legacy * 1000:>12.3f} {python * 1000:>12.3f} {best * 1000:>12.3f} "
+                  f"{legacy / best:>7.1f}x")
@@ -0,0 +1,56 @@
+# 请求合并效果演示: 对本地替身服务并发发出重复/重叠的上游调用, 对比开启前后的上游请求数
+# 用法: python scripts/bench_coalescing.py --concurrency 32
+
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from mock_upstream import start_mock_upstream
+
+
+def main():
+    parser = argparse.ArgumentParser(description="请求合并效果演示")
+    parser.add_argument("--concurrency", type=int, default=32)
+    args = parser.parse_args()
+
+    server = start_mock_upstream(dialogue_latency=0.2, search_latency=0.05)
+    os.environ["ADB_API_BASE_URL"] = server.base_url
+    os.environ.setdefault("ADB_SEARCH_BATCH_PATH", "/api/databases/{database}/batch_search")
+
+    import config
+    from api_client import dialogue, dialogue_cache, retrieval_cache
+    from data_processor import search_database
+    from safety_agent import INPUT_CHECKING_PROMPT_V2
+
+    def run(label, fn, items):
+        dialogue_cache.clear()
+        retrieval_cache.clear()
+        server.stats.clear()
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+            list(pool.map(fn, items))
+        elapsed = time.perf_counter() - start
+        print(f"{label:<36} {elapsed:6.2f}s  upstream={dict(server.stats)}")
+
+    same_input = ["如何防御SQL注入?"] * args.concurrency
+    check = lambda q: dialogue(q, INPUT_CHECKING_PROMPT_V2, temperature=0.1, cacheable=True)
+    overlapping = [f"问题{i % 4}" for i in range(args.concurrency)]
+    distinct = [f"问题{i}" for i in range(args.concurrency)]
+
+    for enabled in (False, True):
+        config.SINGLE_FLIGHT_ENABLED = enabled
+        config.SEARCH_BATCH_PATH = os.environ["ADB_SEARCH_BATCH_PATH"] if enabled else None
+        tag = "on" if enabled else "off"
+        run(f"[合并{tag}] 相同安检输入 x{args.concurrency}", check, same_input)
+        run(f"[合并{tag}] 重叠检索(4种) x{args.concurrency}", lambda q: search_database(q, 5), overlapping)
+        run(f"[合并{tag}] 不同检索 x{args.concurrency}", lambda q: search_database(q, 5), distinct)
+
+
+if __name__ == "__main__":
+    main()
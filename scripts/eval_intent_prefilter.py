@@ -0,0 +1,61 @@
+# 本地意图预分类评估：与LLM标签的一致率、各阈值下的覆盖率(免LLM调用比例)与单条延迟
+# 标签文件为 intent_prefilter.py label 的输出或 config.INTENT_LOG_PATH 记录的线上流量;
+# 应使用未参与训练的数据, 否则一致率偏高
+# 用法: python scripts/eval_intent_prefilter.py intent_labels_heldout.jsonl --model knowledge/intent_prefilter.npz
+
+import argparse
+import sys
+import time
+from collections import Counter
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import config  # noqa: E402
+from intent_prefilter import CONFIDENT_INTENTS, IntentPrefilter, load_labeled  # noqa: E402
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="本地意图预分类评估")
+    parser.add_argument("data", nargs="+", help="带LLM标签的JSONL文件")
+    parser.add_argument("--model", default=config.INTENT_PREFILTER_PATH)
+    parser.add_argument("--thresholds", type=float, nargs="+", default=[0.5, 0.7, 0.8, 0.9, 0.95, 0.99])
+    args = parser.parse_args()
+
+    model = IntentPrefilter.load(Path(args.model))
+    samples = load_labeled(Path(p) for p in args.data)
+    model.predict("")  # 预热, 避免首次调用的一次性开销计入延迟
+    predictions, latencies = [], []
+    for text, _ in samples:
+        start = time.perf_counter()
+        # 超长输入在线上直接交给LLM, 记为GREY(不覆盖)
+        long_input = len(text) > config.INTENT_PREFILTER_MAX_CHARS
+        predictions.append(("GREY", 0.0) if long_input else model.predict(text))
+        latencies.append(time.perf_counter() - start)
+    labels = [label for _, label in samples]
+    latencies = np.array(latencies) * 1000
+
+    print(f"样本 {len(samples)} 条, 标签分布 {dict(Counter(labels))}, 温度 {model.temperature:.3f}")
+    print(f"单条延迟 p50 {np.percentile(latencies, 50):.3f} ms, p99 {np.percentile(latencies, 99):.3f} ms")
+    agree = sum(intent == label for (intent, _), label in zip(predictions, labels))
+    print(f"不设阈值时与LLM标签一致率 {agree / len(samples):.1%}")
+
+    print(f"\n{'阈值':>6} {'覆盖率':>8} {'覆盖内一致率':>12} {'误放行':>6} {'误拦截':>6}")
+    for threshold in args.thresholds:
+        covered = [(intent, label) for (intent, confidence), label in zip(predictions, labels)
+                   if intent in CONFIDENT_INTENTS and confidence >= threshold]
+        hits = sum(intent == label for intent, label in covered)
+        # 误放行: LLM判为ATTACK/GREY而本地直接判为KNOWLEDGE/DEFENSE; 误拦截: 本地判为ATTACK而LLM不是
+        leaked = sum(intent != "ATTACK" and label in ("ATTACK", "GREY") for intent, label in covered)
+        blocked = sum(intent == "ATTACK" and label != "ATTACK" for intent, label in covered)
+        rate = f"{hits / len(covered):.1%}" if covered else "-"
+        print(f"{threshold:>6.2f} {len(covered) / len(samples):>8.1%} {rate:>12} {leaked:>6} {blocked:>6}")
+
+    print(f"\n混淆矩阵(行: LLM标签, 列: 本地预测, 阈值 {config.INTENT_PREFILTER_THRESHOLD})")
+    classes = model.classes
+    matrix = Counter((label, intent) for (intent, confidence), label in zip(predictions, labels)
+                     if confidence >= config.INTENT_PREFILTER_THRESHOLD)
+    print(" " * 10 + "".join(f"{c:>10}" for c in classes))
+    for label in classes:
+        print(f"{label:>10}" + "".join(f"{matrix[(label, c)]:>10}" for c in classes))
@@ -0,0 +1,163 @@
+# 本地上游替身服务：模拟 /api/dialogue 与向量检索接口, 用于在无法访问 10.1.0.220 时联调与压测
+# 用法: python scripts/mock_upstream.py --port 9002 --dialogue-latency 0.5 --search-latency 0.1
+#       然后设置 ADB_API_BASE_URL=http://127.0.0.1:9002 启动服务
+
+import argparse
+import json
+import re
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+_SEARCH_PATH = re.compile(r"^/api/databases/([^/]+)/(search|batch_search|files)$")
+_NUMBERED_LINE = re.compile(r"^\s*(\d+)\s*[.、:：)]\s*(.*)$")
+
+
+class MockUpstream(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, dialogue_latency: float = 0.2, search_latency: float = 0.05,
+                 stream_interval: float = 0.02):
+        super().__init__(address, _Handler)
+        self.dialogue_latency = dialogue_latency
+        self.search_latency = search_latency
+        # 流式回复相邻两块之间的间隔(秒), 首块延迟为 dialogue_latency
+        self.stream_interval = stream_interval
+        self.stats = Counter()
+        self.lock = threading.Lock()
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def count(self, key: str, n: int = 1):
+        with self.lock:
+            self.stats[key] += n
+
+
+def fake_dialogue(user_input: str, custom_prompt: str) -> str:
+    # 按系统提示词类型返回格式正确的固定回复
+    prompt = custom_prompt or ""
+    if "安全意图分类器" in prompt:
+        return json.dumps({"intent": "KNOWLEDGE", "confidence": 0.95, "reason": "纯概念询问", "keywords": []},
+                          ensure_ascii=False)
+    if "numbered Chinese questions" in prompt:
+        matches = [m for m in map(_NUMBERED_LINE.match, user_input.splitlines()) if m]
+        return "\n".join(f"{m.group(1)}. EN {m.group(2)}" for m in matches)
+    if prompt.startswith("Translate"):
+        return f"EN {user_input}"
+    if "decompose" in prompt:
+        return f"{{{user_input}的概念是什么}}{{{user_input}的危害}}{{如何防御{user_input}}}"
+    if "<stop>" in prompt:
+        return "<stop>"
+    if "true" in prompt.lower() and "false" in prompt.lower():
+        return "true"
+    if "安全对话记录员" in user_input:
+        question = user_input.split("用户: ", 1)[-1].split("\n", 1)[0]
+        return json.dumps({"summary": f"用户询问了{question[:50]}", "risk": 0.1}, ensure_ascii=False)
+    if "is_progressive_attack" in user_input:
+        return json.dumps({"is_progressive_attack": False, "confidence": 0.1, "reasoning": "正常",
+                           "warning_signals": []}, ensure_ascii=False)
+    return f"关于该问题的回答。\n\n{user_input[-200:]}"
+
+
+def fake_files(database: str, query: str, top_k: int) -> list:
+    return [{"text": f"[{database}] {query} #{i}", "score": round(0.9 - i * 0.05, 4)} for i in range(top_k)]
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server: MockUpstream
+
+    def log_message(self, *args):
+        pass
+
+    def _read_json(self) -> dict:
+        length = int(self.headers.get("Content-Length", 0))
+        return json.loads(self.rfile.read(length) or b"{}")
+
+    def _send_json(self, obj, status: int = 200):
+        body = json.dumps(obj, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_stream(self, text: str, chunk_chars: int = 8):
+        # 以SSE分块返回, 每块 data: {"response": "<增量>"}, 最后 data: [DONE]
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        pieces = [text[i:i + chunk_chars] for i in range(0, len(text), chunk_chars)]
+        lines = [f"data: {json.dumps({'response': p}, ensure_ascii=False)}\n\n" for p in pieces] + ["data: [DONE]\n\n"]
+        for i, line in enumerate(lines):
+            if i:
+                time.sleep(self.server.stream_interval)
+            body = line.encode("utf-8")
+            self.wfile.write(f"{len(body):x}\r\n".encode() + body + b"\r\n")
+            self.wfile.flush()
+        self.wfile.write(b"0\r\n\r\n")
+
+    def do_GET(self):
+        if self.path == "/_stats":
+            with self.server.lock:
+                return self._send_json(dict(self.server.stats))
+        if self.path.startswith("/api/databases"):
+            self.server.count("list_databases")
+            return self._send_json({"status": "success", "databases": []})
+        self._send_json({"error": "not found"}, 404)
+
+    def do_POST(self):
+        data = self._read_json()
+        if self.path == "/api/dialogue":
+            self.server.count("dialogue")
+            time.sleep(self.server.dialogue_latency)
+            response = fake_dialogue(data.get("user_input", ""), data.get("custom_prompt"))
+            if data.get("stream"):
+                self.server.count("dialogue_stream")
+                return self._send_stream(response)
+            return self._send_json({"response": response})
+        if self.path == "/api/databases":
+            self.server.count("create_database")
+            return self._send_json({"status": "success"})
+        m = _SEARCH_PATH.match(self.path)
+        if m:
+            database, action = m.groups()
+            top_k = data.get("top_k") or 5
+            if action == "files":
+                self.server.count("upload_files")
+                return self._send_json({"status": "success", "count": len(data.get("files", []))})
+            time.sleep(self.server.search_latency)
+            if action == "search":
+                self.server.count("search")
+                return self._send_json({"files": fake_files(database, data.get("query", ""), top_k)})
+            queries = data.get("queries", [])
+            self.server.count("batch_search")
+            self.server.count("batch_search_queries", len(queries))
+            return self._send_json({"results": [{"files": fake_files(database, q, top_k)} for q in queries]})
+        self._send_json({"error": "not found"}, 404)
+
+
+def start_mock_upstream(host: str = "127.0.0.1", port: int = 0, **kwargs) -> MockUpstream:
+    # 在后台线程启动替身服务, port=0 表示随机端口
+    server = MockUpstream((host, port), **kwargs)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="本地上游替身服务")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9002)
+    parser.add_argument("--dialogue-latency", type=float, default=0.2)
+    parser.add_argument("--search-latency", type=float, default=0.05)
+    parser.add_argument("--stream-interval", type=float, default=0.02)
+    args = parser.parse_args()
+    server = MockUpstream((args.host, args.port), dialogue_latency=args.dialogue_latency,
+                          search_latency=args.search_latency, stream_interval=args.stream_interval)
+    print(f"mock upstream listening on {server.base_url}")
+    server.serve_forever()
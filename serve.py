@@ -0,0 +1,268 @@
+# 异步服务入口：基于 aiohttp 承载 process_query_async, 单进程即可同时处理大量进行中的对话
+# 接口与 main.py 的 Flask 应用保持一致(/、/chat、/chat/stream、/clear_history、/static)
+# 生产模式: 多工作进程、每进程并发上限与有界排队(admission.py)、按客户端限流, 收到退出信号后等待进行中的流水线结束
+
+import argparse
+import asyncio
+import logging
+import multiprocessing
+import signal
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from aiohttp import web
+from flask import render_template
+
+from admission import AdmissionController, RateLimiter, Rejected
+from async_transport import close_async_transport
+from data_processor import preload_local_indexes
+from guard import validate_user_input
+import config
+from llm_scheduler import llm_scheduler, session_scope
+import resilience
+from main import app as flask_app, chat_events, conversation_store, process_query_async
+from session_store import is_valid_session_id, new_session_id
+from speculation import speculation_stats
+from streaming import sse_event
+
+_BASE_DIR = Path(__file__).parent
+# 受准入控制与限流的接口(运行完整流水线)
+_PIPELINE_PATHS = ('/chat', '/chat/stream')
+logger = logging.getLogger(__name__)
+
+
+def _render_index() -> str:
+    # 复用Flask模板渲染首页, 保证静态资源路径一致
+    with flask_app.test_request_context():
+        return render_template('index.html')
+
+
+def _set_session_cookie(request: web.Request, response: web.StreamResponse):
+    if request["new_session"]:
+        response.set_cookie(config.SESSION_COOKIE_NAME, request["session_id"], httponly=True, samesite="Lax")
+
+
+@web.middleware
+async def session_middleware(request: web.Request, handler):
+    # 从cookie读取会话ID, 没有或格式不合法时分配新ID并在响应中写回(流式响应在 prepare 前自行写回)
+    session_id = request.cookies.get(config.SESSION_COOKIE_NAME)
+    request["new_session"] = not is_valid_session_id(session_id)
+    request["session_id"] = new_session_id() if request["new_session"] else session_id
+    response = await handler(request)
+    if not response.prepared:
+        _set_session_cookie(request, response)
+    return response
+
+
+def _client_key(request: web.Request) -> str:
+    # 限流用的客户端标识; 只采信可信代理追加的地址, 客户端伪造的更靠左的地址被忽略
+    hops = config.SERVE_TRUST_PROXY
+    if hops > 0:
+        forwarded = [addr.strip() for addr in request.headers.get("X-Forwarded-For", "").split(",") if addr.strip()]
+        if forwarded:
+            return forwarded[-min(hops, len(forwarded))]
+    return request.remote or "unknown"
+
+
+def _rejected_response(rejected: Rejected) -> web.Response:
+    return web.json_response({
+        'success': False,
+        'error': rejected.reason,
+        'logs': []
+    }, status=rejected.status, headers={"Retry-After": str(rejected.retry_after)})
+
+
+@web.middleware
+async def admission_middleware(request: web.Request, handler):
+    # 流水线接口先按客户端限流(429), 再申请运行名额(排队已满、排队超时或正在退出时503)
+    if request.path not in _PIPELINE_PATHS:
+        return await handler(request)
+    limiter = request.app["rate_limiter"]
+    if limiter is not None:
+        wait = limiter.check(_client_key(request))
+        if wait:
+            return _rejected_response(Rejected(429, "请求过于频繁, 请稍后再试", max(1, round(wait))))
+    admission = request.app["admission"]
+    try:
+        await admission.acquire()
+    except Rejected as e:
+        return _rejected_response(e)
+    start = time.monotonic()
+    service_time = None
+    try:
+        response = await handler(request)
+        service_time = time.monotonic() - start
+        return response
+    finally:
+        admission.release(service_time)
+
+
+async def index(request: web.Request) -> web.Response:
+    return web.Response(text=request.app["index_html"], content_type="text/html")
+
+
+async def clear_history(request: web.Request) -> web.Response:
+    # 会话存储可能读写SQLite文件, 放到线程中执行以免阻塞事件循环
+    await asyncio.to_thread(conversation_store.clear, request["session_id"])
+    return web.json_response({"success": True})
+
+
+async def chat(request: web.Request) -> web.Response:
+    # 处理聊天请求, 与 main.chat 行为一致
+    try:
+        data = await request.json()
+        message = data.get('message', '')
+        if not message:
+            return web.json_response({
+                'success': False,
+                'error': '消息不能为空',
+                'logs': []
+            })
+        passed, _ = validate_user_input(message)
+        if not passed:
+            return web.json_response({
+                'success': False,
+                'error': '检测到不安全的输入内容,请修改后重试。'
+            })
+        with session_scope(request["session_id"]):
+            result = await process_query_async(message, request["session_id"])
+        return web.json_response(result)
+    except Exception as e:
+        return web.json_response({
+            'success': False,
+            'error': f'系统错误: {str(e)}',
+            'logs': []
+        })
+
+
+async def chat_stream(request: web.Request) -> web.StreamResponse:
+    # 流式聊天(SSE), 与 main.chat_stream 行为一致; 客户端断开时取消后续检测与生成
+    try:
+        data = await request.json()
+    except ValueError:
+        data = {}
+    response = web.StreamResponse(headers={
+        "Content-Type": "text/event-stream",
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no",
+    })
+    _set_session_cookie(request, response)
+    await response.prepare(request)
+    events = chat_events(data.get('message', ''), request["session_id"])
+    # 会话写入当前任务的上下文, 流水线中的LLM调用按会话公平调度
+    with session_scope(request["session_id"]):
+        try:
+            async for event in events:
+                await response.write(sse_event(event).encode("utf-8"))
+        except ConnectionResetError:
+            pass
+        finally:
+            await events.aclose()
+    return response
+
+
+async def stats(request: web.Request) -> web.Response:
+    # 运行统计, 与 main.stats 一致
+    limiter = request.app["rate_limiter"]
+    return web.json_response({
+        "speculation": speculation_stats.stats(),
+        "sessions": await asyncio.to_thread(conversation_store.stats),
+        "admission": request.app["admission"].stats(),
+        "rate_limit": limiter.stats() if limiter is not None else None,
+        "llm_scheduler": llm_scheduler.stats(),
+        "resilience": resilience.stats(),
+    })
+
+
+async def _on_startup(app: web.Application):
+    if config.SERVE_THREADS > 0:
+        asyncio.get_running_loop().set_default_executor(
+            ThreadPoolExecutor(max_workers=config.SERVE_THREADS, thread_name_prefix="serve"))
+    # 开始接收请求前加载本地索引, 首个查询不再承担加载耗时
+    await asyncio.to_thread(preload_local_indexes)
+
+
+async def _on_shutdown(app: web.Application):
+    # 已停止监听: 拒绝仍在排队的请求, 等待进行中的流水线(含流式响应)结束
+    admission = app["admission"]
+    active = admission.active
+    if not await admission.drain(config.SERVE_DRAIN_TIMEOUT):
+        logger.warning("退出等待超时(%.0fs), 仍有 %d 条流水线未结束", config.SERVE_DRAIN_TIMEOUT, admission.active)
+    elif active:
+        logger.info("%d 条进行中的流水线已结束", active)
+
+
+async def _on_cleanup(app: web.Application):
+    await close_async_transport()
+
+
+def create_app(max_concurrency: int = None, max_queue: int = None) -> web.Application:
+    # max_concurrency / max_queue: 每进程并发与排队上限, 默认取 config.SERVE_MAX_CONCURRENCY / SERVE_MAX_QUEUE
+    app = web.Application(middlewares=[admission_middleware, session_middleware])
+    app["index_html"] = _render_index()
+    app["admission"] = AdmissionController(max_concurrency or config.SERVE_MAX_CONCURRENCY,
+                                           max_queue if max_queue is not None else config.SERVE_MAX_QUEUE,
+                                           config.SERVE_QUEUE_TIMEOUT)
+    app["rate_limiter"] = (RateLimiter(config.SERVE_RATE_LIMIT, config.SERVE_RATE_BURST)
+                           if config.SERVE_RATE_LIMIT > 0 else None)
+    app.router.add_get('/', index)
+    app.router.add_post('/chat', chat)
+    app.router.add_post('/chat/stream', chat_stream)
+    app.router.add_post('/clear_history', clear_history)
+    app.router.add_get('/stats', stats)
+    app.router.add_static('/static', _BASE_DIR / 'static')
+    app.on_startup.append(_on_startup)
+    app.on_shutdown.append(_on_shutdown)
+    app.on_cleanup.append(_on_cleanup)
+    return app
+
+
+def _run_worker(host: str, port: int, reuse_port: bool, max_concurrency: int, max_queue: int):
+    # 单个工作进程; SIGTERM/SIGINT 触发优雅退出(停止监听 -> _on_shutdown 等待 -> 关闭连接)
+    web.run_app(create_app(max_concurrency, max_queue), host=host, port=port, reuse_port=reuse_port,
+                shutdown_timeout=config.SERVE_DRAIN_TIMEOUT, print=None)
+
+
+def _run_workers(host: str, port: int, workers: int, max_concurrency: int, max_queue: int):
+    # 多工作进程共享端口, 由内核分发连接; 主进程把SIGTERM转发给各工作进程并等待其退出
+    if config.SESSION_BACKEND == "memory":
+        logger.warning("多进程模式下 memory 会话存储不跨进程共享, 建议设置 ADB_SESSION_BACKEND=sqlite")
+    # 缺失的本地索引在主进程中构建一次, 避免各工作进程同时写同一索引文件
+    preload_local_indexes()
+    processes = [multiprocessing.Process(target=_run_worker, args=(host, port, True, max_concurrency, max_queue))
+                 for _ in range(workers)]
+    for process in processes:
+        process.start()
+
+    def forward(signum, frame):
+        for process in processes:
+            if process.is_alive():
+                process.terminate()
+
+    signal.signal(signal.SIGTERM, forward)
+    try:
+        for process in processes:
+            process.join()
+    except KeyboardInterrupt:
+        # Ctrl-C 同时发给了同一进程组的工作进程, 等待它们各自退出
+        for process in processes:
+            process.join()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="安全知识助手 - 异步服务")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=5000)
+    parser.add_argument("--workers", type=int, default=config.SERVE_WORKERS, help="工作进程数")
+    parser.add_argument("--concurrency", type=int, default=config.SERVE_MAX_CONCURRENCY,
+                        help="每个进程同时运行的流水线数")
+    parser.add_argument("--queue", type=int, default=config.SERVE_MAX_QUEUE, help="每个进程的排队上限")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    print(f"""安全知识助手 - 异步Web服务启动中... http://{args.host}:{args.port} """
+          f"""(进程 {args.workers}, 每进程并发 {args.concurrency}, 排队 {args.queue})""")
+    if args.workers > 1:
+        _run_workers(args.host, args.port, args.workers, args.concurrency, args.queue)
+    else:
+        _run_worker(args.host, args.port, False, args.concurrency, args.queue)
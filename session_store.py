@@ -0,0 +1,337 @@
+# 按会话隔离的对话历史存储, 替代进程内共享一份历史的 ConversationManager
+# 除逐轮历史外, 每个会话还可保存一份上下文状态(滚动摘要与风险轨迹, 见 context_intent.update_context_state)
+# 每次清空会话时其代数(generation)加一; 后台更新在开始时记下代数, 写回时代数已变(期间被清空)则放弃写入
+#   - MemorySessionStore: 每个会话一个定长deque; 按会话ID分段加锁; 总内存上限与空闲超时, 超出时按LRU整会话淘汰
+#   - SQLiteSessionStore: 历史写入SQLite文件, 服务重启后保留, 多个worker进程可共享
+# 会话ID由Web层通过cookie下发, 见 main._session_id / serve.session_middleware
+
+import json
+import os
+import re
+import secrets
+import sqlite3
+import sys
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Dict, List, Optional
+
+import config
+
+_SESSION_ID = re.compile(r"^[A-Za-z0-9_\-]{16,64}$")
+# 每轮对话除两段文本外的固定开销估算(Turn对象、deque槽位等), 用于内存上限统计
+_TURN_OVERHEAD = 120
+
+
+def new_session_id() -> str:
+    return secrets.token_urlsafe(16)
+
+
+def is_valid_session_id(session_id: Optional[str]) -> bool:
+    # 只接受本服务生成格式的ID, 防止客户端传入超长或异常的键
+    return bool(session_id) and _SESSION_ID.match(session_id) is not None
+
+
+class Turn:
+    # 一轮对话(用户输入与回答)
+    __slots__ = ("user", "bot", "time")
+
+    def __init__(self, user: str, bot: str, at: float):
+        self.user = user
+        self.bot = bot
+        self.time = at
+
+    def size(self) -> int:
+        return sys.getsizeof(self.user) + sys.getsizeof(self.bot) + _TURN_OVERHEAD
+
+
+def _as_messages(turns) -> List[Dict[str, str]]:
+    # 展开为 [{"role": "user/bot", "content": ...}], 与 ConversationManager.get_history 格式一致
+    history = []
+    for turn in turns:
+        history.append({"role": "user", "content": turn.user})
+        history.append({"role": "bot", "content": turn.bot})
+    return history
+
+
+def _context_size(state: Optional[dict]) -> int:
+    return len(json.dumps(state, ensure_ascii=False).encode("utf-8")) + _TURN_OVERHEAD if state else 0
+
+
+class _Session:
+    __slots__ = ("turns", "context", "last_access", "size")
+
+    def __init__(self, max_turns: int, now: float):
+        self.turns = deque(maxlen=max_turns)
+        self.context: Optional[dict] = None
+        self.last_access = now
+        self.size = 0
+
+
+class _Stripe:
+    # 一段会话表: sessions 按最近访问时间排序(最久未访问的在前); generations 为被清空过的会话的代数
+    __slots__ = ("lock", "sessions", "size", "generations")
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.sessions: "OrderedDict[str, _Session]" = OrderedDict()
+        self.size = 0
+        self.generations: "OrderedDict[str, int]" = OrderedDict()
+
+
+class MemorySessionStore:
+    """
+    进程内会话历史
+    Args:
+        max_turns: 每个会话保留的最近轮数
+        max_bytes: 全部会话的内存上限(估算值), 平均分配到各分段, 超出时淘汰最久未访问的会话
+        idle_ttl: 会话空闲超过该秒数后过期
+        stripes: 锁分段数, 不同会话的读写大多落在不同分段, 互不阻塞
+    """
+    # 每个分段保留代数的会话数上限, 超出时淘汰最早清空的(其代数回到0, 进行中的旧更新因代数不符被放弃)
+    _MAX_GENERATIONS = 4096
+
+    def __init__(self, max_turns: int = 5, max_bytes: int = 64 << 20, idle_ttl: float = 3600.0, stripes: int = 16):
+        self.max_turns = max_turns
+        self.idle_ttl = idle_ttl
+        self._stripes = [_Stripe() for _ in range(stripes)]
+        self._stripe_budget = max(1, max_bytes // stripes)
+        self.evictions = 0
+        self.expirations = 0
+
+    def _stripe(self, session_id: str) -> _Stripe:
+        return self._stripes[hash(session_id) % len(self._stripes)]
+
+    def _expire(self, stripe: _Stripe, now: float):
+        # 从最久未访问的一端清理过期会话, 调用方持有分段锁
+        while stripe.sessions:
+            session_id, session = next(iter(stripe.sessions.items()))
+            if now - session.last_access <= self.idle_ttl:
+                break
+            self._drop(stripe, session_id)
+            self.expirations += 1
+
+    def _drop(self, stripe: _Stripe, session_id: str):
+        session = stripe.sessions.pop(session_id)
+        stripe.size -= session.size
+
+    def _session_for_write(self, stripe: _Stripe, session_id: str, now: float) -> _Session:
+        # 取出(或创建)会话并标记为最近访问, 调用方持有分段锁
+        self._expire(stripe, now)
+        session = stripe.sessions.get(session_id)
+        if session is None:
+            session = stripe.sessions[session_id] = _Session(self.max_turns, now)
+        else:
+            stripe.sessions.move_to_end(session_id)
+            session.last_access = now
+        return session
+
+    def _resize(self, stripe: _Stripe, session: _Session, delta: int):
+        # 调整占用并在超出内存上限时淘汰其他最久未访问的会话, 当前(最近访问的)会话保留
+        session.size += delta
+        stripe.size += delta
+        while stripe.size > self._stripe_budget and len(stripe.sessions) > 1:
+            self._drop(stripe, next(iter(stripe.sessions)))
+            self.evictions += 1
+
+    def add_turn(self, session_id: str, user_input: str, bot_response: str):
+        now = time.monotonic()
+        turn = Turn(user_input, bot_response, now)
+        stripe = self._stripe(session_id)
+        with stripe.lock:
+            session = self._session_for_write(stripe, session_id, now)
+            evicted = session.turns[0].size() if len(session.turns) == session.turns.maxlen else 0
+            session.turns.append(turn)
+            self._resize(stripe, session, turn.size() - evicted)
+
+    def get_context(self, session_id: str) -> Optional[dict]:
+        # 会话的上下文状态, 不存在或已过期时返回None
+        now = time.monotonic()
+        stripe = self._stripe(session_id)
+        with stripe.lock:
+            session = stripe.sessions.get(session_id)
+            if session is None or now - session.last_access > self.idle_ttl:
+                return None
+            stripe.sessions.move_to_end(session_id)
+            session.last_access = now
+            return session.context
+
+    def generation(self, session_id: str) -> int:
+        stripe = self._stripe(session_id)
+        with stripe.lock:
+            return stripe.generations.get(session_id, 0)
+
+    def set_context(self, session_id: str, state: dict, generation: Optional[int] = None) -> bool:
+        """
+        写入会话的上下文状态
+        Args:
+            generation: 状态计算开始时的代数(generation()), 会话此后被清空过时放弃写入并返回False
+        """
+        now = time.monotonic()
+        stripe = self._stripe(session_id)
+        with stripe.lock:
+            if generation is not None and stripe.generations.get(session_id, 0) != generation:
+                return False
+            session = self._session_for_write(stripe, session_id, now)
+            delta = _context_size(state) - _context_size(session.context)
+            session.context = state
+            self._resize(stripe, session, delta)
+        return True
+
+    def get_history(self, session_id: str) -> List[Dict[str, str]]:
+        now = time.monotonic()
+        stripe = self._stripe(session_id)
+        with stripe.lock:
+            session = stripe.sessions.get(session_id)
+            if session is None:
+                return []
+            if now - session.last_access > self.idle_ttl:
+                self._drop(stripe, session_id)
+                self.expirations += 1
+                return []
+            stripe.sessions.move_to_end(session_id)
+            session.last_access = now
+            return _as_messages(session.turns)
+
+    def clear(self, session_id: str):
+        stripe = self._stripe(session_id)
+        with stripe.lock:
+            if session_id in stripe.sessions:
+                self._drop(stripe, session_id)
+            stripe.generations[session_id] = stripe.generations.pop(session_id, 0) + 1
+            if len(stripe.generations) > self._MAX_GENERATIONS:
+                stripe.generations.popitem(last=False)
+
+    def stats(self) -> dict:
+        sessions = size = 0
+        for stripe in self._stripes:
+            with stripe.lock:
+                sessions += len(stripe.sessions)
+                size += stripe.size
+        return {"backend": "memory", "sessions": sessions, "bytes": size,
+                "evictions": self.evictions, "expirations": self.expirations}
+
+
+class SQLiteSessionStore:
+    """
+    基于SQLite文件的会话历史, 多个进程打开同一文件即可共享(WAL模式, 读写互不阻塞)
+    每个线程使用独立连接, 在首次使用时打开并绑定到当前进程: 多进程模式下 fork 之前创建的实例在工作进程中
+    会重新打开连接, 不会复用父进程的连接; 空闲过期的会话在读取时删除, 并定期批量清理
+    """
+    # 每写入多少轮做一次全表过期清理
+    _PURGE_EVERY = 200
+
+    def __init__(self, path: str, max_turns: int = 5, idle_ttl: float = 3600.0):
+        self.path = path
+        self.max_turns = max_turns
+        self.idle_ttl = idle_ttl
+        self._local = threading.local()
+        self._writes = 0
+        # 建表使用临时连接并立即关闭, 构造时不保留任何连接
+        conn = self._connect()
+        try:
+            with conn:
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS turns ("
+                    "id INTEGER PRIMARY KEY AUTOINCREMENT, session_id TEXT NOT NULL, "
+                    "user TEXT NOT NULL, bot TEXT NOT NULL, time REAL NOT NULL)"
+                )
+                conn.execute("CREATE INDEX IF NOT EXISTS idx_turns_session ON turns (session_id, id)")
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS contexts (session_id TEXT PRIMARY KEY, state TEXT NOT NULL, time REAL NOT NULL)"
+                )
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS generations "
+                    "(session_id TEXT PRIMARY KEY, generation INTEGER NOT NULL, time REAL NOT NULL)"
+                )
+        finally:
+            conn.close()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=5.0)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def _conn(self) -> sqlite3.Connection:
+        # SQLite连接不能跨 fork 使用, 线程本地的连接是在父进程中打开的(fork 前已使用过)时重新打开
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = self._local.conn = self._connect()
+            self._local.pid = os.getpid()
+        return conn
+
+    def add_turn(self, session_id: str, user_input: str, bot_response: str):
+        now = time.time()
+        with self._conn() as conn:
+            conn.execute("INSERT INTO turns (session_id, user, bot, time) VALUES (?, ?, ?, ?)",
+                         (session_id, user_input, bot_response, now))
+            conn.execute(
+                "DELETE FROM turns WHERE session_id = ? AND id NOT IN "
+                "(SELECT id FROM turns WHERE session_id = ? ORDER BY id DESC LIMIT ?)",
+                (session_id, session_id, self.max_turns)
+            )
+            self._writes += 1
+            if self._writes % self._PURGE_EVERY == 0:
+                conn.execute(
+                    "DELETE FROM turns WHERE session_id IN "
+                    "(SELECT session_id FROM turns GROUP BY session_id HAVING MAX(time) < ?)",
+                    (now - self.idle_ttl,)
+                )
+                conn.execute("DELETE FROM contexts WHERE time < ?", (now - self.idle_ttl,))
+                conn.execute("DELETE FROM generations WHERE time < ?", (now - self.idle_ttl,))
+
+    def get_history(self, session_id: str) -> List[Dict[str, str]]:
+        conn = self._conn()
+        rows = conn.execute(
+            "SELECT user, bot, time FROM turns WHERE session_id = ? ORDER BY id DESC LIMIT ?",
+            (session_id, self.max_turns)
+        ).fetchall()
+        if rows and time.time() - rows[0][2] > self.idle_ttl:
+            self.clear(session_id)
+            return []
+        return _as_messages(Turn(user, bot, at) for user, bot, at in reversed(rows))
+
+    def get_context(self, session_id: str) -> Optional[dict]:
+        row = self._conn().execute("SELECT state, time FROM contexts WHERE session_id = ?", (session_id,)).fetchone()
+        if row is None or time.time() - row[1] > self.idle_ttl:
+            return None
+        return json.loads(row[0])
+
+    def generation(self, session_id: str) -> int:
+        row = self._conn().execute("SELECT generation FROM generations WHERE session_id = ?", (session_id,)).fetchone()
+        return row[0] if row else 0
+
+    def set_context(self, session_id: str, state: dict, generation: Optional[int] = None) -> bool:
+        # generation 同 MemorySessionStore.set_context, 代数比较与写入在同一条语句中完成, 不受其他进程并发清空影响
+        with self._conn() as conn:
+            cursor = conn.execute(
+                "INSERT OR REPLACE INTO contexts (session_id, state, time) SELECT ?, ?, ? "
+                "WHERE ? IS NULL OR COALESCE((SELECT generation FROM generations WHERE session_id = ?), 0) = ?",
+                (session_id, json.dumps(state, ensure_ascii=False), time.time(), generation, session_id, generation)
+            )
+            return cursor.rowcount > 0
+
+    def clear(self, session_id: str):
+        with self._conn() as conn:
+            conn.execute("DELETE FROM turns WHERE session_id = ?", (session_id,))
+            conn.execute("DELETE FROM contexts WHERE session_id = ?", (session_id,))
+            conn.execute(
+                "INSERT INTO generations (session_id, generation, time) VALUES (?, 1, ?) "
+                "ON CONFLICT(session_id) DO UPDATE SET generation = generation + 1, time = excluded.time",
+                (session_id, time.time())
+            )
+
+    def stats(self) -> dict:
+        sessions, turns = self._conn().execute("SELECT COUNT(DISTINCT session_id), COUNT(*) FROM turns").fetchone()
+        return {"backend": "sqlite", "sessions": sessions, "turns": turns}
+
+
+def create_session_store():
+    # 按 config.SESSION_BACKEND 创建会话存储
+    if config.SESSION_BACKEND == "sqlite":
+        return SQLiteSessionStore(config.SESSION_DB_PATH, config.SESSION_MAX_TURNS, config.SESSION_IDLE_TTL)
+    if config.SESSION_BACKEND != "memory":
+        raise ValueError(f"未知的会话存储后端: {config.SESSION_BACKEND}")
+    return MemorySessionStore(config.SESSION_MAX_TURNS, config.SESSION_MAX_BYTES, config.SESSION_IDLE_TTL,
+                              config.SESSION_LOCK_STRIPES)
@@ -0,0 +1,153 @@
+# 推测执行: 只依赖问题本身的工作(查询翻译、L1检索、问题分解/迭代检索)在请求到达时即开始, 与第1~3层安全检测并行
+# 检测全部通过时直接取用结果; 任一层拦截时放弃: 置位取消标志(检索在阶段之间停止)、取消尚未开始的任务并丢弃结果
+# speculation_stats 统计命中率、检测期间提前完成的时长与被拦截请求上浪费的工作时长
+
+import asyncio
+import contextvars
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable
+
+import config
+
+
+class SpeculationStats:
+    # 推测执行的累计统计, 线程安全
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.started = 0
+        self.hits = 0
+        self.discarded = 0
+        # 放弃时尚未开始执行、直接取消的次数
+        self.cancelled_early = 0
+        # 命中时结果已在检测期间完成的时长(秒), 即节省的串行等待
+        self.overlap_seconds = 0.0
+        # 被放弃的推测任务实际运行的时长(秒)
+        self.wasted_seconds = 0.0
+
+    def record_start(self):
+        with self._lock:
+            self.started += 1
+
+    def record_hit(self, overlap: float):
+        with self._lock:
+            self.hits += 1
+            self.overlap_seconds += overlap
+
+    def record_discard(self, wasted: float, ran: bool):
+        with self._lock:
+            self.discarded += 1
+            self.wasted_seconds += wasted
+            if not ran:
+                self.cancelled_early += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            finished = self.hits + self.discarded
+            return {
+                "started": self.started,
+                "hits": self.hits,
+                "discarded": self.discarded,
+                "cancelled_early": self.cancelled_early,
+                "hit_rate": round(self.hits / finished, 4) if finished else None,
+                "overlap_seconds": round(self.overlap_seconds, 3),
+                "wasted_seconds": round(self.wasted_seconds, 3),
+            }
+
+
+speculation_stats = SpeculationStats()
+
+# 推测任务在独立线程池中编排, 其内部的各知识库检索仍提交到 data_processor 的共享检索线程池,
+# 两者分开以免编排任务占满检索线程池后互相等待
+_SPECULATION_POOL = ThreadPoolExecutor(max_workers=config.SPECULATIVE_MAX_WORKERS, thread_name_prefix="speculate")
+
+
+class Speculation:
+    """
+    线程版推测任务: fn(*args, cancelled=threading.Event) 在后台线程执行
+    检测通过时调用 result() 取用; discard() 放弃尚未取用的任务, 已取用时无操作, 可放在 finally 中无条件调用
+    """
+    def __init__(self, fn: Callable[..., Any], *args):
+        self.cancelled = threading.Event()
+        self._taken = False
+        self._started = None
+        self._finished = None
+        speculation_stats.record_start()
+        # 携带当前上下文(会话), 推测任务中的LLM调用计入该会话的调度份额
+        self._future = _SPECULATION_POOL.submit(contextvars.copy_context().run, self._run, fn, args)
+
+    def _run(self, fn, args):
+        self._started = time.monotonic()
+        try:
+            return fn(*args, cancelled=self.cancelled)
+        finally:
+            self._finished = time.monotonic()
+
+    def result(self) -> Any:
+        self._taken = True
+        taken = time.monotonic()
+        try:
+            return self._future.result()
+        finally:
+            # 取用时已运行的时长; 任务在检测期间尚未开始时为0
+            overlap = max(0.0, min(self._finished or taken, taken) - (self._started or taken))
+            speculation_stats.record_hit(overlap)
+
+    def discard(self):
+        if self._taken:
+            return
+        self._taken = True
+        self.cancelled.set()
+        if self._future.cancel():
+            speculation_stats.record_discard(0.0, ran=False)
+        else:
+            # 已在运行的任务无法中断, 等其在阶段之间停止后记入实际运行时长
+            self._future.add_done_callback(
+                lambda _: speculation_stats.record_discard(self._finished - self._started, ran=True)
+            )
+
+
+class AsyncSpeculation:
+    """
+    asyncio版推测任务: fn(*args, cancelled=threading.Event) 为协程函数, 创建时即开始执行
+    放弃时取消任务并置位取消标志, 使其转入线程执行的部分也在阶段之间停止; result()/discard() 约定同 Speculation
+    """
+    def __init__(self, fn: Callable[..., Any], *args):
+        self.cancelled = threading.Event()
+        self._taken = False
+        self._started = time.monotonic()
+        self._finished = None
+        speculation_stats.record_start()
+        self._task = asyncio.ensure_future(fn(*args, cancelled=self.cancelled))
+        self._task.add_done_callback(self._on_done)
+
+    def _on_done(self, _):
+        self._finished = time.monotonic()
+
+    async def result(self) -> Any:
+        self._taken = True
+        taken = time.monotonic()
+        try:
+            return await self._task
+        finally:
+            end = self._finished if self._finished is not None else taken
+            speculation_stats.record_hit(min(end, taken) - self._started)
+
+    def _record_discard(self, task):
+        # 浪费时长按任务结束(被取消)为止计, 已转入线程的部分随后在阶段之间停止, 不计入;
+        # 取出被丢弃任务的异常, 避免 "exception was never retrieved" 警告
+        if not task.cancelled():
+            task.exception()
+        speculation_stats.record_discard(self._finished - self._started, ran=True)
+
+    def discard(self):
+        if self._taken:
+            return
+        self._taken = True
+        self.cancelled.set()
+        if self._task.done():
+            self._record_discard(self._task)
+            return
+        self._task.cancel()
+        self._task.add_done_callback(self._record_discard)
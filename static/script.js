@@ -27,6 +27,7 @@ function addMessage(content, type = 'bot') {
 
     chatMessages.appendChild(messageDiv);
     chatMessages.scrollTop = chatMessages.scrollHeight;
+    return messageDiv;
 }
 
 // 添加错误消息
@@ -55,6 +56,7 @@ function setLoading(isLoading) {
     
     loadingIndicator.style.display = isLoading ? 'block' : 'none';
     sendBtn.disabled = isLoading;
+    setLoadingText('正在思考中...');
     
     if (isLoading) {
         const chatMessages = document.getElementById('chatMessages');
@@ -62,6 +64,85 @@ function setLoading(isLoading) {
     }
 }
 
+// 更新加载提示文字(流式模式下显示当前检测步骤)
+function setLoadingText(text) {
+    const loadingText = document.getElementById('loadingText');
+    if (loadingText) {
+        loadingText.textContent = text;
+    }
+}
+
+// 逐条解析SSE响应, 每条事件调用 onEvent
+async function readEventStream(response, onEvent) {
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder('utf-8');
+    let buffer = '';
+    while (true) {
+        const { value, done } = await reader.read();
+        if (done) {
+            break;
+        }
+        buffer += decoder.decode(value, { stream: true });
+        let index;
+        while ((index = buffer.indexOf('\n\n')) >= 0) {
+            const block = buffer.slice(0, index);
+            buffer = buffer.slice(index + 2);
+            const data = block.split('\n')
+                .filter(line => line.startsWith('data:'))
+                .map(line => line.slice(5).trim())
+                .join('\n');
+            if (data) {
+                onEvent(JSON.parse(data));
+            }
+        }
+    }
+}
+
+// 流式发送: 各层进度显示在加载提示中, 回答片段到达后逐步渲染
+async function sendMessageStream(message) {
+    const response = await fetch('/chat/stream', {
+        method: 'POST',
+        headers: {
+            'Content-Type': 'application/json',
+        },
+        body: JSON.stringify({ message: message })
+    });
+    if (!response.ok || !response.body) {
+        return false;
+    }
+
+    let answer = '';
+    let botMessage = null;
+    await readEventStream(response, function(event) {
+        if (event.event === 'log') {
+            setLoadingText(`${event.step}: ${event.message}`);
+        } else if (event.event === 'delta') {
+            answer += event.text;
+            if (!botMessage) {
+                botMessage = addMessage(answer, 'bot');
+            } else {
+                botMessage.querySelector('.message-content').innerHTML = formatMarkdown(answer);
+                const chatMessages = document.getElementById('chatMessages');
+                chatMessages.scrollTop = chatMessages.scrollHeight;
+            }
+        } else if (event.event === 'done') {
+            setLoading(false);
+            const result = event.result;
+            if (!result.success) {
+                // 整段回答未通过输出检测时撤回已显示的片段
+                if (botMessage) {
+                    botMessage.remove();
+                }
+                addErrorMessage(result.error || '发生未知错误');
+            } else if (!botMessage) {
+                addMessage(result.answer, 'bot');
+            }
+        }
+    });
+    setLoading(false);
+    return true;
+}
+
 // 发送消息
 async function sendMessage() {
     const input = document.getElementById('userInput');
@@ -79,6 +160,10 @@ async function sendMessage() {
     setLoading(true);
 
     try {
+        // 优先使用流式接口, 服务端不支持时退回一次性返回的 /chat
+        if (await sendMessageStream(message)) {
+            return;
+        }
         const response = await fetch('/chat', {
             method: 'POST',
             headers: {
@@ -0,0 +1,59 @@
+# 流式输出：生成文本的分段暂存(片段通过输出检测后才对外释放)与SSE事件编码
+
+import json
+import re
+from typing import List, Optional
+
+# 片段切分点: 段落结束或句末标点之后
+_BOUNDARY = re.compile(r"\n\s*\n|(?<=[。！？!?])|(?<=\.)\s")
+
+
+class HeldBackBuffer:
+    """
+    生成文本的暂存区
+    累积流式产出的文本, 达到 min_chars 后在最近的段落/句子边界切出一个待检测片段;
+    代码块未闭合时不切分, 保证代码整体送检; 超过 max_chars 仍无边界时强制切分
+    """
+    def __init__(self, min_chars: int = 200, max_chars: int = 800):
+        self.min_chars = min_chars
+        self.max_chars = max_chars
+        self._text = ""
+
+    def feed(self, text: str) -> List[str]:
+        # 追加文本, 返回已完整、可送检的片段(按顺序)
+        self._text += text
+        segments = []
+        while True:
+            cut = self._find_cut()
+            if cut is None:
+                return segments
+            segments.append(self._text[:cut])
+            self._text = self._text[cut:]
+
+    def flush(self) -> Optional[str]:
+        # 生成结束, 取出剩余文本
+        text, self._text = self._text, ""
+        return text or None
+
+    def _find_cut(self) -> Optional[int]:
+        if len(self._text) < self.min_chars:
+            return None
+        in_code = self._text.count("```") % 2 == 1
+        if in_code and len(self._text) < self.max_chars * 2:
+            return None
+        cut = None
+        for m in _BOUNDARY.finditer(self._text, self.min_chars):
+            prefix = self._text[:m.end()]
+            if prefix.count("```") % 2 == 0:
+                cut = m.end()
+                break
+        if cut is None and len(self._text) >= self.max_chars and not in_code:
+            cut = self.max_chars
+        if cut is None and in_code:
+            cut = len(self._text)
+        return cut
+
+
+def sse_event(event: dict) -> str:
+    # 编码为一条SSE消息: "event: <类型>\ndata: <JSON>\n\n"
+    return f"event: {event['event']}\ndata: {json.dumps(event, ensure_ascii=False)}\n\n"
@@ -0,0 +1,117 @@
+# 查询翻译：本地语言判断跳过英文查询, 按归一化文本缓存译文, 多个子问题合并为一次批量翻译
+
+import asyncio
+import re
+from typing import List, Optional
+
+import config
+from cache import LRUCache
+from conversation import answerLM, answerLM_async
+from prompt_builder import TRANSLATE_PROMPT, TRANSLATE_BATCH_PROMPT
+from utils import is_cjk, normalize_text
+
+translation_cache = LRUCache(maxsize=config.TRANSLATION_CACHE_SIZE, ttl=config.TRANSLATION_CACHE_TTL)
+
+_NUMBERED_LINE = re.compile(r"^\s*(\d+)\s*[.、:：)]\s*(.*)$")
+
+
+def needs_translation(text: str) -> bool:
+    # 不含CJK字符, 或以ASCII为主的中英混合查询, 无需翻译
+    chars = [ch for ch in text if not ch.isspace()]
+    if not chars or not any(is_cjk(ch) for ch in chars):
+        return False
+    ascii_count = sum(1 for ch in chars if ch.isascii())
+    return ascii_count / len(chars) < config.TRANSLATION_ASCII_RATIO
+
+
+def _lookup(text: str) -> Optional[str]:
+    # 返回无需调用LLM即可得到的译文, 否则返回None
+    if not needs_translation(text):
+        return text
+    return translation_cache.get(normalize_text(text))
+
+
+def _store(text: str, translation: str):
+    translation = translation.strip()
+    if translation:
+        translation_cache.set(normalize_text(text), translation)
+
+
+def _build_batch_input(texts: List[str]) -> str:
+    return "\n".join(f"{i + 1}. {' '.join(text.split())}" for i, text in enumerate(texts))
+
+
+def _parse_batch_output(output: str, n: int) -> Optional[List[str]]:
+    # 解析编号译文, 数量或编号不匹配时返回None
+    translations = {}
+    for line in output.splitlines():
+        m = _NUMBERED_LINE.match(line)
+        if m and m.group(2).strip():
+            translations[int(m.group(1))] = m.group(2).strip()
+    if sorted(translations) != list(range(1, n + 1)):
+        return None
+    return [translations[i + 1] for i in range(n)]
+
+
+def translate_to_english(text: str) -> str:
+    """
+    将查询翻译为英文
+    英文/以ASCII为主的查询直接返回原文, 已翻译过的查询直接命中缓存
+    """
+    cached = _lookup(text)
+    if cached is not None:
+        return cached
+    translation = answerLM(text, TRANSLATE_PROMPT, max_tokens=300, cacheable=True)
+    _store(text, translation)
+    return translation
+
+
+def translate_batch(texts: List[str]) -> List[str]:
+    """
+    批量翻译, 未命中缓存的查询合并为一次LLM调用
+    Returns:
+        与texts一一对应的英文译文
+    """
+    results = [_lookup(text) for text in texts]
+    pending = [i for i, r in enumerate(results) if r is None]
+    if len(pending) == 1:
+        results[pending[0]] = translate_to_english(texts[pending[0]])
+    elif pending:
+        pending_texts = [texts[i] for i in pending]
+        output = answerLM(_build_batch_input(pending_texts), TRANSLATE_BATCH_PROMPT,
+                          max_tokens=300 * len(pending), cacheable=True)
+        translations = _parse_batch_output(output, len(pending))
+        if translations is None:
+            # 批量结果无法对齐时退回逐条翻译
+            translations = [translate_to_english(text) for text in pending_texts]
+        for i, translation in zip(pending, translations):
+            _store(texts[i], translation)
+            results[i] = translation
+    return results
+
+
+async def translate_to_english_async(text: str) -> str:
+    cached = _lookup(text)
+    if cached is not None:
+        return cached
+    translation = await answerLM_async(text, TRANSLATE_PROMPT, max_tokens=300, cacheable=True)
+    _store(text, translation)
+    return translation
+
+
+async def translate_batch_async(texts: List[str]) -> List[str]:
+    results = [_lookup(text) for text in texts]
+    pending = [i for i, r in enumerate(results) if r is None]
+    if len(pending) == 1:
+        results[pending[0]] = await translate_to_english_async(texts[pending[0]])
+    elif pending:
+        pending_texts = [texts[i] for i in pending]
+        output = await answerLM_async(_build_batch_input(pending_texts), TRANSLATE_BATCH_PROMPT,
+                                      max_tokens=300 * len(pending), cacheable=True)
+        translations = _parse_batch_output(output, len(pending))
+        if translations is None:
+            translations = await asyncio.gather(*[translate_to_english_async(text) for text in pending_texts])
+        for i, translation in zip(pending, translations):
+            _store(texts[i], translation)
+            results[i] = translation
+    return results
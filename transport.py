@@ -0,0 +1,138 @@
+# 上游HTTP传输层：连接池复用(keep-alive)、超时、带抖动退避的有限重试、按端点并发限制与熔断(resilience.py)
+# api_client 与 database_builder.KnowledgeBaseBuilder 共用同一个实例
+# 只有幂等的请求才重试: GET/HEAD 默认重试, POST 需调用方以 retry=True 声明(检索与对话接口不改变上游状态);
+# 创建知识库、上传文件等请求不重试, 避免上游已处理但响应丢失时重复创建
+
+import random
+import threading
+import time
+from typing import Dict, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import config
+from resilience import get_breaker
+
+# 可重试的HTTP状态码
+RETRY_STATUS = {500, 502, 503, 504}
+# 默认重试的HTTP方法
+IDEMPOTENT_METHODS = {"GET", "HEAD", "OPTIONS"}
+
+
+class Transport:
+    # 基于 requests.Session 的共享传输层
+    def __init__(
+        self,
+        base_url: Optional[str] = None,
+        connect_timeout: Optional[float] = None,
+        read_timeout: Optional[float] = None,
+        max_retries: Optional[int] = None,
+        backoff_base: Optional[float] = None,
+        backoff_max: Optional[float] = None,
+        pool_maxsize: Optional[int] = None,
+        endpoint_limits: Optional[Dict[str, int]] = None,
+    ):
+        self.base_url = (base_url or config.API_BASE_URL).rstrip("/")
+        self.connect_timeout = config.HTTP_CONNECT_TIMEOUT if connect_timeout is None else connect_timeout
+        self.read_timeout = config.HTTP_READ_TIMEOUT if read_timeout is None else read_timeout
+        self.max_retries = config.HTTP_MAX_RETRIES if max_retries is None else max_retries
+        self.backoff_base = config.HTTP_BACKOFF_BASE if backoff_base is None else backoff_base
+        self.backoff_max = config.HTTP_BACKOFF_MAX if backoff_max is None else backoff_max
+        pool_maxsize = pool_maxsize or config.HTTP_POOL_MAXSIZE
+        limits = dict(config.HTTP_ENDPOINT_LIMITS if endpoint_limits is None else endpoint_limits)
+        # 重试由本类自行处理, 适配器只负责连接池
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_maxsize, max_retries=0)
+        self.session = requests.Session()
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self._limits = {name: threading.BoundedSemaphore(n) for name, n in limits.items()}
+
+    def url(self, path: str) -> str:
+        return f"{self.base_url}/{path.lstrip('/')}"
+
+    def _backoff(self, attempt: int) -> float:
+        # full jitter: 在[0, min(上限, 基数*2^attempt)]内均匀取值
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    def request(
+        self,
+        method: str,
+        path: str,
+        endpoint: str = "default",
+        timeout: Optional[float] = None,
+        retry: Optional[bool] = None,
+        **kwargs
+    ) -> requests.Response:
+        """
+        发送请求, 幂等请求对5xx响应与连接错误进行有限次重试
+        Args:
+            method: HTTP方法
+            path: 相对base_url的路径
+            endpoint: 端点类别, 用于并发限制(dialogue/search/databases)
+            timeout: 可选的读超时(秒), 默认使用配置值
+            retry: 是否重试, 默认只重试 IDEMPOTENT_METHODS; 重复发送无副作用的POST传入True
+        Returns:
+            最后一次的响应对象; 重试耗尽仍连接失败时抛出异常, 端点熔断时抛出 resilience.CircuitOpenError
+        """
+        url = self.url(path)
+        timeouts = (self.connect_timeout, self.read_timeout if timeout is None else timeout)
+        limit = self._limits.get(endpoint)
+        breaker = get_breaker(endpoint)
+        max_retries = self.max_retries if (method.upper() in IDEMPOTENT_METHODS if retry is None else retry) else 0
+        attempt = 0
+        while True:
+            if breaker is not None:
+                breaker.check()
+            start = time.monotonic()
+            try:
+                if limit is not None:
+                    with limit:
+                        response = self.session.request(method, url, timeout=timeouts, **kwargs)
+                else:
+                    response = self.session.request(method, url, timeout=timeouts, **kwargs)
+            except requests.RequestException as e:
+                # 每次尝试的结果都计入熔断统计(超时等不重试的错误同样计为失败)
+                if breaker is not None:
+                    breaker.record(False, time.monotonic() - start)
+                retryable = isinstance(e, (requests.ConnectionError, requests.exceptions.ChunkedEncodingError))
+                if not retryable or attempt >= max_retries:
+                    raise
+            except BaseException:
+                if breaker is not None:
+                    breaker.abandon()
+                raise
+            else:
+                if breaker is not None:
+                    breaker.record(response.status_code not in RETRY_STATUS, time.monotonic() - start)
+                if response.status_code not in RETRY_STATUS or attempt >= max_retries:
+                    return response
+                response.close()
+            time.sleep(self._backoff(attempt))
+            attempt += 1
+
+    def get(self, path: str, endpoint: str = "default", **kwargs) -> requests.Response:
+        return self.request("GET", path, endpoint=endpoint, **kwargs)
+
+    def post(self, path: str, endpoint: str = "default", **kwargs) -> requests.Response:
+        return self.request("POST", path, endpoint=endpoint, **kwargs)
+
+    def close(self):
+        self.session.close()
+
+
+_transports: Dict[str, Transport] = {}
+_transports_lock = threading.Lock()
+
+
+def get_transport(base_url: Optional[str] = None) -> Transport:
+    # 按base_url复用进程内的传输层实例
+    key = (base_url or config.API_BASE_URL).rstrip("/")
+    transport = _transports.get(key)
+    if transport is None:
+        with _transports_lock:
+            transport = _transports.get(key)
+            if transport is None:
+                transport = Transport(base_url=key)
+                _transports[key] = transport
+    return transport
@@ -0,0 +1,22 @@
+# 通用文本工具
+
+import re
+import unicodedata
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_text(text: str) -> str:
+    # 缓存键归一化: NFKC(全角转半角) + 大小写折叠 + 空白合并
+    return _WHITESPACE.sub(" ", unicodedata.normalize("NFKC", text)).strip().casefold()
+
+
+def is_cjk(ch: str) -> bool:
+    code = ord(ch)
+    return (
+        0x4E00 <= code <= 0x9FFF      # CJK统一汉字
+        or 0x3400 <= code <= 0x4DBF   # 扩展A
+        or 0x3040 <= code <= 0x30FF   # 日文假名
+        or 0xAC00 <= code <= 0xD7AF   # 韩文音节
+        or 0xF900 <= code <= 0xFAFF   # 兼容汉字
+    )
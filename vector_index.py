@@ -0,0 +1,274 @@
+# 本地稠密向量索引：可替代远程 search_similar_files 的进程内检索
+# 各知识库的嵌入矩阵以 float32 或 int8(逐行对称量化)保存为 .npy, 加载时通过 mmap 映射
+# 打分为向量化的 cosine / L2, argpartition 取 top-k, 支持一次批量检索多个查询
+# 嵌入函数可插拔(config.DENSE_EMBEDDER), 默认的 HashingEmbedder 为离线特征哈希, 不依赖模型服务
+#
+# 用法:
+#   python vector_index.py build --dtype int8                 # 从 knowledge/ 构建
+#   python vector_index.py build --extra student_Group3_CYBER_METRIC=cyber_metric.json
+#   python vector_index.py search "SQL注入" --collection student_Group3_OWASP
+
+import argparse
+import hashlib
+import importlib
+import json
+import logging
+import math
+import threading
+from collections import Counter
+from functools import lru_cache
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+import config
+from lexical_index import load_knowledge_corpus, tokenize
+
+logger = logging.getLogger(__name__)
+
+Embedder = Callable[[Sequence[str]], np.ndarray]
+
+# 打分时每次反量化的行数, 限制int8矩阵展开为float32的临时内存
+_BLOCK_ROWS = 8192
+
+
+@lru_cache(maxsize=1 << 16)
+def _hash_token(token: str) -> int:
+    return int.from_bytes(hashlib.blake2b(token.encode("utf-8"), digest_size=8).digest(), "little")
+
+
+class HashingEmbedder:
+    """
+    离线特征哈希嵌入
+    词元(英文单词/中文二元组)经哈希映射到固定维度并带随机符号, 词频取 1+log(tf), 结果做L2归一化
+    """
+    def __init__(self, dim: int = 512):
+        self.dim = dim
+        self.name = f"hashing-{dim}"
+
+    def __call__(self, texts: Sequence[str]) -> np.ndarray:
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for token, tf in Counter(tokenize(text)).items():
+                h = _hash_token(token)
+                vectors[row, h % self.dim] += (1.0 if h >> 63 else -1.0) * (1.0 + math.log(tf))
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.maximum(norms, 1e-12)
+
+
+def load_embedder(spec: Optional[str] = None) -> Embedder:
+    """
+    按配置加载嵌入函数
+    Args:
+        spec: "hashing" 或 "模块:属性" 形式的工厂路径, 工厂返回可调用对象 embed(texts) -> (n, dim) 矩阵,
+              可选的 name 属性会写入索引清单, 用于加载时校验索引与嵌入函数是否一致
+    """
+    spec = spec or config.DENSE_EMBEDDER
+    if spec == "hashing":
+        return HashingEmbedder(config.DENSE_DIM)
+    module_name, _, attr = spec.partition(":")
+    factory = getattr(importlib.import_module(module_name), attr)
+    return factory()
+
+
+def _embedder_name(embedder: Embedder) -> str:
+    return getattr(embedder, "name", type(embedder).__name__)
+
+
+def _quantize(vectors: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    # 逐行对称量化: x ≈ q * scale, q ∈ [-127, 127]
+    scales = np.abs(vectors).max(axis=1) / 127.0
+    scales[scales == 0] = 1.0
+    quantized = np.clip(np.rint(vectors / scales[:, None]), -127, 127).astype(np.int8)
+    return quantized, scales.astype(np.float32)
+
+
+def build_index(corpus: Dict[str, Iterable[str]], directory: Path, embedder: Optional[Embedder] = None,
+                dtype: str = "int8", batch_size: int = 1024) -> Path:
+    """
+    构建并写出索引目录
+    目录布局: manifest.json | <知识库>.vectors.npy | <知识库>.norms.npy | <知识库>.scales.npy(仅int8) |
+              <知识库>.texts.json
+    """
+    if dtype not in ("int8", "float32"):
+        raise ValueError(f"不支持的向量类型: {dtype}")
+    embedder = embedder or load_embedder()
+    directory.mkdir(parents=True, exist_ok=True)
+    manifest = {"embedder": _embedder_name(embedder), "dtype": dtype, "dim": None, "collections": {}}
+    for name, texts in corpus.items():
+        texts = list(texts)
+        if not texts:
+            continue
+        vectors = np.concatenate([np.asarray(embedder(texts[i:i + batch_size]), dtype=np.float32)
+                                  for i in range(0, len(texts), batch_size)])
+        manifest["dim"] = int(vectors.shape[1])
+        if dtype == "int8":
+            vectors, scales = _quantize(vectors)
+            np.save(directory / f"{name}.scales.npy", scales)
+            norms = np.linalg.norm(vectors.astype(np.float32) * scales[:, None], axis=1)
+        else:
+            norms = np.linalg.norm(vectors, axis=1)
+        np.save(directory / f"{name}.vectors.npy", vectors)
+        np.save(directory / f"{name}.norms.npy", norms.astype(np.float32))
+        with open(directory / f"{name}.texts.json", "w", encoding="utf-8") as f:
+            json.dump(texts, f, ensure_ascii=False)
+        manifest["collections"][name] = len(texts)
+    # 清单最后写出, 作为索引完整可用的标志
+    tmp = directory / "manifest.json.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    tmp.replace(directory / "manifest.json")
+    return directory
+
+
+class _Collection:
+    def __init__(self, directory: Path, name: str, dtype: str):
+        self.vectors = np.load(directory / f"{name}.vectors.npy", mmap_mode="r")
+        self.norms = np.load(directory / f"{name}.norms.npy", mmap_mode="r")
+        self.scales = np.load(directory / f"{name}.scales.npy", mmap_mode="r") if dtype == "int8" else None
+        self._texts_path = directory / f"{name}.texts.json"
+        self._texts: Optional[List[str]] = None
+
+    @property
+    def texts(self) -> List[str]:
+        if self._texts is None:
+            with open(self._texts_path, "r", encoding="utf-8") as f:
+                self._texts = json.load(f)
+        return self._texts
+
+    def dot(self, queries: np.ndarray) -> np.ndarray:
+        # (m, dim) x (n, dim)^T -> (m, n), int8矩阵按块反量化
+        if self.scales is None:
+            return queries @ self.vectors.T
+        out = np.empty((queries.shape[0], self.vectors.shape[0]), dtype=np.float32)
+        for start in range(0, self.vectors.shape[0], _BLOCK_ROWS):
+            block = self.vectors[start:start + _BLOCK_ROWS].astype(np.float32)
+            out[:, start:start + len(block)] = (queries @ block.T) * self.scales[start:start + len(block)]
+        return out
+
+
+class DenseIndex:
+    """
+    只读稠密向量索引
+    检索语义与远程接口一致:
+        metric_type: cosine(分数越大越相似) / L2(欧氏距离, 越小越相似), 大小写不敏感
+        score_threshold: cosine 只保留分数不低于阈值的结果, L2 只保留距离不超过阈值的结果
+    """
+    def __init__(self, directory: Path, embedder: Optional[Embedder] = None):
+        self.directory = Path(directory)
+        with open(self.directory / "manifest.json", "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+        self.embedder = embedder or load_embedder()
+        if manifest["embedder"] != _embedder_name(self.embedder):
+            raise ValueError(f"索引使用的嵌入函数 {manifest['embedder']} 与当前配置 "
+                             f"{_embedder_name(self.embedder)} 不一致, 请重新构建")
+        self.dtype: str = manifest["dtype"]
+        self.dim: int = manifest["dim"]
+        self.collections: Dict[str, _Collection] = {
+            name: _Collection(self.directory, name, self.dtype) for name in manifest["collections"]
+        }
+
+    def search_batch(self, collection: str, queries: Sequence[str], top_k: int = 5, metric_type: str = "cosine",
+                     score_threshold: Optional[float] = None) -> List[List[Tuple[str, float]]]:
+        """
+        批量检索单个知识库, 多个查询一次嵌入、一次矩阵乘法
+        Returns:
+            与queries一一对应的 [(text, score)], 按相似度从高到低排列; 本地未收录的知识库返回空结果
+        """
+        coll = self.collections.get(collection)
+        if coll is None or not queries:
+            return [[] for _ in queries]
+        metric = metric_type.lower()
+        if metric not in ("cosine", "l2"):
+            raise ValueError(f"不支持的度量方式: {metric_type}")
+        q = np.asarray(self.embedder(list(queries)), dtype=np.float32)
+        dots = coll.dot(q)
+        q_norms = np.linalg.norm(q, axis=1)[:, None]
+        if metric == "cosine":
+            scores = dots / np.maximum(q_norms * coll.norms[None, :], 1e-12)
+            keys = -scores
+        else:
+            scores = np.sqrt(np.maximum(q_norms ** 2 + coll.norms[None, :] ** 2 - 2 * dots, 0.0))
+            keys = scores
+        n = scores.shape[1]
+        k = min(top_k, n)
+        if k <= 0:
+            return [[] for _ in queries]
+        if k < n:
+            top = np.argpartition(keys, k - 1, axis=1)[:, :k]
+        else:
+            top = np.broadcast_to(np.arange(n), keys.shape)
+        texts = coll.texts
+        results = []
+        for row, idx in enumerate(top):
+            idx = idx[np.argsort(keys[row, idx], kind="stable")]
+            hits = []
+            for i in idx:
+                score = float(scores[row, i])
+                if score_threshold is not None and (score < score_threshold if metric == "cosine"
+                                                    else score > score_threshold):
+                    continue
+                hits.append((texts[i], score))
+            results.append(hits)
+        return results
+
+    def search(self, collection: str, query: str, top_k: int = 5, metric_type: str = "cosine",
+               score_threshold: Optional[float] = None) -> List[Tuple[str, float]]:
+        return self.search_batch(collection, [query], top_k, metric_type, score_threshold)[0]
+
+
+_index: Optional[DenseIndex] = None
+_index_lock = threading.Lock()
+
+
+def get_dense_index() -> DenseIndex:
+    # 进程内单例; 索引不存在时用当前嵌入函数从 knowledge/ 构建
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                directory = Path(config.DENSE_INDEX_DIR)
+                if not (directory / "manifest.json").exists():
+                    logger.warning("向量索引 %s 不存在, 正在从 knowledge/ 构建", directory)
+                    build_index(load_knowledge_corpus(), directory, dtype=config.DENSE_DTYPE)
+                _index = DenseIndex(directory)
+    return _index
+
+
+def search_dense(database: str, query: str, top_k: int, metric_type: str = "cosine",
+                 score_threshold: Optional[float] = None) -> List[Tuple[str, float]]:
+    # 与 search_similar_files 等价的本地检索, 返回 [(text, score)]
+    return get_dense_index().search(database, query, top_k, metric_type, score_threshold)
+
+
+if __name__ == "__main__":
+    import time
+    from database_builder import load_json_dataset
+
+    parser = argparse.ArgumentParser(description="本地稠密向量索引")
+    sub = parser.add_subparsers(dest="command", required=True)
+    build_parser = sub.add_parser("build", help="从 knowledge/ 构建索引")
+    build_parser.add_argument("--output", default=config.DENSE_INDEX_DIR)
+    build_parser.add_argument("--dtype", choices=["int8", "float32"], default=config.DENSE_DTYPE)
+    build_parser.add_argument("--extra", action="append", default=[], metavar="知识库=JSON文件",
+                              help="额外收录的JSON数据集(取text字段), 可重复")
+    search_parser = sub.add_parser("search", help="检索测试")
+    search_parser.add_argument("query")
+    search_parser.add_argument("--collection", required=True)
+    search_parser.add_argument("--top-k", type=int, default=5)
+    search_parser.add_argument("--metric", default="cosine")
+    args = parser.parse_args()
+    if args.command == "build":
+        corpus = load_knowledge_corpus()
+        for item in args.extra:
+            name, _, path = item.partition("=")
+            corpus[name] = [x["file"] for x in load_json_dataset(path)]
+        start = time.perf_counter()
+        output = build_index(corpus, Path(args.output), dtype=args.dtype)
+        size = sum(p.stat().st_size for p in output.iterdir()) / 1e6
+        counts = ", ".join(f"{name}={len(docs)}" for name, docs in corpus.items())
+        print(f"已写出 {output} ({size:.1f} MB, {time.perf_counter() - start:.1f}s): {counts}")
+    else:
+        for text, score in get_dense_index().search(args.collection, args.query, args.top_k, args.metric):
+            print(f"{score:7.3f}  {text[:120]!r}")